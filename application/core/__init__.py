@@ -1 +1,31 @@
-from .note import Note
\ No newline at end of file
+from importlib import import_module
+
+from .note import Note, Tag
+
+# Everything else brings in numpy, sqlite3, asyncio or Pillow, so it is imported on first use (PEP 562)
+_LAZY = {
+    "Project": ".project",
+    "load_project": ".project",
+    "TagRegistry": ".tags",
+    "TagFilter": ".tags",
+    "has": ".tags",
+    "tag_filter": ".tags",
+    "bulk_import": ".bulk_import",
+    "ImportProgress": ".bulk_import",
+    "load_project_async": ".async_io",
+    "save_project_async": ".async_io",
+    "iter_project_load": ".async_io",
+}
+
+__all__ = ["Note", "Tag", *_LAZY]
+
+def __getattr__(name: str):
+    module = _LAZY.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
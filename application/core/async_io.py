@@ -0,0 +1,136 @@
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+import asyncio
+import json
+import threading
+
+from application.utils.async_loader import AsyncLoader, VISIBLE
+from .note import Note
+from .project import Project, load_project
+from .storage import HAS_PARENT, ProjectStore, is_project_file
+
+def _run(loader: Optional[AsyncLoader], func, *args, priority: int = VISIBLE) -> asyncio.Future:
+    if loader is not None:
+        return loader.submit(func, *args, priority=priority)
+    return asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+async def load_project_async(file_path: str, lazy: bool = False, loader: Optional[AsyncLoader] = None,
+                             priority: int = VISIBLE) -> Project:
+    """load_project on an I/O thread, so the event loop keeps running meanwhile."""
+    return await _run(loader, load_project, file_path, lazy, priority=priority)
+
+async def save_project_async(project: Project, path: Optional[str] = None, full: bool = False,
+                             loader: Optional[AsyncLoader] = None, priority: int = VISIBLE):
+    """Project.save on an I/O thread. The project must not be edited until this returns."""
+    await _run(loader, project.save, path, full, priority=priority)
+
+class LoadProgress:
+    """How far a progressive load has come, in pages and notes."""
+
+    def __init__(self, pages: int, notes: int):
+        self.pages = pages
+        self.notes = notes
+        self.pages_loaded = 0
+        self.notes_loaded = 0
+
+    def __repr__(self):
+        return f"LoadProgress(pages={self.pages_loaded}/{self.pages}, notes={self.notes_loaded}/{self.notes})"
+
+    @property
+    def done(self) -> bool:
+        return self.pages_loaded == self.pages
+
+async def iter_project_load(file_path: str, pages_per_batch: int = 4, loader: Optional[AsyncLoader] = None,
+                            priority: int = VISIBLE) -> AsyncIterator[Tuple[Project, LoadProgress]]:
+    """Load a binary project file progressively, yielding the same Project as it fills in.
+
+    The first yield has the settings and map elements but no notes; each following one
+    adds the notes of up to pages_per_batch pages, linked to the parents and children
+    loaded so far in their saved order, and kept in any index already built. Pages are
+    read on an I/O thread, while the project is only changed on the event loop between
+    yields, so the UI can draw it at any point. The project gets its path, and counts as
+    saved, only once every page is in; stopping the iteration early stops the reading.
+    """
+    if not is_project_file(file_path):
+        raise ValueError(f"{file_path} is not a binary project file.")
+    loop = asyncio.get_running_loop()
+    batches: asyncio.Queue = asyncio.Queue()
+    stop = threading.Event()
+    finished = object()
+
+    def put(item):
+        loop.call_soon_threadsafe(batches.put_nowait, item)
+
+    def read():
+        try:
+            with ProjectStore(file_path) as store:
+                meta = store.read_meta()
+                headers = store.read_headers()
+                tags = store.read_tags()
+                put((meta, store.read_settings(meta), store.read_map_elements(), headers, tags))
+                batch: List[Note] = []
+                for count, notes in enumerate(store.iter_note_pages(headers, tags), 1):
+                    if stop.is_set():
+                        return
+                    batch.extend(notes)
+                    if count % pages_per_batch == 0:
+                        put((count, batch))
+                        batch = []
+                if batch or not headers:
+                    put((len(headers), batch))
+        except BaseException as error:
+            put(error)
+        finally:
+            put(finished)
+
+    reading = _run(loader, read, priority=priority)
+    try:
+        item = await batches.get()
+        if isinstance(item, BaseException):
+            raise item
+        meta, settings, map_elements, headers, tags = item
+        project = Project(json.loads(meta["id"]), meta["name"], settings, map_elements, {}, tags=tags)
+        families, parents = _families(headers)
+        progress = LoadProgress(len(headers), sum(len(page) for page in headers.values()))
+        yield project, progress
+
+        while True:
+            item = await batches.get()
+            if item is finished:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            progress.pages_loaded, notes = item
+            project.add_notes(notes)
+            _link_loaded(project.notes, notes, families, parents)
+            progress.notes_loaded += len(notes)
+            if progress.done:
+                project.path = file_path
+                project.mark_clean(file_path)
+            yield project, progress
+    finally:
+        stop.set()
+        if not reading.done():
+            reading.cancel()
+
+def _families(headers: Dict[int, List[tuple]]) -> Tuple[Dict[int, List[int]], Dict[int, int]]:
+    """Children of every parent in sibling order, and the parent of every child."""
+    members: Dict[int, List[Tuple[int, int]]] = {}
+    parents: Dict[int, int] = {}
+    for page in headers.values():
+        for header in page:
+            if header[12] & HAS_PARENT:
+                members.setdefault(header[1], []).append((header[2], header[0]))
+                parents[header[0]] = header[1]
+    return {parent_id: [child_id for _, child_id in sorted(children)] for parent_id, children in members.items()}, parents
+
+def _link_loaded(loaded: Dict[int, Note], notes: List[Note], families: Dict[int, List[int]], parents: Dict[int, int]):
+    """Relink the families that gained members in this batch, keeping sibling order."""
+    touched = {note.id for note in notes}
+    touched.update(parents[note.id] for note in notes if note.id in parents)
+    for parent_id in touched:
+        parent = loaded.get(parent_id)
+        if parent is None or parent_id not in families:
+            continue
+        parent.children = [loaded[child_id] for child_id in families[parent_id] if child_id in loaded]
+        for child in parent.children:
+            child.parent = parent
@@ -0,0 +1,264 @@
+from collections import ChainMap
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, MutableMapping, Optional, Set, Tuple, Union
+import os
+import time
+
+from PIL import Image
+
+from application.utils import Location, Timerange, Description, LegendsImage
+from .note import Note, Tag, _flatten_records, _link_records
+
+def read_image_header(path: str) -> Tuple[int, int]:
+    """Width and height of an image file, parsing only its header."""
+    with Image.open(path) as header:
+        return header.size
+
+def _read_headers(paths: List[str]) -> List[Union[Tuple[int, int, str], str]]:
+    """(width, height, file type) of a batch of images, or the error of each file that could not be read.
+
+    Runs in a worker.
+    """
+    headers = []
+    for path in paths:
+        try:
+            width, height = read_image_header(path)
+        except OSError as error:
+            headers.append(str(error))
+        else:
+            headers.append((width, height, os.path.splitext(path)[1].lower().strip('.')))
+    return headers
+
+def _unsized_paths(data: dict) -> List[str]:
+    """Paths of a record's images that still need their size read; none for a malformed record."""
+    try:
+        images = [data["thumbnail"]] if data.get("thumbnail") else []
+        images.extend(data.get("attached_images") or [])
+        return [image["image_path"] for image in images if image.get("width") is None or image.get("height") is None]
+    except (AttributeError, KeyError, TypeError):
+        # The record is reported when it is validated
+        return []
+
+class ImportProgress:
+    """Counts and throughput of a bulk import, passed to the progress callback after each batch."""
+
+    def __init__(self, total: int):
+        self.total = total
+        self.done = 0
+        self.notes = 0
+        self.images = 0
+        self.elapsed = 0.0
+        # (record id, reason) of every record that was skipped
+        self.errors: List[Tuple[Optional[int], str]] = []
+
+    def __repr__(self):
+        return (f"ImportProgress(done={self.done}/{self.total}, notes={self.notes}, images={self.images}, "
+                f"errors={len(self.errors)}, notes_per_second={self.notes_per_second:.0f})")
+
+    @property
+    def notes_per_second(self) -> float:
+        return self.notes / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def images_per_second(self) -> float:
+        return self.images / self.elapsed if self.elapsed else 0.0
+
+def bulk_import(project, records: Iterable[dict], parent: Optional[Note] = None, workers: Optional[int] = None,
+                batch_size: int = 256, processes: bool = False,
+                progress: Optional[Callable[[ImportProgress], None]] = None) -> ImportProgress:
+    """Import note records (the flat or nested Note.to_dict format) into a project.
+
+    Image headers are read in a thread pool, or a process pool with processes, ahead of
+    the batch being validated; images whose record already holds their size are not
+    opened. Records that fail validation or reference unreadable images are skipped and
+    listed in the returned progress, and so is every record below a skipped one, rather
+    than moving it elsewhere in the hierarchy. The valid notes are linked to each other,
+    to the existing notes their parent_id names, and otherwise under parent (or as
+    roots), then added to the project and its indexes in one pass.
+    """
+    begin = time.perf_counter()
+    records = list(records)
+    malformed = [data for data in records if not isinstance(data, dict)]
+    records = _flatten_records(data for data in records if isinstance(data, dict))
+    report = ImportProgress(len(records) + len(malformed))
+    report.errors.extend((None, f"Note records must be dictionaries, not {type(data).__name__}.") for data in malformed)
+    report.done = len(malformed)
+    # New tags are registered by add_notes, and only for notes that made it in
+    tags: MutableMapping[int, Tag] = ChainMap({}, project.tags)
+    images = _ImageBuilder()
+    engine = project.calendar_engine
+    registry: Dict[int, Note] = {}
+    valid: List[dict] = []
+    rejected: Set[int] = set()
+
+    batches = [records[i:i + batch_size] for i in range(0, len(records), batch_size)]
+    batch_paths = [sorted({path for data in batch for path in _unsized_paths(data) if isinstance(path, str)})
+                   for batch in batches]
+    executor = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    with executor(max_workers=workers) as pool:
+        # Every batch's headers are requested up front, so workers read ahead of validation
+        futures = [pool.submit(_read_headers, paths) if paths else None for paths in batch_paths]
+        for batch, paths, future in zip(batches, batch_paths, futures):
+            if future is not None:
+                images.headers.update(zip(paths, future.result()))
+            for data in batch:
+                try:
+                    note = _build_note(data, images, tags, engine)
+                    if note.id in registry or note.id in project.notes:
+                        raise ValueError(f"Note {note.id} already exists.")
+                except (AttributeError, KeyError, TypeError, ValueError) as error:
+                    report.errors.append((data.get("id"), str(error)))
+                    # A duplicate of a note that exists stays a valid parent for the records naming it
+                    note_id = data.get("id")
+                    if isinstance(note_id, int) and note_id not in registry and note_id not in project.notes:
+                        rejected.add(note_id)
+                    continue
+                registry[note.id] = note
+                valid.append(data)
+                report.images += (note.thumbnail is not None) + len(note.attached_images)
+            report.done += len(batch)
+            report.notes = len(registry)
+            report.elapsed = time.perf_counter() - begin
+            if progress is not None:
+                progress(report)
+
+    if rejected:
+        orphans = _orphans(records, registry, rejected)
+        for data in valid:
+            ancestor = orphans.get(data["id"])
+            if ancestor is not None:
+                note = registry.pop(data["id"])
+                report.images -= (note.thumbnail is not None) + len(note.attached_images)
+                report.errors.append((data["id"], f"Parent note {ancestor} was not imported."))
+        valid = [data for data in valid if data["id"] in registry]
+        report.notes = len(registry)
+
+    parent_ids = {data["id"]: data.get("parent_id") for data in valid}
+    for root in _link_records(valid, registry):
+        parent_id = parent_ids[root.id]
+        new_parent = project.notes.get(parent_id) if parent_id is not None else None
+        new_parent = new_parent if new_parent is not None else parent
+        if new_parent is not None:
+            root.parent = new_parent
+            new_parent.children.append(root)
+    project.add_notes(registry.values())
+    report.elapsed = time.perf_counter() - begin
+    return report
+
+def _orphans(records: List[dict], registry: Dict[int, Note], rejected: Set[int]) -> Dict[int, int]:
+    """Valid records below a rejected record, each mapped to its nearest rejected ancestor."""
+    # Parents as _link_records resolves them: a children list wins over a parent_id
+    parents: Dict[int, int] = {}
+    for data in records:
+        children = data.get("children")
+        if isinstance(data.get("id"), int) and isinstance(children, list):
+            for child_id in children:
+                if isinstance(child_id, int):
+                    parents.setdefault(child_id, data["id"])
+    for data in records:
+        if data.get("id") in registry and isinstance(data.get("parent_id"), int):
+            parents.setdefault(data["id"], data["parent_id"])
+
+    ancestors: Dict[int, Optional[int]] = {}
+    for note_id in registry:
+        chain = []
+        seen = set()
+        current = note_id
+        while current in registry and current not in ancestors and current not in seen:
+            chain.append(current)
+            seen.add(current)
+            current = parents.get(current)
+        if current in ancestors:
+            ancestor = ancestors[current]
+        else:
+            ancestor = current if current in rejected and current not in registry else None
+        for member in chain:
+            ancestors[member] = ancestor
+    return {note_id: ancestor for note_id, ancestor in ancestors.items() if ancestor is not None}
+
+class _ImageBuilder:
+    """LegendsImages from image records, sized from the headers read by the workers.
+
+    Records describing the same file share one LegendsImage; its pixels live in the
+    process-wide image cache either way.
+    """
+
+    def __init__(self):
+        self.headers: Dict[str, Union[Tuple[int, int, str], str]] = {}
+        self._images: Dict[tuple, LegendsImage] = {}
+
+    def __call__(self, image_data: dict) -> LegendsImage:
+        path = image_data["image_path"]
+        key = (path, image_data.get("width"), image_data.get("height"), image_data.get("file_type"))
+        image = self._images.get(key)
+        if image is None:
+            width, height, file_type = key[1:]
+            if width is None or height is None:
+                header = self.headers[path]
+                if isinstance(header, str):
+                    raise ValueError(f"Cannot read image {path}: {header}")
+                width, height, file_type = header[0], header[1], file_type or header[2]
+            image = self._images[key] = LegendsImage(path, width, height, file_type)
+        return image
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def _location(data: dict) -> Location:
+    if not isinstance(data, dict) or not all(_is_number(data[axis]) for axis in ("x", "y", "z")):
+        raise TypeError("Locations must have numeric x, y and z.")
+    return Location.from_dict(data)
+
+def _timerange(data: dict, engine) -> Timerange:
+    if not isinstance(data, dict) or not all(isinstance(data[end], dict) for end in ("start", "end")):
+        raise TypeError("Timeranges must have start and end timestamps.")
+    timerange = Timerange.from_dict(data)
+    for timestamp in (timerange.start, timerange.end):
+        if not all(isinstance(value, int) and not isinstance(value, bool)
+                   for value in (timestamp.day, timestamp.month, timestamp.year)):
+            raise TypeError("Timestamps must have integer day, month and year.")
+        # Raises ValueError for a date the project calendar does not have
+        engine.to_ticks(timestamp.day, timestamp.month, timestamp.year)
+    return timerange
+
+def _description(data: dict) -> Description:
+    if not isinstance(data, dict) or not isinstance(data["text"], str):
+        raise TypeError("Descriptions must have a text string.")
+    return Description.from_dict(data)
+
+def _build_note(data: dict, image: _ImageBuilder, tags: MutableMapping[int, Tag], engine) -> Note:
+    """Validate one record and build its unlinked note without touching the disk.
+
+    Note._restore skips the type checks, so every field is checked here first; dates are
+    checked against the project calendar.
+    """
+    if not isinstance(data["id"], int):
+        raise TypeError("Note ids must be integers.")
+    if data.get("parent_id") is not None and not isinstance(data["parent_id"], int):
+        raise TypeError("Parent ids must be integers.")
+    children = data.get("children") or []
+    if not isinstance(children, list) or not all(isinstance(child_id, int) for child_id in children):
+        raise TypeError("Children must be a list of note ids.")
+
+    note_tags = []
+    for tag_data in data.get("tags") or []:
+        if not isinstance(tag_data, dict):
+            # A tag id, which must already be registered with the project
+            if tag_data not in tags:
+                raise KeyError(f"Tag {tag_data} is not registered.")
+            note_tags.append(tags[tag_data])
+            continue
+        tag = tags.get(tag_data["id"])
+        if tag is None:
+            tag = tags[tag_data["id"]] = Tag.from_dict(tag_data)
+        note_tags.append(tag)
+
+    return Note._restore(
+        data["id"],
+        _location(data["location"]) if data.get("location") else None,
+        _timerange(data["timerange"], engine) if data.get("timerange") else None,
+        _description(data["description"]) if data.get("description") else None,
+        image(data["thumbnail"]) if data.get("thumbnail") else None,
+        [image(image_data) for image_data in data.get("attached_images") or []],
+        note_tags
+    )
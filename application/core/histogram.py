@@ -0,0 +1,241 @@
+from abc import ABC, abstractmethod
+from bisect import insort
+from typing import Callable, Dict, List, Optional, Tuple
+
+from application.utils.calendar_engine import CalendarEngine
+from .timeline import TimelineIndex, TimePoint
+
+# Year multiples added above the calendar's own units
+_YEAR_GROUPS = (("Decade", 10), ("Century", 100), ("Millennium", 1000))
+
+class HistogramLevel(ABC):
+    """One resolution of the timeline: numbered buckets of calendar dates.
+
+    Buckets are consecutive integers in time order. bucket_of maps a tick (and its date)
+    to its bucket, start gives the first tick of a bucket and following the next bucket.
+    """
+
+    def __init__(self, name: str, engine: CalendarEngine, average_length: float):
+        self.name = name
+        self.engine = engine
+        self.average_length = average_length
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(name={self.name!r}, average_length={self.average_length:g})"
+
+    @abstractmethod
+    def bucket_of(self, tick: int, day: int, month: int, year: int) -> int:
+        """Bucket holding a tick, given with its date."""
+
+    @abstractmethod
+    def start(self, bucket: int) -> int:
+        """First tick of a bucket."""
+
+    def following(self, bucket: int) -> int:
+        return bucket + 1
+
+class _DayLevel(HistogramLevel):
+    def bucket_of(self, tick: int, day: int, month: int, year: int) -> int:
+        return tick
+
+    def start(self, bucket: int) -> int:
+        return bucket
+
+class _SubMonthLevel(HistogramLevel):
+    """Units between a day and a month, e.g. weeks, counted from the start of each month."""
+
+    def __init__(self, name: str, engine: CalendarEngine, days: int):
+        super().__init__(name, engine, days)
+        self.days = days
+        # Bucket slots reserved per month, enough for the longest one
+        self.stride = -(-max(engine.leap_lengths + engine.common_lengths) // days)
+
+    def bucket_of(self, tick: int, day: int, month: int, year: int) -> int:
+        return (year * self.engine.months_per_year + month - 1) * self.stride + (day - 1) // self.days
+
+    def start(self, bucket: int) -> int:
+        month_bucket, slot = divmod(bucket, self.stride)
+        year, month = divmod(month_bucket, self.engine.months_per_year)
+        return self.engine.to_ticks(1, month + 1, year) + slot * self.days
+
+    def following(self, bucket: int) -> int:
+        month_bucket, slot = divmod(bucket, self.stride)
+        year, month = divmod(month_bucket, self.engine.months_per_year)
+        if (slot + 1) * self.days < self.engine.days_in_month(month + 1, year):
+            return bucket + 1
+        return (month_bucket + 1) * self.stride
+
+class _MonthLevel(HistogramLevel):
+    def bucket_of(self, tick: int, day: int, month: int, year: int) -> int:
+        return year * self.engine.months_per_year + month - 1
+
+    def start(self, bucket: int) -> int:
+        year, month = divmod(bucket, self.engine.months_per_year)
+        return self.engine.to_ticks(1, month + 1, year)
+
+class _YearLevel(HistogramLevel):
+    def __init__(self, name: str, engine: CalendarEngine, years: int):
+        super().__init__(name, engine, years * engine.average_year_length)
+        self.years = years
+
+    def bucket_of(self, tick: int, day: int, month: int, year: int) -> int:
+        return year // self.years
+
+    def start(self, bucket: int) -> int:
+        return self.engine.days_before_year(bucket * self.years)
+
+def calendar_levels(engine: CalendarEngine) -> List[HistogramLevel]:
+    """Levels from the calendar's units of a day and longer, then decades, centuries and millennia."""
+    units = engine.units
+    day_index = engine.unit_index[engine.day_unit.name]
+    month_index = engine.unit_index[engine.month_unit.name]
+
+    levels: List[HistogramLevel] = [_DayLevel(engine.day_unit.name, engine, 1)]
+    for i in range(day_index + 1, month_index):
+        levels.append(_SubMonthLevel(units[i].name, engine, int(engine.unit_lengths[i])))
+    levels.append(_MonthLevel(engine.month_unit.name, engine, engine.common_year_length / engine.months_per_year))
+
+    year_index = month_index + 1
+    levels.append(_YearLevel(units[year_index].name if year_index < len(units) else "Year", engine, 1))
+    years = 1
+    for i in range(year_index + 1, len(units)):
+        years *= units[i - 1].number
+        if years > 1:
+            levels.append(_YearLevel(units[i].name, engine, years))
+    for name, group in _YEAR_GROUPS:
+        if all(not isinstance(level, _YearLevel) or level.years != group for level in levels):
+            levels.append(_YearLevel(name, engine, group))
+    return sorted(levels, key=lambda level: level.average_length)
+
+class _LevelCounts:
+    __slots__ = ("starts", "ends", "top")
+
+    def __init__(self):
+        # Per bucket: notes starting in it, notes ending in it, and the best starters as (-score, id)
+        self.starts: Dict[int, int] = {}
+        self.ends: Dict[int, int] = {}
+        self.top: Dict[int, List[Tuple[float, int]]] = {}
+
+class TimelineHistogram:
+    """Note density and representative notes per bucket at every calendar resolution.
+
+    Each level keeps, per bucket, how many notes start and end in it, plus the k highest
+    scoring notes that start in it (by default the longest). A bucket's density is the
+    number of notes overlapping it: the notes running when the window opens, taken from
+    the timeline's sorted ticks, plus a running sum of starts and ends. Reading B buckets
+    is therefore O(log n + B * k), and a note edit touches two buckets per level.
+
+    The histogram is built on a TimelineIndex and must be updated after it, as refilling
+    a bucket's top notes reads the starters back from the timeline.
+    """
+
+    def __init__(self, timeline: TimelineIndex, k: int = 8, score: Optional[Callable[[int, int, int], float]] = None):
+        self.timeline = timeline
+        self.engine = timeline.engine
+        self.k = k
+        # Score of a note from its (id, start, end); longer notes represent their bucket first
+        self.score = score or (lambda note_id, start, end: end - start)
+        self.levels = calendar_levels(self.engine)
+        self._counts = {level.name: _LevelCounts() for level in self.levels}
+        self._entries: Dict[int, Tuple[int, int, float]] = {}
+        for note_id, (start, end) in timeline._spans.items():
+            self._add(note_id, start, end)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def level(self, name: str) -> HistogramLevel:
+        for level in self.levels:
+            if level.name == name:
+                return level
+        raise KeyError(name)
+
+    def level_for(self, start: TimePoint, end: TimePoint, max_buckets: int) -> HistogramLevel:
+        """The finest level that shows [start, end] in at most about max_buckets buckets."""
+        span = self.timeline._ticks(end) - self.timeline._ticks(start) + 1
+        for level in self.levels:
+            if span / level.average_length <= max_buckets:
+                return level
+        return self.levels[-1]
+
+    # Updates
+
+    def update(self, note_id: int):
+        """Re-read a note's span from the timeline after it was inserted, moved or removed there."""
+        span = self.timeline._spans.get(note_id)
+        entry = self._entries.get(note_id)
+        if entry is not None and span == entry[:2]:
+            return
+        if entry is not None:
+            self._remove(note_id)
+        if span is not None:
+            self._add(note_id, *span)
+
+    def _add(self, note_id: int, start: int, end: int):
+        score = self.score(note_id, start, end)
+        self._entries[note_id] = (start, end, score)
+        start_date, end_date = self.engine.from_ticks(start), self.engine.from_ticks(end)
+        for level in self.levels:
+            counts = self._counts[level.name]
+            first = level.bucket_of(start, *start_date)
+            last = level.bucket_of(end, *end_date)
+            counts.starts[first] = counts.starts.get(first, 0) + 1
+            counts.ends[last] = counts.ends.get(last, 0) + 1
+            top = counts.top.setdefault(first, [])
+            if len(top) < self.k or (-score, note_id) < top[-1]:
+                insort(top, (-score, note_id))
+                del top[self.k:]
+
+    def _remove(self, note_id: int):
+        start, end, score = self._entries.pop(note_id)
+        start_date, end_date = self.engine.from_ticks(start), self.engine.from_ticks(end)
+        for level in self.levels:
+            counts = self._counts[level.name]
+            first = level.bucket_of(start, *start_date)
+            last = level.bucket_of(end, *end_date)
+            self._decrement(counts.starts, first)
+            self._decrement(counts.ends, last)
+            top = counts.top[first]
+            if (-score, note_id) in top:
+                top.remove((-score, note_id))
+                if len(top) < counts.starts.get(first, 0):
+                    self._refill(level, counts, first)
+                elif not top:
+                    del counts.top[first]
+
+    @staticmethod
+    def _decrement(counter: Dict[int, int], bucket: int):
+        if counter[bucket] == 1:
+            del counter[bucket]
+        else:
+            counter[bucket] -= 1
+
+    def _refill(self, level: HistogramLevel, counts: _LevelCounts, bucket: int):
+        """Recompute a bucket's top notes from the starters the timeline still holds."""
+        starters = self.timeline.iter_starting(level.start(bucket), level.start(level.following(bucket)) - 1)
+        counts.top[bucket] = sorted((-self._entries[note_id][2], note_id) for note_id in starters
+                                    if note_id in self._entries)[:self.k]
+
+    # Queries
+
+    def buckets(self, level: str, start: TimePoint, end: TimePoint, k: Optional[int] = None) -> List[Tuple[int, int, List[int]]]:
+        """(first tick, density, top note ids) of each bucket of a level covering [start, end]."""
+        level_ = self.level(level)
+        counts = self._counts[level]
+        k = self.k if k is None else min(k, self.k)
+        first_tick = self.timeline._ticks(start)
+        last_tick = self.timeline._ticks(end)
+
+        bucket = level_.bucket_of(first_tick, *self.engine.from_ticks(first_tick))
+        bucket_start = level_.start(bucket)
+        started, ended = self.timeline.count_before(bucket_start)
+        running = started - ended
+        results = []
+        while bucket_start <= last_tick:
+            starting = counts.starts.get(bucket, 0)
+            results.append((bucket_start, running + starting,
+                            [note_id for _, note_id in counts.top.get(bucket, ())[:k]]))
+            running += starting - counts.ends.get(bucket, 0)
+            bucket = level_.following(bucket)
+            bucket_start = level_.start(bucket)
+        return results
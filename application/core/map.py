@@ -1,5 +1,14 @@
-from application.utils import Location, Scale, LegendsImage
+from typing import TYPE_CHECKING, Hashable, List, Optional, Tuple
+from application.utils import Location, Scale, LegendsImage, Timerange, Description
+from application.utils.azgaar import AzgaarMap, LAYERS, import_azgaar
+from application.utils.instrumentation import instrument
+from .note import Note
 import json
+import math
+
+if TYPE_CHECKING:
+    from application.utils.tiles import TilePyramid
+    from .spatial import SpatialIndex
 
 class MapElement:
     def __init__(self, id: int, location: 'Location', scale: 'Scale', rotation: float):
@@ -8,17 +17,33 @@ class MapElement:
         self.scale = scale
         self.rotation = rotation
 
+    def to_local(self, x: float, y: float) -> Tuple[float, float]:
+        """Convert world x/y into the element's own unscaled, unrotated coordinates."""
+        dx, dy = x - self.location.x, y - self.location.y
+        angle = math.radians(-self.rotation)
+        cos, sin = math.cos(angle), math.sin(angle)
+        return (dx * cos - dy * sin) / self.scale.x, (dx * sin + dy * cos) / self.scale.y
+
+    def to_world(self, x: float, y: float) -> Tuple[float, float]:
+        """Convert element coordinates into world x/y."""
+        x, y = x * self.scale.x, y * self.scale.y
+        angle = math.radians(self.rotation)
+        cos, sin = math.cos(angle), math.sin(angle)
+        return self.location.x + x * cos - y * sin, self.location.y + x * sin + y * cos
+
+    @instrument()
     def to_dict(self) -> dict:
         """Serialize the MapElement to a dictionary."""
         return {
             "id": self.id,
-            "location": self.location.to_dict() if hasattr(self.location, "to_dict") else str(self.location),
-            "scale": self.scale.to_dict() if hasattr(self.scale, "to_dict") else str(self.scale),
+            "location": self.location.to_dict(),
+            "scale": self.scale.to_dict(),
             "rotation": self.rotation,
             "type": self.__class__.__name__
         }
 
     @staticmethod
+    @instrument()
     def from_dict(data: dict) -> 'MapElement':
         """Reconstruct a MapElement or its subclass from a dictionary."""
         element_type = data.get("type", "MapElement")
@@ -29,16 +54,18 @@ class MapElement:
         else:
             return MapElement(
                 id=data["id"],
-                location=Location.from_dict(data["location"]) if hasattr(Location, "from_dict") else Location(0,0,0),
-                scale=Scale.from_dict(data["scale"]) if hasattr(Scale, "from_dict") else Scale(1,1,0),
+                location=Location.from_dict(data["location"]),
+                scale=Scale.from_dict(data["scale"]),
                 rotation=data["rotation"]
             )
 
+    @instrument()
     def serialize(self) -> str:
         """Serialize the MapElement to a JSON string."""
         return json.dumps(self.to_dict())
 
     @staticmethod
+    @instrument()
     def deserialize(data: str) -> 'MapElement':
         """Deserialize a JSON string into a MapElement or its subclass."""
         return MapElement.from_dict(json.loads(data))
@@ -47,12 +74,31 @@ class MapImageElement(MapElement):
     def __init__(self, id: int, location: 'Location', scale: 'Scale', rotation: float, image: LegendsImage):
         super().__init__(id, location, scale, rotation)
         self.image = image
+        self._pyramid: Optional['TilePyramid'] = None
+
+    def tile_pyramid(self, cache_dir: Optional[str] = None) -> 'TilePyramid':
+        """Tile pyramid for the element's image; tiles are generated on first use."""
+        if self._pyramid is None:
+            # Tiling needs Pillow, which loading and saving maps do not
+            from application.utils.tiles import TilePyramid
+            self._pyramid = TilePyramid(self.image.image_path, cache_dir)
+        return self._pyramid
+
+    def visible_tiles(self, min_x: float, min_y: float, max_x: float, max_y: float, zoom: float,
+                      cache_dir: Optional[str] = None) -> List[Tuple[int, int, int]]:
+        """Tiles needed to draw a world-space viewport, where zoom is screen pixels per world unit."""
+        pyramid = self.tile_pyramid(cache_dir)
+        # Bounding box of the viewport corners in image pixels, covering any rotation
+        corners = [self.to_local(x, y) for x in (min_x, max_x) for y in (min_y, max_y)]
+        xs, ys = [x for x, _ in corners], [y for _, y in corners]
+        level = pyramid.level_for_zoom(zoom * min(abs(self.scale.x), abs(self.scale.y)))
+        return pyramid.tiles_in_view(min(xs), min(ys), max(xs), max(ys), level)
 
     def to_dict(self) -> dict:
         """Serialize the MapImageElement to a dictionary."""
         base_dict = super().to_dict()
         base_dict.update({
-            "image": self.image.to_dict() if hasattr(self.image, "to_dict") else str(self.image)
+            "image": self.image.to_dict()
         })
         return base_dict
 
@@ -61,16 +107,49 @@ class MapImageElement(MapElement):
         """Reconstruct a MapImageElement from a dictionary."""
         return MapImageElement(
             id=data["id"],
-            location=Location.from_dict(data["location"]) if hasattr(Location, "from_dict") else Location(0,0,0),
-            scale=Scale.from_dict(data["scale"]) if hasattr(Scale, "from_dict") else Scale(1,1,0),
+            location=Location.from_dict(data["location"]),
+            scale=Scale.from_dict(data["scale"]),
             rotation=data["rotation"],
-            image=LegendsImage.from_dict(data["image"]) if hasattr(LegendsImage, "from_dict") else LegendsImage(data["image"])
+            image=LegendsImage.from_dict(data["image"])
         )
 
 class MapAzgaarElement(MapElement):
     def __init__(self, id: int, location: 'Location', scale: 'Scale', rotation: float, json_path: str):
         super().__init__(id, location, scale, rotation)
         self.json_path = json_path
+        self._data: Optional[AzgaarMap] = None
+
+    def load(self, layers=LAYERS) -> AzgaarMap:
+        """Stream the Azgaar export into column arrays; the result is kept on the element."""
+        if self._data is None:
+            self._data = import_azgaar(self.json_path, layers)
+        return self._data
+
+    def create_notes(self, first_id: int, timerange: Timerange, layers=("burgs", "markers"),
+                     spatial_index: Optional['SpatialIndex'] = None) -> List[Note]:
+        """Create one Note per burg or marker at its world position, numbering ids from first_id."""
+        data = self.load()
+        notes = []
+        for kind in layers:
+            layer = getattr(data, kind)
+            prefix = kind[:-1]  # "burgs" -> "burg", matching the keys of Azgaar's notes
+            for name, azgaar_id, x, y in zip(layer.names, layer["id"], layer["x"], layer["y"]):
+                legend = data.legend(prefix, azgaar_id)
+                text = f"# {name}\n\n{legend[1]}" if legend and legend[1] else f"# {name}"
+                world_x, world_y = self.to_world(x, y)
+                notes.append(Note(first_id + len(notes), Location(world_x, world_y, self.location.z),
+                                  timerange, Description(text), None))
+        if spatial_index is not None:
+            for note in notes:
+                spatial_index.insert(note.id, note.location)
+        return notes
+
+    def index_layer(self, spatial_index: 'SpatialIndex', layer: str = "cells"):
+        """Add every record of a layer to a spatial index under (layer, azgaar id) keys."""
+        data = getattr(self.load(), layer)
+        keys: List[Hashable] = [(layer, azgaar_id) for azgaar_id in data["id"]]
+        points = [self.to_world(x, y) for x, y in zip(data["x"], data["y"])]
+        spatial_index.insert_many(keys, [x for x, _ in points], [y for _, y in points], self.location.z)
 
     def to_dict(self) -> dict:
         """Serialize the MapAzgaarElement to a dictionary."""
@@ -85,8 +164,8 @@ class MapAzgaarElement(MapElement):
         """Reconstruct a MapAzgaarElement from a dictionary."""
         return MapAzgaarElement(
             id=data["id"],
-            location=Location.from_dict(data["location"]) if hasattr(Location, "from_dict") else Location(0, 0, 0),
-            scale=Scale.from_dict(data["scale"]) if hasattr(Scale, "from_dict") else Scale(1,1,0),
+            location=Location.from_dict(data["location"]),
+            scale=Scale.from_dict(data["scale"]),
             rotation=data["rotation"],
             json_path=data["json_path"]
         )
@@ -1,6 +1,7 @@
 import json
-from typing import List, Optional
+from typing import Dict, Iterable, List, Mapping, Optional, Set
 from application.utils import Location, Timerange, Description, LegendsImage
+from application.utils.instrumentation import instrument
 
 class Tag:
     def __init__(self, id: int, name: str, color: int):
@@ -8,7 +9,25 @@ class Tag:
         self.name = name
         self.color = color
 
+    def __repr__(self):
+        return f"Tag(id={self.id}, name={self.name}, color={self.color})"
+
+    def to_dict(self) -> dict:
+        """Convert the Tag to a dictionary."""
+        return {"id": self.id, "name": self.name, "color": self.color}
+
+    @staticmethod
+    def from_dict(data: dict) -> 'Tag':
+        """Reconstruct a Tag from a dictionary."""
+        return Tag(data["id"], data["name"], data["color"])
+
+# Fields written to the project file; assigning one marks the note dirty in its project
+_SAVED_FIELDS = frozenset({"location", "timerange", "description", "thumbnail", "attached_images", "tags"})
+
 class Note:
+    # The dirty set of the project holding the note, set by Project; None while it belongs to none
+    _dirty: Optional[Set[int]] = None
+
     def __init__(self,
                  id: int,
                  location: Location,
@@ -41,66 +60,211 @@ class Note:
         if not all(isinstance(tag, Tag) for tag in self.tags):
             raise TypeError("Each tag must be a Tag.")
 
+    @staticmethod
+    def _restore(id: int, location: Location, timerange: Timerange, description: Description,
+                 thumbnail: LegendsImage, attached_images: List[LegendsImage], tags: List['Tag']) -> 'Note':
+        """Build an unlinked Note from already validated storage, skipping the type checks.
+
+        The fields go straight into the instance dict, bypassing __setattr__ for load speed.
+        """
+        note = Note.__new__(Note)
+        fields = note.__dict__
+        fields["id"] = id
+        fields["location"] = location
+        fields["timerange"] = timerange
+        fields["description"] = description
+        fields["thumbnail"] = thumbnail
+        fields["attached_images"] = attached_images
+        fields["parent"] = None
+        fields["children"] = []
+        fields["tags"] = tags
+        return note
+
+    def __setattr__(self, name: str, value):
+        object.__setattr__(self, name, value)
+        if name in _SAVED_FIELDS and self._dirty is not None:
+            self._dirty.add(self.id)
+
     def attach_image(self, image: LegendsImage):
         self.attached_images.append(image)
+        if self._dirty is not None:
+            self._dirty.add(self.id)
 
     def __repr__(self):
         return (f"Note(location={repr(self.location)}, timerange={repr(self.timerange)}, "
                 f"description={repr(self.description)}, thumbnail={repr(self.thumbnail)}, "
                 f"attached_images={len(self.attached_images)} images)")
 
-    def to_dict(self) -> dict:
-        """Convert the Note to a dictionary."""
+    def iter_subtree(self) -> Iterable['Note']:
+        """This note and all its descendants in depth-first pre-order, without recursion."""
+        stack = [self]
+        while stack:
+            note = stack.pop()
+            yield note
+            stack.extend(reversed(note.children))
+
+    def to_dict(self, tag_ids: bool = False) -> dict:
+        """Convert the Note to a flat dictionary; parent and children are referenced by id.
+
+        Tags are written whole, or with tag_ids as ids for a caller that saves the tags once
+        alongside the records (see Project.to_dict).
+        """
         return {
             "id": self.id,
-            "location": self.location.to_dict() if hasattr(self.location, "to_dict") else str(self.location),
-            "timerange": self.timerange.to_dict() if hasattr(self.timerange, "to_dict") else str(self.timerange),
-            "description": self.description.to_dict() if hasattr(self.description, "to_dict") else str(self.description),
-            "thumbnail": self.thumbnail.to_dict() if hasattr(self.thumbnail, "to_dict") else str(self.thumbnail),
-            "attached_images": [img.to_dict() if hasattr(img, "to_dict") else str(img) for img in self.attached_images],
+            "location": self.location.to_dict() if self.location is not None else None,
+            "timerange": self.timerange.to_dict() if self.timerange is not None else None,
+            "description": self.description.to_dict() if self.description is not None else None,
+            "thumbnail": self.thumbnail.to_dict() if self.thumbnail is not None else None,
+            "attached_images": [img.to_dict() for img in self.attached_images],
             "parent_id": self.parent.id if self.parent else None,
-            "children": [child.to_dict() for child in self.children]
+            "children": [child.id for child in self.children],
+            "tags": [tag.id if tag_ids else tag.to_dict() for tag in self.tags]
         }
 
+    @instrument()
+    def subtree_to_dicts(self, tag_ids: bool = False) -> List[dict]:
+        """Flat records of this note and its descendants, parents before children."""
+        return [note.to_dict(tag_ids) for note in self.iter_subtree()]
+
     @staticmethod
-    def from_dict(data: dict, note_registry: Optional[dict] = None) -> 'Note':
-        """Reconstruct a Note from a dictionary."""
-        note_registry = note_registry or {}
+    def from_dict(data: dict, note_registry: Optional[dict] = None,
+                  tags: Optional[Mapping[int, Tag]] = None) -> 'Note':
+        """Reconstruct a single, unlinked Note from a dictionary and add it to the registry.
+
+        Tag ids are looked up in tags, typically the project's TagRegistry; whole tags are
+        replaced by the registered Tag with their id, if any. Use from_dicts to rebuild the
+        links between notes.
+        """
+        note_registry = note_registry if note_registry is not None else {}
 
         note = Note(
             id=data["id"],
-            location=Location.from_dict(data["location"]) if hasattr(Location, "from_dict") else Location(
-                data["location"]),
-            timerange=Timerange.from_dict(data["timerange"]) if hasattr(Timerange, "from_dict") else Timerange(
-                data["timerange"]),
-            description=Description.from_dict(data["description"]) if hasattr(Description,
-                                                                              "from_dict") else Description(
-                data["description"]),
-            thumbnail=LegendsImage.from_dict(data["thumbnail"]) if hasattr(LegendsImage, "from_dict") else LegendsImage(
-                data["thumbnail"]),
-            attached_images=[
-                LegendsImage.from_dict(img) if hasattr(LegendsImage, "from_dict") else LegendsImage(img)
-                for img in data.get("attached_images", [])
-            ],
-            parent=None,  # Will be linked later
-            children=[]  # Will be populated later
+            location=Location.from_dict(data["location"]) if data.get("location") else None,
+            timerange=Timerange.from_dict(data["timerange"]) if data.get("timerange") else None,
+            description=Description.from_dict(data["description"]) if data.get("description") else None,
+            thumbnail=LegendsImage.from_dict(data["thumbnail"]) if data.get("thumbnail") else None,
+            attached_images=[LegendsImage.from_dict(img) for img in data.get("attached_images", [])],
+            parent=None,  # Linked by from_dicts
+            children=[],
+            tags=_resolve_tags(data.get("tags", []), tags)
         )
 
         note_registry[note.id] = note
+        return note
 
-        # Link children recursively
-        for child_data in data.get("children", []):
-            child_note = Note.from_dict(child_data, note_registry)
-            note.children.append(child_note)
-            child_note.parent = note
+    @staticmethod
+    @instrument()
+    def from_dicts(records: Iterable[dict], note_registry: Optional[dict] = None,
+                   tags: Optional[Mapping[int, Tag]] = None) -> List['Note']:
+        """Rebuild a note tree from flat records in one iterative O(n) pass. Returns the roots.
 
-        return note
+        Records may come in any order. Children are linked in the order of each record's
+        "children" ids, falling back to record order for children it does not list. Older
+        files that nest child dicts inside "children" are flattened on the way.
+        """
+        note_registry = note_registry if note_registry is not None else {}
+        # Without a registry, notes naming the same tag still share one Tag
+        tags = tags if tags is not None else {}
+        records = _flatten_records(records)
+        for data in records:
+            Note.from_dict(data, note_registry, tags)
+        return _link_records(records, note_registry)
 
+    @staticmethod
+    @instrument()
+    def load_subtree(records: Iterable[dict], root_id: int, note_registry: Optional[dict] = None,
+                     tags: Optional[Mapping[int, Tag]] = None) -> 'Note':
+        """Rebuild only the subtree under root_id from flat records, leaving every other record undecoded."""
+        note_registry = note_registry if note_registry is not None else {}
+        records = _flatten_records(records)
+        by_id = {data["id"]: data for data in records}
+        families: Dict[int, List[int]] = {}
+        for data in records:
+            if data.get("parent_id") is not None:
+                families.setdefault(data["parent_id"], []).append(data["id"])
+
+        selected = []
+        stack = [root_id]
+        while stack:
+            data = by_id[stack.pop()]
+            selected.append(data)
+            stack.extend(data.get("children") or families.get(data["id"], []))
+        for data in selected:
+            Note.from_dict(data, note_registry, tags)
+        _link_records(selected, note_registry)
+        root = note_registry[root_id]
+        root.parent = None
+        return root
+
+    @instrument()
     def serialize(self) -> str:
-        """Serialize the Note to a JSON string."""
-        return json.dumps(self.to_dict())
+        """Serialize the Note and its subtree to a JSON string of flat records and the tags they use."""
+        records = self.subtree_to_dicts(tag_ids=True)
+        tags = {tag.id: tag for note in self.iter_subtree() for tag in note.tags}
+        return json.dumps({"tags": [tag.to_dict() for tag in tags.values()], "notes": records})
 
     @staticmethod
+    @instrument()
     def deserialize(data: str) -> 'Note':
-        """Deserialize a JSON string into a Note."""
-        return Note.from_dict(json.loads(data))
\ No newline at end of file
+        """Deserialize a JSON string into a Note with its subtree."""
+        records = json.loads(data)
+        if isinstance(records, dict) and "notes" in records:
+            tags = {tag["id"]: Tag.from_dict(tag) for tag in records.get("tags", [])}
+            return Note.from_dicts(records["notes"], tags=tags)[0]
+        return Note.from_dicts(records if isinstance(records, list) else [records])[0]
+
+def _resolve_tags(entries: Iterable, tags: Optional[Mapping[int, Tag]]) -> List[Tag]:
+    """Tags of a record, given as ids into tags or, in self-contained records, as tag dictionaries."""
+    resolved = []
+    for entry in entries:
+        if isinstance(entry, dict):
+            tag = tags.get(entry["id"]) if tags is not None else None
+            if tag is None:
+                tag = Tag.from_dict(entry)
+                if isinstance(tags, dict):
+                    tags[tag.id] = tag
+            resolved.append(tag)
+        elif tags is not None and entry in tags:
+            resolved.append(tags[entry])
+        else:
+            raise KeyError(f"Tag {entry} is not registered.")
+    return resolved
+
+def _flatten_records(records: Iterable[dict]) -> List[dict]:
+    """Flat records, unnesting child dicts of the old recursive format without recursion."""
+    flat = []
+    stack = [(data, None) for data in reversed(list(records))]
+    while stack:
+        data, parent_id = stack.pop()
+        children = data.get("children") or []
+        if children and isinstance(children[0], dict):
+            stack.extend((child, data["id"]) for child in reversed(children))
+            data = dict(data, children=[child["id"] for child in children])
+        if parent_id is not None and data.get("parent_id") is None:
+            data = dict(data, parent_id=parent_id)
+        flat.append(data)
+    return flat
+
+def _link_records(records: List[dict], note_registry: dict) -> List[Note]:
+    """Attach registered notes to their parents following the records. Returns the notes left as roots."""
+    roots = []
+    linked = set()
+    for data in records:
+        note = note_registry[data["id"]]
+        for child_id in data.get("children") or []:
+            child = note_registry.get(child_id)
+            if child is not None and child_id not in linked:
+                child.parent = note
+                note.children.append(child)
+                linked.add(child_id)
+    for data in records:
+        note = note_registry[data["id"]]
+        if data["id"] in linked:
+            continue
+        parent = note_registry.get(data.get("parent_id"))
+        if parent is not None:
+            note.parent = parent
+            parent.children.append(note)
+        else:
+            roots.append(note)
+    return roots
@@ -0,0 +1,214 @@
+from collections import OrderedDict
+from typing import Dict, Iterator, List, MutableMapping, Optional, Set
+import json
+
+from application.utils import Location, Timestamp, Timerange, Description, LegendsImage
+from .note import Note
+from .storage import NOTE_HEADER, HAS_PARENT, HAS_LOCATION, HAS_TIMERANGE, ProjectStore, gc_paused, page_of
+from .tags import TagRegistry
+
+_UNLOADED = object()
+
+class LazyNote(Note):
+    """A Note whose description, images, tags and children are read from the project file on first use.
+
+    Id, location, timerange and parent are loaded up front with the header. Like any
+    Note, assigning a saved field marks it dirty, which also keeps it from being evicted.
+    """
+
+    def _field(name: str):
+        attribute = "_" + name
+
+        def getter(self):
+            value = getattr(self, attribute)
+            if value is _UNLOADED:
+                self._store._load_page(page_of(self.id))
+                value = getattr(self, attribute)
+            else:
+                self._store._touch(page_of(self.id))
+            return value
+
+        def setter(self, value):
+            if getattr(self, attribute) is _UNLOADED:
+                self._store._load_page(page_of(self.id))
+            else:
+                self._store._touch(page_of(self.id))
+            setattr(self, attribute, value)
+
+        return property(getter, setter)
+
+    description = _field("description")
+    thumbnail = _field("thumbnail")
+    attached_images = _field("attached_images")
+    tags = _field("tags")
+    del _field
+
+    @property
+    def children(self) -> List[Note]:
+        if self._children is None:
+            self._children = self._store._children_of(self.id)
+        return self._children
+
+    @children.setter
+    def children(self, children: List[Note]):
+        self._children = children
+
+    def is_loaded(self) -> bool:
+        return self._description is not _UNLOADED
+
+    def _unload(self):
+        self._description = self._thumbnail = self._attached_images = self._tags = _UNLOADED
+
+class NoteStore(MutableMapping):
+    """Project.notes backed by a project file, holding note bodies for only a budget's worth of pages.
+
+    Every note's header is read when the store opens. Bodies are decoded a page at a
+    time on first access and dropped, least recently used page first, once the encoded
+    size of the loaded pages exceeds max_bytes. Notes in `pinned` (the project's dirty
+    set) are never dropped, so unsaved edits stay in memory.
+    """
+
+    def __init__(self, store: ProjectStore, max_bytes: int = 64 * 1024 * 1024,
+                 tags: Optional[TagRegistry] = None):
+        self.store = store
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.pinned: Set[int] = set()
+        self._notes: Dict[int, Note] = {}
+        # Shared with the project, so loaded notes carry the registered Tag objects
+        self.tags = tags if tags is not None else store.read_tags()
+        # Child ids per parent id, with sibling positions, until the parent's list is first built
+        self._families: Dict[int, List[tuple]] = {}
+        # Loaded pages, least recently used first, with their encoded size and members
+        self._pages: 'OrderedDict[int, int]' = OrderedDict()
+        self._members: Dict[int, List[int]] = {}
+        with gc_paused():
+            self._read_headers()
+
+    def _read_headers(self):
+        parents = []
+        for page in self.store.read_headers().values():
+            for header in page:
+                (id, parent_id, position, x, y, z, start_day, start_month, start_year,
+                 end_day, end_month, end_year, flags) = header
+                note = LazyNote.__new__(LazyNote)
+                # Straight into the instance dict, so loading neither runs __setattr__ nor marks it dirty
+                fields = note.__dict__
+                fields["_store"] = self
+                fields["id"] = id
+                fields["location"] = Location(x, y, z) if flags & HAS_LOCATION else None
+                fields["timerange"] = Timerange(Timestamp(start_day, start_month, start_year),
+                                                Timestamp(end_day, end_month, end_year)) if flags & HAS_TIMERANGE else None
+                fields["parent"] = None
+                fields["_children"] = None
+                fields["_description"] = fields["_thumbnail"] = fields["_attached_images"] = fields["_tags"] = _UNLOADED
+                fields["_dirty"] = self.pinned
+                self._notes[id] = note
+                if flags & HAS_PARENT:
+                    parents.append((id, parent_id))
+                    self._families.setdefault(parent_id, []).append((position, id))
+        for id, parent_id in parents:
+            self._notes[id].parent = self._notes.get(parent_id)
+
+    def rebind(self, store: ProjectStore):
+        """Read bodies from another file holding the same project, e.g. after Save As."""
+        self.store.close()
+        self.store = store
+
+    def close(self):
+        self.store.close()
+
+    # Mapping interface
+
+    def __getitem__(self, note_id: int) -> Note:
+        return self._notes[note_id]
+
+    def __setitem__(self, note_id: int, note: Note):
+        self._notes[note_id] = note
+
+    def __delitem__(self, note_id: int):
+        del self._notes[note_id]
+
+    def __contains__(self, note_id) -> bool:
+        return note_id in self._notes
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._notes)
+
+    def __len__(self) -> int:
+        return len(self._notes)
+
+    def values(self):
+        return self._notes.values()
+
+    def items(self):
+        return self._notes.items()
+
+    def loaded_pages(self) -> List[int]:
+        return list(self._pages)
+
+    # Paging
+
+    def _children_of(self, note_id: int) -> List[Note]:
+        family = self._families.pop(note_id, [])
+        family.sort()
+        return [self._notes[child_id] for _, child_id in family if child_id in self._notes]
+
+    def _load_page(self, page: int):
+        headers, bodies = self.store.read_page(page)
+        members = []
+        with gc_paused():
+            for header, body in zip(NOTE_HEADER.iter_unpack(headers), json.loads(bodies)):
+                note = self._notes.get(header[0])
+                if not isinstance(note, LazyNote) or note.is_loaded():
+                    continue
+                description, thumbnail, attached_images, tag_ids = body
+                note._description = Description(description) if description is not None else None
+                note._thumbnail = LegendsImage.from_dict(thumbnail) if thumbnail else None
+                note._attached_images = [LegendsImage.from_dict(image) for image in attached_images] if attached_images else []
+                note._tags = [self.tags[tag_id] for tag_id in tag_ids] if tag_ids else []
+                members.append(note.id)
+
+        size = len(bodies)
+        if page in self._pages:
+            self.current_bytes -= self._pages.pop(page)
+            members.extend(self._members[page])
+        self._pages[page] = size
+        self._members[page] = members
+        self.current_bytes += size
+        self._evict(keep=page)
+
+    def _touch(self, page: int):
+        """Mark a loaded page as the most recently used, so eviction drops it last."""
+        if page in self._pages:
+            self._pages.move_to_end(page)
+
+    def trim(self):
+        """Drop pages over budget now, e.g. once a save has unpinned the edited notes."""
+        self._evict(keep=None)
+
+    def _evict(self, keep: Optional[int]):
+        """Drop the least recently used pages until the loaded bodies fit the budget."""
+        for page in list(self._pages):
+            if self.current_bytes <= self.max_bytes:
+                return
+            if page == keep:
+                continue
+            members = [self._notes.get(note_id) for note_id in self._members[page]]
+            if any(note is not None and note.id in self.pinned for note in members):
+                continue
+            for note in members:
+                if isinstance(note, LazyNote):
+                    note._unload()
+            self.current_bytes -= self._pages.pop(page)
+            del self._members[page]
+
+    def load_all(self):
+        """Decode every remaining page, ignoring the budget, e.g. before an export."""
+        max_bytes, self.max_bytes = self.max_bytes, float("inf")
+        try:
+            for page in sorted({page_of(note.id) for note in self._notes.values()
+                                if isinstance(note, LazyNote) and not note.is_loaded()}):
+                self._load_page(page)
+        finally:
+            self.max_bytes = max_bytes
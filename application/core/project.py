@@ -1,7 +1,20 @@
-from typing import List, Dict
-from settings import Settings
-from map import MapElement, MapImageElement, MapAzgaarElement
-from note import Note
+from typing import Iterable, List, Dict, MutableMapping, Optional, Set, Tuple, Union
+import json
+
+from application.utils import Location
+from application.utils.calendar_engine import CalendarEngine, compile_calendar, set_active_calendar
+from application.utils.instrumentation import instrument
+from .settings import Settings
+from .map import MapElement, MapImageElement, MapAzgaarElement
+from .note import Note, Tag
+from .histogram import TimelineHistogram
+from .note_store import NoteStore
+from .query import SpatioTemporalQuery
+from .search import SearchIndex
+from .spatial import SpatialIndex
+from .timeline import TimelineIndex, TimePoint
+from .storage import Compaction, ProjectStore, is_project_file
+from .tags import TagFilter, TagIndex, TagRegistry
 
 # Project
     # ID
@@ -11,21 +24,418 @@ from note import Note
     # Many Notes
 
 class Project:
-    def __init__(self, id: int, name: str, settings: Settings, map_elements: Dict[int, MapElement], notes: Dict[int, Note]):
+    def __init__(self, id: int, name: str, settings: Settings, map_elements: Dict[int, MapElement],
+                 notes: MutableMapping[int, Note], path: Optional[str] = None,
+                 tags: Optional[TagRegistry] = None):
         self.id = id
         self.name = name
         self.settings = settings
         self.map_elements = map_elements
         self.notes = notes
+        self.path = path
+        # Every tag once; notes share its Tag objects
+        if tags is None:
+            tags = notes.tags if isinstance(notes, NoteStore) else TagRegistry()
+            if not isinstance(notes, NoteStore):
+                for note in notes.values():
+                    tags.intern_note(note)
+        self.tags = tags
+
+        # Changes since the last save, so saving rewrites only what was touched. Notes add
+        # themselves to the dirty set when a saved field is assigned; see Note.__setattr__
+        self._dirty_notes: Set[int] = notes.pinned if isinstance(notes, NoteStore) else set()
+        self._removed_notes: Set[int] = set()
+        self._dirty_elements: Set[int] = set()
+        self._removed_elements: Set[int] = set()
+        # The file the in-memory project last matched; None until saved or loaded
+        self._synced_path: Optional[str] = None
+        self._compaction: Optional[Compaction] = None
+        if not isinstance(notes, NoteStore):
+            # Lazily loaded notes already point at the store's pinned set, which keeps unsaved notes in memory
+            for note in notes.values():
+                note._dirty = self._dirty_notes
+        # Loaded from the project file or built on first search; see search_index
+        self._search_index: Optional[SearchIndex] = None
+        self._search_index_saved = False
+        # Built on first query; see spatial_index and timeline_index
+        self._spatial_index: Optional[SpatialIndex] = None
+        self._timeline_index: Optional[TimelineIndex] = None
+        self._timeline_histogram: Optional[TimelineHistogram] = None
+        self._tag_index: Optional[TagIndex] = None
+
+    @property
+    def calendar_engine(self) -> CalendarEngine:
+        """The compiled calendar of this project; pass it to Timestamp and Timerange arithmetic."""
+        return compile_calendar(self.settings.calendar)
+
+    def activate(self):
+        """Make this project's calendar the default for Timestamp arithmetic, e.g. when it is opened for editing.
+
+        Loading or building a project leaves the process-wide calendar alone, so a second
+        project (an import source, say) never changes time math for the first.
+        """
+        set_active_calendar(self.settings.calendar)
+
+    def root_notes(self) -> List[Note]:
+        """Notes without a parent, in project order."""
+        return [note for note in self.notes.values() if note.parent is None]
+
+    # Editing
+    def add_note(self, note: Note, parent: Optional[Note] = None):
+        """Add a note (and any children it already has), optionally as the last child of parent."""
+        if parent is not None:
+            note.parent = parent
+            parent.children.append(note)
+            self.mark_dirty(parent)
+        stack = [note]
+        while stack:
+            current = stack.pop()
+            self.notes[current.id] = current
+            current._dirty = self._dirty_notes
+            self.mark_dirty(current)
+            stack.extend(current.children)
+
+    def add_notes(self, notes: Iterable[Note]):
+        """Add already linked notes in one pass, updating every index that has been built.
+
+        Parents outside the batch are marked dirty, as their children changed.
+        """
+        notes = list(notes)
+        new_ids = {note.id for note in notes}
+        for note in notes:
+            self.tags.intern_note(note)
+            self.notes[note.id] = note
+            note._dirty = self._dirty_notes
+            self._dirty_notes.add(note.id)
+            self._removed_notes.discard(note.id)
+            if note.parent is not None and note.parent.id not in new_ids:
+                self.mark_dirty(note.parent)
+            if self._spatial_index is not None and note.location is not None:
+                self._spatial_index.insert(note.id, note.location)
+            if self._timeline_index is not None:
+                self._timeline_index.update(note)
+                if self._timeline_histogram is not None:
+                    self._timeline_histogram.update(note.id)
+            if self._search_index is not None:
+                self._search_index.update(note)
+            if self._tag_index is not None:
+                self._tag_index.update(note)
+
+    def remove_note(self, note_id: int):
+        """Remove a note and its whole subtree."""
+        note = self.notes[note_id]
+        if note.parent is not None:
+            note.parent.children.remove(note)
+            self.mark_dirty(note.parent)
+            note.parent = None
+        stack = [note]
+        while stack:
+            current = stack.pop()
+            del self.notes[current.id]
+            current._dirty = None
+            self._dirty_notes.discard(current.id)
+            self._removed_notes.add(current.id)
+            stack.extend(current.children)
+
+    def add_map_element(self, element: MapElement):
+        self.map_elements[element.id] = element
+        self.mark_dirty(element)
+
+    def remove_map_element(self, element_id: int):
+        del self.map_elements[element_id]
+        self._dirty_elements.discard(element_id)
+        self._removed_elements.add(element_id)
+
+    def mark_dirty(self, *items: Union[Note, MapElement]):
+        """Record that notes or map elements were edited in place and must be written on the next save.
+
+        Assigning a note field marks the note already; this is for in-place changes such as
+        appending to note.tags, and for map elements.
+        """
+        for item in items:
+            if isinstance(item, Note):
+                self._dirty_notes.add(item.id)
+                self._removed_notes.discard(item.id)
+            elif isinstance(item, MapElement):
+                self._dirty_elements.add(item.id)
+                self._removed_elements.discard(item.id)
+            else:
+                raise TypeError("Only Notes and MapElements can be marked dirty.")
+
+    def has_unsaved_changes(self) -> bool:
+        return bool(self._synced_path is None or self._dirty_notes or self._removed_notes or
+                    self._dirty_elements or self._removed_elements)
+
+    def mark_clean(self, path: str):
+        """Record that the file at path now matches the project exactly."""
+        self._synced_path = path
+        self._dirty_notes.clear()
+        self._removed_notes.clear()
+        self._dirty_elements.clear()
+        self._removed_elements.clear()
+
+    # Search
+    def search_index(self) -> SearchIndex:
+        """The full-text index of the notes, read from the project file or built on first use."""
+        if self._search_index is None:
+            index, stale = None, set()
+            if self._synced_path is not None:
+                with ProjectStore(self._synced_path) as store:
+                    index, stale = store.read_search_index()
+            self._search_index_saved = index is not None
+            if index is None:
+                index = SearchIndex.from_notes(self.notes.values())
+            else:
+                # Notes saved since the index was last written
+                for note_id in stale:
+                    if note_id in self.notes:
+                        index.update(self.notes[note_id])
+                    else:
+                        index.discard(note_id)
+            self._search_index = index
+        self._sync_search_index()
+        return self._search_index
+
+    def _sync_search_index(self):
+        """Catch the index up with unsaved edits; notes whose text is unchanged are skipped."""
+        for note_id in self._removed_notes:
+            self._search_index.discard(note_id)
+        for note_id in self._dirty_notes:
+            if note_id in self.notes:
+                self._search_index.update(self.notes[note_id])
+
+    def search(self, query: str, tags: Iterable[Union[Tag, int]] = (), limit: Optional[int] = 20,
+               prefix: bool = True) -> List[Note]:
+        """Best matching notes for a query, restricted to notes with all the given tags."""
+        tag_ids = [tag.id if isinstance(tag, Tag) else tag for tag in tags]
+        results = self.search_index().search(query, tag_ids, limit, prefix)
+        return [self.notes[note_id] for note_id, _ in results]
+
+    # Tags
+    def tag_index(self) -> TagIndex:
+        """Tag bitmaps of the notes, built on first use and caught up with edits on each call."""
+        if self._tag_index is None:
+            self._tag_index = TagIndex.from_notes(self.notes.values(), self.tags)
+            return self._tag_index
+        self._sync_tag_index()
+        return self._tag_index
+
+    def _sync_tag_index(self):
+        for note_id in self._removed_notes:
+            self._tag_index.discard(note_id)
+        for note_id in self._dirty_notes:
+            note = self.notes.get(note_id)
+            if note is None:
+                self._tag_index.discard(note_id)
+            else:
+                self._tag_index.update(note)
+
+    def filter_tags(self, expression: TagFilter) -> List[Note]:
+        """Notes matching a tag filter, e.g. has(a) & (has(b) | ~has(c)); see tag_filter."""
+        return [self.notes[int(note_id)] for note_id in self.tag_index().matching(expression)]
+
+    def _sync_tags(self, everything: bool = False):
+        """Register the tags of notes edited since the last save, or of all notes, so they are written with them.
+
+        Notes of a NoteStore that were never loaded already carry registered tags.
+        """
+        if everything and not isinstance(self.notes, NoteStore):
+            note_ids = self.notes.keys()
+        else:
+            note_ids = self._dirty_notes
+        for note_id in note_ids:
+            note = self.notes.get(note_id)
+            if note is not None:
+                self.tags.intern_note(note)
+
+    # Space and time
+    def spatial_index(self) -> SpatialIndex:
+        """Grid index of note locations, built on first use and caught up with edits on each call."""
+        if self._spatial_index is None:
+            self._spatial_index = SpatialIndex.from_notes(self.notes.values())
+            return self._spatial_index
+        self._sync_spatial_index()
+        return self._spatial_index
+
+    def _sync_spatial_index(self):
+        for note_id in self._removed_notes:
+            self._spatial_index.discard(note_id)
+        for note_id in self._dirty_notes:
+            note = self.notes.get(note_id)
+            if note is None or note.location is None:
+                self._spatial_index.discard(note_id)
+            else:
+                self._spatial_index.insert(note_id, note.location)
+
+    def timeline_index(self) -> TimelineIndex:
+        """Interval index of note timeranges, built on first use and caught up with edits on each call."""
+        if self._timeline_index is None:
+            self._timeline_index = TimelineIndex.from_notes(self.notes.values(), self.calendar_engine)
+            return self._timeline_index
+        self._sync_timeline_index()
+        return self._timeline_index
+
+    def _sync_timeline_index(self):
+        for note_id in self._removed_notes:
+            self._timeline_index.discard(note_id)
+            if self._timeline_histogram is not None:
+                self._timeline_histogram.update(note_id)
+        for note_id in self._dirty_notes:
+            note = self.notes.get(note_id)
+            if note is None:
+                self._timeline_index.discard(note_id)
+            else:
+                self._timeline_index.update(note)
+            if self._timeline_histogram is not None:
+                self._timeline_histogram.update(note_id)
+
+    def _sync_indexes(self):
+        """Catch every built index up with the unsaved edits, before saving forgets which notes they were."""
+        if self._spatial_index is not None:
+            self._sync_spatial_index()
+        if self._timeline_index is not None:
+            # Also moves the edited notes between the timeline histogram's buckets
+            self._sync_timeline_index()
+        if self._tag_index is not None:
+            self._sync_tag_index()
+
+    def timeline_histogram(self) -> TimelineHistogram:
+        """Per-bucket note density and top notes at each calendar resolution, kept in step with the timeline index."""
+        timeline = self.timeline_index()
+        if self._timeline_histogram is None:
+            self._timeline_histogram = TimelineHistogram(timeline)
+        return self._timeline_histogram
+
+    def query(self, box: Optional[Tuple[float, float, float, float]] = None, center: Optional[Location] = None,
+              radius: Optional[float] = None, start: Optional[TimePoint] = None, end: Optional[TimePoint] = None,
+              tags: Iterable[Union[Tag, int]] = ()) -> SpatioTemporalQuery:
+        """Notes in a box (min_x, min_y, max_x, max_y) or radius, during [start, end], with all the given tags.
+
+        The result is a lazy iterable; see SpatioTemporalQuery.
+        """
+        tag_ids = [tag.id if isinstance(tag, Tag) else tag for tag in tags]
+        return SpatioTemporalQuery(self.notes, self.spatial_index(), self.timeline_index(), box, center, radius,
+                                   start, end, tag_ids, self.tag_index() if tag_ids else None)
+
+    def to_dict(self) -> dict:
+        """Convert the Project to a dictionary."""
+        return {
+            "id": self.id,
+            "name": self.name,
+            "settings": self.settings.to_dict(),
+            "map_elements": [element.to_dict() for element in self.map_elements.values()],
+            "tags": self.tags.to_dict(),
+            "notes": [record for note in self.root_notes() for record in note.subtree_to_dicts(tag_ids=True)]
+        }
+
+    @staticmethod
+    def from_dict(data: dict) -> 'Project':
+        """Reconstruct a Project from a dictionary."""
+        settings = Settings.from_dict(data["settings"])
+        tags = TagRegistry.from_dict(data.get("tags", []))
+        notes = {}
+        Note.from_dicts(data.get("notes", []), notes, tags)
+        map_elements = {element.id: element for element in map(MapElement.from_dict, data.get("map_elements", []))}
+        return Project(data["id"], data["name"], settings, map_elements, notes, tags=tags)
 
     # To JSON
-    def serialize(self):
-        pass
+    def serialize(self) -> str:
+        """Serialize the Project to a JSON string."""
+        return json.dumps(self.to_dict())
+
+    @staticmethod
+    def deserialize(data: str) -> 'Project':
+        """Deserialize a JSON string into a Project."""
+        return Project.from_dict(json.loads(data))
 
     # To File
-    def save(self):
-        pass
+    def save(self, path: Optional[str] = None, full: bool = False):
+        """Write the project to its binary project file.
+
+        When the file already holds this project, only the pages of notes and the map
+        elements marked dirty since the last save are rewritten. A full rewrite happens on
+        the first save, when saving to a new path, or when asked for.
+        """
+        self.path = path or self.path
+        if self.path is None:
+            raise ValueError("Project has no file path to save to.")
+        # A VACUUM holds the file until it finishes; the save is not kept waiting on it
+        self.cancel_compaction()
+        full = full or self._synced_path != self.path
+        self._sync_tags(everything=full)
+        with ProjectStore(self.path) as store:
+            if full:
+                store.write_project(self)
+            elif self.has_unsaved_changes():
+                store.write_changes(self, self._dirty_notes_with_siblings(), self._removed_notes,
+                                    self._dirty_elements, self._removed_elements)
+            self._sync_indexes()
+            if self._search_index is not None:
+                self._sync_search_index()
+                store.write_search_index(self._search_index, full=full or not self._search_index_saved)
+                self._search_index_saved = True
+            compact = store.needs_compaction()
+        if isinstance(self.notes, NoteStore) and self.notes.store.path != self.path:
+            self.notes.rebind(ProjectStore(self.path))
+        self.mark_clean(self.path)
+        if isinstance(self.notes, NoteStore):
+            self.notes.trim()
+        if compact:
+            self.compact_in_background()
+
+    def _dirty_notes_with_siblings(self) -> Set[int]:
+        """Dirty notes plus their siblings and children, whose saved positions shift when a family changes."""
+        note_ids = set(self._dirty_notes)
+        for note_id in self._dirty_notes:
+            note = self.notes[note_id]
+            note_ids.update(child.id for child in note.children)
+            if note.parent is not None:
+                note_ids.update(child.id for child in note.parent.children)
+        return note_ids
+
+    def compact_in_background(self):
+        """Reclaim the space left behind by incremental saves on a background thread.
+
+        The next save cancels an unfinished compaction and starts it again afterwards if
+        the file still needs it.
+        """
+        if self.path is None or (self._compaction is not None and self._compaction.is_alive()):
+            return
+        self._compaction = Compaction(self.path)
+        self._compaction.start()
+
+    def wait_for_compaction(self):
+        if self._compaction is not None:
+            self._compaction.join()
+            self._compaction = None
+
+    def cancel_compaction(self):
+        if self._compaction is not None:
+            self._compaction.cancel()
+            self._compaction = None
+
+    def close(self):
+        """Finish background work and release the project file held by a lazily loaded project."""
+        self.wait_for_compaction()
+        if isinstance(self.notes, NoteStore):
+            self.notes.close()
+
+    def export_json(self, path: str):
+        """Write the project as a JSON document for interoperability."""
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(self.serialize())
 
 # From File
-def load_project(file_path: str):
-    pass
\ No newline at end of file
+@instrument()
+def load_project(file_path: str, lazy: bool = False) -> Project:
+    """Load a binary project file or a JSON export.
+
+    With lazy, a binary project reads note bodies on demand; call Project.close when done.
+    """
+    if is_project_file(file_path):
+        if lazy:
+            return ProjectStore(file_path).read_project(lazy=True)
+        with ProjectStore(file_path) as store:
+            return store.read_project()
+    with open(file_path, encoding="utf-8") as file:
+        return Project.deserialize(file.read())
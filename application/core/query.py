@@ -0,0 +1,132 @@
+from typing import Iterable, Iterator, Mapping, Optional, Tuple
+
+from application.utils import Location
+from .note import Note
+from .spatial import SpatialIndex
+from .tags import TagIndex, tag_filter
+from .timeline import TimelineIndex, TimePoint
+
+# Stand-ins for an open end of the time window, far outside any calendar's range
+_EARLIEST = -(1 << 62)
+_LATEST = 1 << 62
+
+class SpatioTemporalQuery:
+    """Notes inside a region of space during a window of time, optionally carrying tags.
+
+    The region is a box (min_x, min_y, max_x, max_y) or a radius around a Location, and
+    either end of the time window may be left open. Iterating runs the query lazily:
+    candidates come from whichever of the spatial, timeline and tag indexes expects fewer
+    matches, and the remaining conditions are checked note by note as results are yielded.
+    Without a tag index, tags are checked against each note's own tag list.
+    """
+
+    def __init__(self, notes: Mapping[int, Note], spatial: SpatialIndex, timeline: TimelineIndex,
+                 box: Optional[Tuple[float, float, float, float]] = None, center: Optional[Location] = None,
+                 radius: Optional[float] = None, start: Optional[TimePoint] = None, end: Optional[TimePoint] = None,
+                 tags: Iterable[int] = (), tag_index: Optional[TagIndex] = None):
+        if box is not None and center is not None:
+            raise ValueError("Query by a box or by a radius, not both.")
+        if (center is None) != (radius is None):
+            raise ValueError("A radius query needs both a center and a radius.")
+        self.notes = notes
+        self.spatial = spatial
+        self.timeline = timeline
+        self.box = box
+        self.center = center
+        self.radius = radius
+        self.has_time = start is not None or end is not None
+        self.start = timeline._ticks(start) if start is not None else _EARLIEST
+        self.end = timeline._ticks(end) if end is not None else _LATEST
+        self.tags = frozenset(tags)
+        self.tag_index = tag_index if self.tags else None
+        # Bitmap every candidate's tag bitmap must cover; None when a tag is not even registered
+        self._required: Optional[int] = None
+        if self.tag_index is not None and all(tag_id in tag_index.registry for tag_id in self.tags):
+            self._required = tag_index.registry.mask(self.tags)
+
+    def __repr__(self):
+        return (f"SpatioTemporalQuery(box={self.box}, center={self.center}, radius={self.radius}, "
+                f"start={self.start if self.has_time else None}, end={self.end if self.has_time else None}, "
+                f"tags={sorted(self.tags)})")
+
+    @property
+    def has_space(self) -> bool:
+        return self.box is not None or self.center is not None
+
+    def estimate_space(self) -> Optional[int]:
+        """Upper bound on the notes in the region, or None without a spatial condition."""
+        if self.box is not None:
+            return self.spatial.estimate_box(*self.box)
+        if self.center is not None:
+            x, y, radius = self.center.x, self.center.y, self.radius
+            return self.spatial.estimate_box(x - radius, y - radius, x + radius, y + radius)
+        return None
+
+    def estimate_time(self) -> Optional[int]:
+        """Exact number of notes in the time window, or None without a time condition."""
+        return self.timeline.count_overlapping(self.start, self.end) if self.has_time else None
+
+    def estimate_tags(self) -> Optional[int]:
+        """Exact number of notes carrying every tag, or None without tags or a tag index."""
+        if self.tag_index is None:
+            return None
+        return self.tag_index.count(tag_filter(all_of=self.tags)) if self._required is not None else 0
+
+    def plan(self) -> str:
+        """Which index drives the query: "space", "time", "tags", or "scan" over every note."""
+        estimates = [(estimate, plan) for estimate, plan in
+                     ((self.estimate_space(), "space"), (self.estimate_time(), "time"), (self.estimate_tags(), "tags"))
+                     if estimate is not None]
+        return min(estimates, key=lambda item: item[0])[1] if estimates else "scan"
+
+    def __iter__(self) -> Iterator[Note]:
+        plan = self.plan()
+        if plan == "space":
+            candidates = self._in_space()
+            check_space, check_time = False, self.has_time
+        elif plan == "time":
+            candidates = self.timeline.iter_overlapping(self.start, self.end)
+            check_space, check_time = self.has_space, False
+        elif plan == "tags":
+            candidates = map(int, self.tag_index.matching(tag_filter(all_of=self.tags)))
+            check_space, check_time = self.has_space, self.has_time
+        else:
+            candidates = iter(self.notes)
+            check_space = check_time = False
+
+        for note_id in candidates:
+            note = self.notes.get(note_id)
+            if note is None:
+                continue
+            if check_time and not self._in_time(note_id):
+                continue
+            if check_space and not self._contains(note.location):
+                continue
+            if self.tags and not self._has_tags(note):
+                continue
+            yield note
+
+    def _has_tags(self, note: Note) -> bool:
+        if self.tag_index is None:
+            return self.tags.issubset(tag.id for tag in note.tags)
+        required = self._required
+        return required is not None and self.tag_index.mask(note.id) & required == required
+
+    def _in_space(self) -> Iterator[int]:
+        if self.box is not None:
+            return self.spatial.iter_box(*self.box)
+        return self.spatial.iter_radius(self.center, self.radius)
+
+    def _in_time(self, note_id: int) -> bool:
+        if note_id not in self.timeline:
+            return False
+        start, end = self.timeline.span(note_id)
+        return start <= self.end and end >= self.start
+
+    def _contains(self, location: Optional[Location]) -> bool:
+        if location is None:
+            return False
+        if self.box is not None:
+            min_x, min_y, max_x, max_y = self.box
+            return min_x <= location.x <= max_x and min_y <= location.y <= max_y
+        return location.distance_to(self.center) <= self.radius
@@ -0,0 +1,244 @@
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter
+from itertools import chain
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
+import hashlib
+import heapq
+import math
+import re
+
+from .note import Note
+
+_TOKEN = re.compile(r"\w+")
+
+# A word in a tag name counts as this many occurrences in the text
+TAG_WEIGHT = 3
+# Most terms a trailing prefix expands to while typing; the most widely used are kept
+MAX_PREFIX_TERMS = 64
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+def note_terms(note: Note) -> Counter:
+    """Term frequencies of a note: its description without markup, plus its tag names."""
+    terms = Counter(tokenize(note.description.plain_text()) if note.description is not None else ())
+    for tag in note.tags:
+        for term in tokenize(tag.name):
+            terms[term] += TAG_WEIGHT
+    return terms
+
+def note_digest(note: Note) -> str:
+    """Fingerprint of everything a note contributes to the index, to skip re-indexing unchanged notes."""
+    digest = hashlib.sha1(note.description.text.encode() if note.description is not None else b"")
+    for tag in note.tags:
+        digest.update(f"\0{tag.id}\0{tag.name}".encode())
+    return digest.hexdigest()
+
+class SearchIndex:
+    """Inverted index over note descriptions and tag names, ranked with BM25.
+
+    Postings map each term to {note id: frequency}. The sorted term list serves prefix
+    lookups for search-as-you-type, and per-tag note sets serve tag filters. Changes are
+    recorded per term and per note, so a save writes only what an edit touched.
+
+    A restored index keeps each term's postings and each note's term list in their saved
+    encoding until a query or an edit first needs them, so opening it costs little more
+    than reading the rows.
+    """
+
+    def __init__(self):
+        self.postings: Dict[str, Union[Dict[int, int], bytes]] = {}
+        self.terms: List[str] = []
+        # Per note: its terms (or their saved encoding), number of terms, digest and tag ids
+        self.note_terms: Dict[int, Union[List[str], str]] = {}
+        self.lengths: Dict[int, int] = {}
+        self.digests: Dict[int, str] = {}
+        self.note_tags: Dict[int, List[int]] = {}
+        self.tag_notes: Dict[int, Set[int]] = {}
+        self.total_length = 0
+
+        self.dirty_terms: Set[str] = set()
+        self.dirty_notes: Set[int] = set()
+        self.removed_notes: Set[int] = set()
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def __contains__(self, note_id) -> bool:
+        return note_id in self.lengths
+
+    @staticmethod
+    def from_notes(notes: Iterable[Note]) -> 'SearchIndex':
+        index = SearchIndex()
+        for note in notes:
+            index.update(note)
+        return index
+
+    @staticmethod
+    def restore(postings: Iterable[Tuple[str, bytes]],
+                notes: Iterable[Tuple[int, int, str, List[int], str]]) -> 'SearchIndex':
+        """Rebuild a saved index from encoded postings and (id, length, digest, tag ids, terms) note rows."""
+        index = SearchIndex()
+        for note_id, length, digest, tag_ids, terms in notes:
+            index._add_note(note_id, length, digest, tag_ids)
+            index.note_terms[note_id] = terms
+        index.postings = dict(postings)
+        index.terms = sorted(index.postings)
+        return index
+
+    # Saved encodings
+
+    def encode_postings(self, term: str) -> bytes:
+        """Postings of a term as packed (note id, frequency) pairs."""
+        postings = self.postings[term]
+        if isinstance(postings, bytes):
+            return postings
+        return array("q", chain.from_iterable(postings.items())).tobytes()
+
+    def encode_terms(self, note_id: int) -> str:
+        """A note's terms joined by spaces, which tokens never contain."""
+        terms = self.note_terms[note_id]
+        return terms if isinstance(terms, str) else " ".join(terms)
+
+    def document_frequency(self, term: str) -> int:
+        """Number of notes containing a term, without decoding saved postings."""
+        postings = self.postings[term]
+        # Saved postings are packed pairs of 8-byte integers
+        return len(postings) // 16 if isinstance(postings, bytes) else len(postings)
+
+    def _postings(self, term: str) -> Dict[int, int]:
+        postings = self.postings[term]
+        if isinstance(postings, bytes):
+            pairs = array("q")
+            pairs.frombytes(postings)
+            postings = self.postings[term] = dict(zip(pairs[::2], pairs[1::2]))
+        return postings
+
+    # Updates
+
+    def update(self, note: Note):
+        """Index a new note or re-index an edited one; unchanged notes are skipped."""
+        digest = note_digest(note)
+        if self.digests.get(note.id) == digest:
+            return
+        self.discard(note.id)
+        terms = note_terms(note)
+        for term, count in terms.items():
+            if term in self.postings:
+                postings = self._postings(term)
+            else:
+                postings = self.postings[term] = {}
+                insort(self.terms, term)
+            postings[note.id] = count
+            self.dirty_terms.add(term)
+        self._add_note(note.id, sum(terms.values()), digest, [tag.id for tag in note.tags])
+        self.note_terms[note.id] = list(terms)
+        self.dirty_notes.add(note.id)
+        self.removed_notes.discard(note.id)
+
+    def discard(self, note_id: int):
+        """Remove a note from the index if it is there."""
+        if note_id not in self.lengths:
+            return
+        terms = self.note_terms.pop(note_id)
+        for term in terms.split() if isinstance(terms, str) else terms:
+            self._remove_posting(term, note_id)
+        self.total_length -= self.lengths.pop(note_id)
+        del self.digests[note_id]
+        for tag_id in self.note_tags.pop(note_id):
+            self.tag_notes[tag_id].discard(note_id)
+        self.dirty_notes.discard(note_id)
+        self.removed_notes.add(note_id)
+
+    def _add_note(self, note_id: int, length: int, digest: str, tag_ids: List[int]):
+        self.lengths[note_id] = length
+        self.total_length += length
+        self.digests[note_id] = digest
+        self.note_tags[note_id] = tag_ids
+        for tag_id in tag_ids:
+            self.tag_notes.setdefault(tag_id, set()).add(note_id)
+
+    def _remove_posting(self, term: str, note_id: int):
+        postings = self._postings(term)
+        del postings[note_id]
+        if not postings:
+            del self.postings[term]
+            del self.terms[bisect_left(self.terms, term)]
+        self.dirty_terms.add(term)
+
+    def mark_saved(self):
+        self.dirty_terms.clear()
+        self.dirty_notes.clear()
+        self.removed_notes.clear()
+
+    # Queries
+
+    def expand_prefix(self, prefix: str, limit: Optional[int] = MAX_PREFIX_TERMS) -> List[str]:
+        """Indexed terms starting with prefix, in alphabetical order.
+
+        When more than limit terms match, only the limit found in the most notes are kept
+        (ties go to the alphabetically first), so a short prefix still reaches common words.
+        """
+        matches = []
+        terms = self.terms
+        for i in range(bisect_left(terms, prefix), len(terms)):
+            if not terms[i].startswith(prefix):
+                break
+            matches.append(terms[i])
+        if limit is not None and len(matches) > limit:
+            kept = set(heapq.nsmallest(limit, matches, key=lambda term: (-self.document_frequency(term), term)))
+            matches = [term for term in matches if term in kept]
+        return matches
+
+    def search(self, query: str, tags: Iterable[int] = (), limit: Optional[int] = 20,
+               prefix: bool = True, prefix_terms: Optional[int] = MAX_PREFIX_TERMS) -> List[Tuple[int, float]]:
+        """Ids and scores of the best notes containing every query word and carrying every tag.
+
+        With prefix, the last word also matches longer terms, so results follow the user's
+        typing: the prefix_terms of them found in the most notes, or all with None.
+        """
+        candidates: Optional[Set[int]] = None
+        for tag_id in tags:
+            tagged = self.tag_notes.get(tag_id, set())
+            candidates = set(tagged) if candidates is None else candidates & tagged
+
+        words = tokenize(query)
+        scores: Dict[int, float] = {}
+        for i, word in enumerate(words):
+            if prefix and i == len(words) - 1:
+                terms = self.expand_prefix(word, prefix_terms)
+            else:
+                terms = [word] if word in self.postings else []
+            matched: Dict[int, float] = {}
+            for term in terms:
+                for note_id, score in self._score_term(term).items():
+                    matched[note_id] = max(matched.get(note_id, 0.0), score)
+            if candidates is not None:
+                matched = {note_id: score for note_id, score in matched.items() if note_id in candidates}
+            candidates = set(matched)
+            scores = {note_id: scores.get(note_id, 0.0) + score for note_id, score in matched.items()}
+            if not candidates:
+                return []
+
+        if not words:
+            scores = dict.fromkeys(candidates or (), 0.0)
+        best = scores.items()
+        if limit is not None:
+            best = heapq.nlargest(limit, best, key=lambda item: (item[1], -item[0]))
+        else:
+            best = sorted(best, key=lambda item: (-item[1], item[0]))
+        return list(best)
+
+    def _score_term(self, term: str) -> Dict[int, float]:
+        postings = self._postings(term)
+        count = len(self.lengths)
+        average = self.total_length / count if count else 1.0
+        idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+        return {note_id: idf * frequency * (K1 + 1) /
+                (frequency + K1 * (1 - B + B * self.lengths[note_id] / average))
+                for note_id, frequency in postings.items()}
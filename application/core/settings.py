@@ -1,8 +1,11 @@
 from __future__ import annotations
 from dataclasses import dataclass, field
-from typing import Optional, List, Dict
+from typing import Iterator, Optional, List, Dict
 import json
 
+from application.utils.calendar_engine import calendar_edited, compile_calendar, get_calendar_engine
+from application.utils.instrumentation import instrument
+
 @dataclass
 class TimeUnit:
     name: str                      # Name of this unit (e.g., "Month", "Day")
@@ -12,22 +15,35 @@ class TimeUnit:
     names: List[str] = field(default_factory=list)  # Optional names for instances of this unit (e.g., names of months)
     custom_lengths: Dict[str, int] = field(default_factory=dict)  # Specific lengths for named instances (e.g., {"February": 28, "February Leap": 29})
 
+    _stamp = 0  # Latest edit; see calendar_edited
+
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+        calendar_edited(self)
+
     def add_child(self, child: TimeUnit):
         """Sets the child TimeUnit, establishing the relationship."""
         self.child = child
         child.parent = self
 
-    def get_length(self, name: Optional[str] = None) -> int:
-        """Gets the length of this unit based on the name, or defaults."""
-        if name and name in self.custom_lengths:
-            return self.custom_lengths[name]
-        return self.number
+    def get_length(self, name: Optional[str] = None, calendar=None) -> int:
+        """Gets the length of this unit based on the name, or defaults.
 
-    def total_length(self) -> int:
-        """Calculates the total length of this unit, factoring in child units."""
-        if self.child:
-            return self.number * self.child.total_length()
-        return self.number
+        Read from the engine of the calendar (or engine) holding the unit, the active
+        calendar unless one is given.
+        """
+        return get_calendar_engine(calendar).nominal_length(self.name, name)
+
+    def total_length(self, calendar=None) -> int:
+        """Calculates the total length of this unit, factoring in child units; see get_length."""
+        return get_calendar_engine(calendar).total_length(self.name)
+
+    def chain(self) -> Iterator[TimeUnit]:
+        """This unit followed by its children, in order."""
+        current = self
+        while current:
+            yield current
+            current = current.child
 
     def to_dict(self) -> dict:
         """Convert the TimeUnit to a dictionary."""
@@ -70,6 +86,12 @@ class Calendar:
     leap_day_amount: int = 1       # Number of leap days to add
     leap_unit: Optional[TimeUnit] = None  # Unit to which leap day(s) are added (e.g., days)
 
+    _stamp = 0  # Latest edit of the calendar itself; see calendar_edited
+
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+        calendar_edited(self)
+
     def get_unit_hierarchy(self) -> List[Dict[str, str]]:
         """Returns a structured view of the hierarchy for debugging or display."""
         units = []
@@ -81,10 +103,9 @@ class Calendar:
 
     def calculate_leap_year_adjustment(self, year: int) -> int:
         """Returns the additional days for a given year if it's a leap year."""
-        if self.leap_day_freq and year % self.leap_day_freq == 0:
-            return self.leap_day_amount
-        return 0
+        return compile_calendar(self).leap_year_adjustment(year)
 
+    @instrument()
     def to_dict(self) -> dict:
         """Convert the Calendar to a dictionary."""
         return {
@@ -95,6 +116,7 @@ class Calendar:
         }
 
     @staticmethod
+    @instrument()
     def from_dict(data: dict) -> 'Calendar':
         """Reconstruct a Calendar from a dictionary."""
         root_unit = TimeUnit.from_dict(data["time_unit_list"])
@@ -106,19 +128,17 @@ class Calendar:
         )
         # Restore leap_unit if it exists
         if data.get("leap_unit"):
-            current = root_unit
-            while current:
-                if current.name == data["leap_unit"]:
-                    calendar.leap_unit = current
-                    break
-                current = current.child
+            units = {unit.name: unit for unit in reversed(list(root_unit.chain()))}
+            calendar.leap_unit = units.get(data["leap_unit"])
         return calendar
 
+    @instrument()
     def serialize(self) -> str:
         """Serialize the Calendar to a JSON string."""
         return json.dumps(self.to_dict())
 
     @staticmethod
+    @instrument()
     def deserialize(data: str) -> 'Calendar':
         """Deserialize a JSON string into a Calendar."""
         return Calendar.from_dict(json.loads(data))
@@ -207,24 +227,28 @@ class Settings:
     def __init__(self, calendar: Calendar):
         self.calendar = calendar
 
+    @instrument()
     def to_dict(self) -> dict:
         """Convert Settings to a dictionary."""
         return {
-            "calendar": self.calendar
+            "calendar": self.calendar.to_dict()
         }
 
     @staticmethod
+    @instrument()
     def from_dict(data: dict) -> 'Settings':
         """Reconstruct Settings from a dictionary."""
         return Settings(
-            calendar=Calendar.from_dict(data)
+            calendar=Calendar.from_dict(data["calendar"])
         )
 
+    @instrument()
     def serialize(self) -> str:
         """Serialize the Calendar to a JSON string."""
         return json.dumps(self.to_dict())
 
     @staticmethod
+    @instrument()
     def deserialize(data: str) -> 'Settings':
         """Deserialize a JSON string into a Calendar."""
         return Settings.from_dict(json.loads(data))
\ No newline at end of file
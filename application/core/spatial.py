@@ -0,0 +1,210 @@
+import heapq
+import math
+from typing import Dict, Hashable, Iterable, Iterator, List, Set, Tuple
+
+from application.utils import Location
+from .map import MapElement
+from .note import Note
+
+Cell = Tuple[int, int]
+
+class SpatialIndex:
+    """Uniform grid over the x/y plane mapping keys (note or map element ids) to Locations.
+
+    Moving an entry only touches the two cells involved. Box queries visit the covered
+    cells, radius and nearest-neighbour queries grow outwards ring by ring from the query
+    point. Distances are the full x/y/z distance used by Location.distance_to.
+    """
+
+    def __init__(self, cell_size: float = 100.0):
+        if cell_size <= 0:
+            raise ValueError("Cell size must be positive.")
+        self.cell_size = cell_size
+        self._cells: Dict[Cell, Set[Hashable]] = {}
+        self._positions: Dict[Hashable, Tuple[float, float, float]] = {}
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __contains__(self, key: Hashable):
+        return key in self._positions
+
+    def _cell(self, x: float, y: float) -> Cell:
+        return math.floor(x / self.cell_size), math.floor(y / self.cell_size)
+
+    # Building and editing
+
+    @staticmethod
+    def from_notes(notes: Iterable[Note], cell_size: float = 100.0) -> 'SpatialIndex':
+        """Index notes by id, skipping notes without a location."""
+        index = SpatialIndex(cell_size)
+        for note in notes:
+            if note.location is not None:
+                index.insert(note.id, note.location)
+        return index
+
+    @staticmethod
+    def from_map_elements(elements: Iterable[MapElement], cell_size: float = 100.0) -> 'SpatialIndex':
+        """Index map elements by id."""
+        index = SpatialIndex(cell_size)
+        for element in elements:
+            index.insert(element.id, element.location)
+        return index
+
+    def insert(self, key: Hashable, location: Location):
+        """Add an entry, or move it if the key is already indexed."""
+        self.insert_point(key, location.x, location.y, location.z)
+
+    def insert_point(self, key: Hashable, x: float, y: float, z: float = 0.0):
+        """Add or move an entry by raw coordinates."""
+        old = self._positions.get(key)
+        cell = self._cell(x, y)
+        if old is not None:
+            old_cell = self._cell(old[0], old[1])
+            if old_cell != cell:
+                self._remove_from_cell(key, old_cell)
+                self._cells.setdefault(cell, set()).add(key)
+        else:
+            self._cells.setdefault(cell, set()).add(key)
+        self._positions[key] = (x, y, z)
+
+    def insert_many(self, keys: Iterable[Hashable], xs: Iterable[float], ys: Iterable[float], z: float = 0.0):
+        """Add many entries from coordinate columns."""
+        for key, x, y in zip(keys, xs, ys):
+            self.insert_point(key, x, y, z)
+
+    def move(self, key: Hashable, location: Location):
+        """Update the position of an indexed entry."""
+        if key not in self._positions:
+            raise KeyError(key)
+        self.insert_point(key, location.x, location.y, location.z)
+
+    def remove(self, key: Hashable):
+        """Drop an entry. Raises KeyError if it is not indexed."""
+        x, y, _ = self._positions.pop(key)
+        self._remove_from_cell(key, self._cell(x, y))
+
+    def discard(self, key: Hashable):
+        """Drop an entry if present."""
+        if key in self._positions:
+            self.remove(key)
+
+    def _remove_from_cell(self, key: Hashable, cell: Cell):
+        members = self._cells[cell]
+        members.discard(key)
+        if not members:
+            del self._cells[cell]
+
+    def position(self, key: Hashable) -> Location:
+        return Location(*self._positions[key])
+
+    # Queries
+
+    def _cells_in_range(self, min_cx: int, min_cy: int, max_cx: int, max_cy: int) -> Iterator[Set[Hashable]]:
+        """Occupied cells inside an inclusive cell-coordinate rectangle."""
+        if (max_cx - min_cx + 1) * (max_cy - min_cy + 1) > len(self._cells):
+            # Sparse grid: cheaper to filter the occupied cells than to probe every coordinate
+            for (cx, cy), members in self._cells.items():
+                if min_cx <= cx <= max_cx and min_cy <= cy <= max_cy:
+                    yield members
+            return
+        for cx in range(min_cx, max_cx + 1):
+            for cy in range(min_cy, max_cy + 1):
+                members = self._cells.get((cx, cy))
+                if members:
+                    yield members
+
+    def estimate_box(self, min_x: float, min_y: float, max_x: float, max_y: float) -> int:
+        """Upper bound on the number of keys in a box: the entries of every cell it touches."""
+        min_cx, min_cy = self._cell(min_x, min_y)
+        max_cx, max_cy = self._cell(max_x, max_y)
+        return sum(len(members) for members in self._cells_in_range(min_cx, min_cy, max_cx, max_cy))
+
+    def iter_box(self, min_x: float, min_y: float, max_x: float, max_y: float) -> Iterator[Hashable]:
+        """Yield keys whose x/y position lies inside the given axis-aligned box (inclusive)."""
+        min_cx, min_cy = self._cell(min_x, min_y)
+        max_cx, max_cy = self._cell(max_x, max_y)
+        positions = self._positions
+        for members in self._cells_in_range(min_cx, min_cy, max_cx, max_cy):
+            for key in members:
+                x, y, _ = positions[key]
+                if min_x <= x <= max_x and min_y <= y <= max_y:
+                    yield key
+
+    def in_box(self, min_x: float, min_y: float, max_x: float, max_y: float) -> List[Hashable]:
+        """Keys whose x/y position lies inside the given axis-aligned box (inclusive)."""
+        return list(self.iter_box(min_x, min_y, max_x, max_y))
+
+    def iter_radius(self, location: Location, radius: float) -> Iterator[Hashable]:
+        """Yield keys within the given distance of a location."""
+        qx, qy, qz = location.x, location.y, location.z
+        min_cx, min_cy = self._cell(qx - radius, qy - radius)
+        max_cx, max_cy = self._cell(qx + radius, qy + radius)
+        limit = radius * radius
+        positions = self._positions
+        for members in self._cells_in_range(min_cx, min_cy, max_cx, max_cy):
+            for key in members:
+                x, y, z = positions[key]
+                dx, dy, dz = x - qx, y - qy, z - qz
+                if dx * dx + dy * dy + dz * dz <= limit:
+                    yield key
+
+    def in_radius(self, location: Location, radius: float) -> List[Hashable]:
+        """Keys within the given distance of a location."""
+        return list(self.iter_radius(location, radius))
+
+    def nearest(self, location: Location, k: int = 1) -> List[Tuple[Hashable, float]]:
+        """The k closest entries to a location as (key, distance) pairs, closest first."""
+        if k <= 0 or not self._positions:
+            return []
+        qx, qy, qz = location.x, location.y, location.z
+        center_x, center_y = self._cell(qx, qy)
+        positions = self._positions
+
+        # Max-heap of the best k squared distances seen so far, stored negated
+        best: List[Tuple[float, int, Hashable]] = []
+        counter = 0
+        ring = 0
+        while True:
+            if (2 * ring + 1) ** 2 > 4 * len(self._cells):
+                # The rings have outgrown the occupied area, finish with a direct scan
+                best = []
+                candidates = positions.items()
+                ring_keys = None
+            else:
+                ring_keys = self._ring(center_x, center_y, ring)
+                candidates = ((key, positions[key]) for key in ring_keys)
+
+            for key, (x, y, z) in candidates:
+                dx, dy, dz = x - qx, y - qy, z - qz
+                distance = dx * dx + dy * dy + dz * dz
+                if len(best) < k:
+                    heapq.heappush(best, (-distance, counter, key))
+                elif distance < -best[0][0]:
+                    heapq.heapreplace(best, (-distance, counter, key))
+                counter += 1
+
+            if ring_keys is None:
+                break
+            # Anything outside this ring is at least ring * cell_size away on the x/y plane
+            reach = ring * self.cell_size
+            if len(best) == k and -best[0][0] <= reach * reach:
+                break
+            if len(best) == len(positions):
+                break
+            ring += 1
+
+        return [(key, math.sqrt(-negative)) for negative, _, key in sorted(best, reverse=True)]
+
+    def _ring(self, center_x: int, center_y: int, ring: int) -> Iterator[Hashable]:
+        """Keys in the cells at Chebyshev distance `ring` from the center cell."""
+        cells = self._cells
+        if ring == 0:
+            yield from cells.get((center_x, center_y), ())
+            return
+        for cx in range(center_x - ring, center_x + ring + 1):
+            yield from cells.get((cx, center_y - ring), ())
+            yield from cells.get((cx, center_y + ring), ())
+        for cy in range(center_y - ring + 1, center_y + ring):
+            yield from cells.get((center_x - ring, cy), ())
+            yield from cells.get((center_x + ring, cy), ())
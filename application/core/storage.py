@@ -0,0 +1,448 @@
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Mapping, Optional, Set
+import gc
+import json
+import sqlite3
+import struct
+import threading
+
+from application.utils import Location, Timestamp, Timerange, Description, LegendsImage
+from application.utils.instrumentation import instrument
+from .map import MapElement
+from .note import Note, Tag
+from .search import SearchIndex
+from .settings import Settings
+from .tags import TagRegistry
+
+if TYPE_CHECKING:
+    from .project import Project
+
+FORMAT_VERSION = 1
+SQLITE_HEADER = b"SQLite format 3\x00"
+
+# Notes are grouped into pages by id; each page is one row of packed headers and one of bodies
+PAGE_SIZE = 512
+
+# id, parent_id, position, x, y, z, start day/month/year, end day/month/year, flags
+NOTE_HEADER = struct.Struct("<qqidddiiqiiqB")
+HAS_PARENT = 1
+HAS_LOCATION = 2
+HAS_TIMERANGE = 4
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS note_headers (page INTEGER PRIMARY KEY, data BLOB);
+CREATE TABLE IF NOT EXISTS note_bodies (page INTEGER PRIMARY KEY, data TEXT);
+CREATE TABLE IF NOT EXISTS map_elements (id INTEGER PRIMARY KEY, type TEXT, data TEXT);
+CREATE TABLE IF NOT EXISTS tags (id INTEGER PRIMARY KEY, name TEXT, color INTEGER);
+CREATE TABLE IF NOT EXISTS search_postings (term TEXT PRIMARY KEY, data BLOB);
+CREATE TABLE IF NOT EXISTS search_notes (note_id INTEGER PRIMARY KEY, length INTEGER, digest TEXT, tags TEXT, terms TEXT);
+CREATE TABLE IF NOT EXISTS search_stale (note_id INTEGER PRIMARY KEY);
+"""
+
+_SEARCH_TABLES = ("search_postings", "search_notes", "search_stale")
+
+@contextmanager
+def gc_paused():
+    """Suspend the cyclic garbage collector while allocating many long-lived objects.
+
+    Bulk loads create hundreds of thousands of objects that all survive, so every
+    automatic collection in between is wasted work that grows with the project.
+    """
+    was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if was_enabled:
+            gc.enable()
+
+def is_project_file(path: str) -> bool:
+    """Whether a file is a binary (SQLite) project rather than a JSON export."""
+    with open(path, "rb") as file:
+        return file.read(len(SQLITE_HEADER)) == SQLITE_HEADER
+
+def page_of(note_id: int) -> int:
+    return note_id // PAGE_SIZE
+
+def sibling_positions(notes: Iterable[Note]) -> Dict[int, int]:
+    """Index of each note among its parent's children, so child order survives a save.
+
+    Roots get 0 and come back ordered by id. Each parent's children are indexed once,
+    so this is linear in the notes given plus their sibling lists.
+    """
+    positions = {}
+    families: Dict[int, Dict[int, int]] = {}
+    for note in notes:
+        parent = note.parent
+        if parent is None:
+            positions[note.id] = 0
+            continue
+        family = families.get(parent.id)
+        if family is None:
+            family = families[parent.id] = {child.id: i for i, child in enumerate(parent.children)}
+        positions[note.id] = family.get(note.id, 0)
+    return positions
+
+def page_members(notes: Dict[int, Note], page: int) -> List[Note]:
+    """Notes currently belonging to a page, in id order."""
+    first = page * PAGE_SIZE
+    return [notes[note_id] for note_id in range(first, first + PAGE_SIZE) if note_id in notes]
+
+def pack_header(note: Note, position: int) -> bytes:
+    """Fixed-size binary record with everything needed to place a note in space, time and the tree."""
+    flags = 0
+    parent_id = 0
+    if note.parent is not None:
+        flags |= HAS_PARENT
+        parent_id = note.parent.id
+    x = y = z = 0.0
+    if note.location is not None:
+        flags |= HAS_LOCATION
+        x, y, z = note.location.x, note.location.y, note.location.z
+    start = end = (0, 0, 0)
+    if note.timerange is not None:
+        flags |= HAS_TIMERANGE
+        start = (note.timerange.start.day, note.timerange.start.month, note.timerange.start.year)
+        end = (note.timerange.end.day, note.timerange.end.month, note.timerange.end.year)
+    return NOTE_HEADER.pack(note.id, parent_id, position, x, y, z, *start, *end, flags)
+
+def note_body(note: Note) -> list:
+    """The variable-size part of a note: description, images and tag ids."""
+    return [
+        note.description.text if note.description is not None else None,
+        note.thumbnail.to_dict() if note.thumbnail is not None else None,
+        [image.to_dict() for image in note.attached_images] if note.attached_images else None,
+        [tag.id for tag in note.tags] if note.tags else None
+    ]
+
+def restore_note(header: tuple, body: list, tags: Mapping[int, Tag]) -> Note:
+    """Build an unlinked Note from its header and body; parent and children are wired up by the caller."""
+    (id, _, _, x, y, z, start_day, start_month, start_year, end_day, end_month, end_year, flags) = header
+    description, thumbnail, attached_images, tag_ids = body
+    return Note._restore(
+        id,
+        Location(x, y, z) if flags & HAS_LOCATION else None,
+        Timerange(Timestamp(start_day, start_month, start_year),
+                  Timestamp(end_day, end_month, end_year)) if flags & HAS_TIMERANGE else None,
+        Description(description) if description is not None else None,
+        LegendsImage.from_dict(thumbnail) if thumbnail else None,
+        [LegendsImage.from_dict(image) for image in attached_images] if attached_images else [],
+        [tags[tag_id] for tag_id in tag_ids] if tag_ids else []
+    )
+
+def link_notes(notes: Dict[int, Note], headers: Iterable[tuple]):
+    """Attach children to parents, in sibling order, from unpacked headers."""
+    families: Dict[int, List[tuple]] = {}
+    for header in headers:
+        if header[12] & HAS_PARENT:
+            families.setdefault(header[1], []).append((header[2], header[0]))
+    for parent_id, members in families.items():
+        parent = notes.get(parent_id)
+        if parent is None:
+            continue
+        # Already in order unless siblings were saved out of sequence, which timsort handles in O(n)
+        members.sort()
+        children = parent.children
+        for _, child_id in members:
+            child = notes[child_id]
+            child.parent = parent
+            children.append(child)
+
+class Compaction:
+    """ProjectStore.compact on a background thread, on its own connection so a save can cancel it.
+
+    An interrupted VACUUM rolls back and leaves the file as it was.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.connection = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.cancelled = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def is_alive(self) -> bool:
+        return self._thread.is_alive()
+
+    def join(self):
+        self._thread.join()
+
+    def cancel(self):
+        """Stop the compaction as soon as possible and wait until its connection is closed."""
+        self.cancelled = True
+        # interrupt only stops a running statement, so keep at it until the thread is done
+        while self._thread.is_alive():
+            try:
+                self.connection.interrupt()
+            except sqlite3.ProgrammingError:
+                pass
+            self._thread.join(0.01)
+
+    def run(self):
+        try:
+            for statement in ("PRAGMA wal_checkpoint(TRUNCATE)", "VACUUM"):
+                if self.cancelled:
+                    return
+                self.connection.execute(statement)
+        finally:
+            self.connection.close()
+
+    def _run(self):
+        try:
+            self.run()
+        except sqlite3.OperationalError:
+            if not self.cancelled:
+                raise
+
+class ProjectStore:
+    """A project file: one SQLite database holding notes in pages, plus map elements and tags.
+
+    Notes are stored flat with their parent id and sibling position. Each page of
+    PAGE_SIZE ids is one row of fixed-size packed headers and one row of JSON bodies, so
+    a save or load touches a few hundred rows rather than one row (or dict) per note.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        # A generous busy timeout lets a store wait out another connection's write. Stores are opened
+        # on I/O threads (see async_io), and sqlite3 serializes access to a shared connection
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(_SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self) -> 'ProjectStore':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write_project(self, project: 'Project'):
+        """Replace the file contents with the whole project in a single transaction."""
+        notes = project.notes
+        pages: Dict[int, List[Note]] = {}
+        for note_id in sorted(notes):
+            pages.setdefault(page_of(note_id), []).append(notes[note_id])
+
+        with self.connection, gc_paused():
+            cursor = self.connection.cursor()
+            # A search index that is not written now would be stale, so it is dropped and rebuilt when needed
+            for table in ("meta", "note_headers", "note_bodies", "map_elements", "tags") + _SEARCH_TABLES:
+                cursor.execute(f"DELETE FROM {table}")
+            self._write_meta(cursor, project)
+            self._write_pages(cursor, pages, sibling_positions(notes.values()))
+            self._write_tags(cursor, project.tags.values())
+            self._write_map_elements(cursor, project.map_elements.values())
+
+    def write_changes(self, project: 'Project', note_ids: Set[int], removed_note_ids: Set[int],
+                      element_ids: Set[int], removed_element_ids: Set[int]):
+        """Rewrite only the pages and map elements touched since the last save, in one transaction."""
+        notes = project.notes
+        pages = {page: page_members(notes, page) for page in {page_of(i) for i in note_ids | removed_note_ids}}
+
+        with self.connection, gc_paused():
+            cursor = self.connection.cursor()
+            self._write_meta(cursor, project)
+            written = [note for members in pages.values() for note in members]
+            self._write_pages(cursor, {page: members for page, members in pages.items() if members},
+                              sibling_positions(written))
+            emptied = [(page,) for page, members in pages.items() if not members]
+            cursor.executemany("DELETE FROM note_headers WHERE page = ?", emptied)
+            cursor.executemany("DELETE FROM note_bodies WHERE page = ?", emptied)
+            self._write_tags(cursor, project.tags.values())
+            self._write_map_elements(cursor, (project.map_elements[element_id] for element_id in element_ids
+                                              if element_id in project.map_elements))
+            cursor.executemany("DELETE FROM map_elements WHERE id = ?", ((i,) for i in removed_element_ids))
+            # Edits the saved search index has not seen yet, caught up when it is next loaded
+            cursor.executemany("INSERT OR IGNORE INTO search_stale (note_id) VALUES (?)",
+                               ((i,) for i in note_ids | removed_note_ids))
+
+    def write_search_index(self, index: SearchIndex, full: bool = False):
+        """Write the terms and notes of the index changed since its last save, or all of it.
+
+        Only call this once the index has caught up with every note written to the file.
+        """
+        with self.connection:
+            cursor = self.connection.cursor()
+            if full:
+                for table in _SEARCH_TABLES:
+                    cursor.execute(f"DELETE FROM {table}")
+                terms, note_ids = index.postings.keys(), index.lengths.keys()
+            else:
+                cursor.execute("DELETE FROM search_stale")
+                terms, note_ids = index.dirty_terms, index.dirty_notes
+                cursor.executemany("DELETE FROM search_postings WHERE term = ?",
+                                   ((term,) for term in terms if term not in index.postings))
+                cursor.executemany("DELETE FROM search_notes WHERE note_id = ?",
+                                   ((note_id,) for note_id in index.removed_notes))
+            cursor.executemany("INSERT OR REPLACE INTO search_postings (term, data) VALUES (?, ?)", (
+                (term, index.encode_postings(term)) for term in terms if term in index.postings))
+            cursor.executemany(
+                "INSERT OR REPLACE INTO search_notes (note_id, length, digest, tags, terms) VALUES (?, ?, ?, ?, ?)", (
+                    (note_id, index.lengths[note_id], index.digests[note_id], " ".join(map(str, index.note_tags[note_id])),
+                     index.encode_terms(note_id))
+                    for note_id in note_ids if note_id in index.lengths))
+        index.mark_saved()
+
+    def read_search_index(self) -> tuple:
+        """The saved search index, or None if there is none, and the ids of notes edited since it was written."""
+        stale = {note_id for (note_id,) in self.connection.execute("SELECT note_id FROM search_stale")}
+        with gc_paused():
+            notes = [(note_id, length, digest, [int(tag_id) for tag_id in tags.split()], terms)
+                     for note_id, length, digest, tags, terms
+                     in self.connection.execute("SELECT note_id, length, digest, tags, terms FROM search_notes")]
+            if not notes:
+                return None, stale
+            postings = self.connection.execute("SELECT term, data FROM search_postings")
+            return SearchIndex.restore(postings, notes), stale
+
+    @staticmethod
+    def _write_meta(cursor: sqlite3.Cursor, project: 'Project'):
+        cursor.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", [
+            ("format_version", str(FORMAT_VERSION)),
+            ("id", json.dumps(project.id)),
+            ("name", project.name),
+            ("settings", json.dumps(project.settings.to_dict())),
+        ])
+
+    @staticmethod
+    def _write_pages(cursor: sqlite3.Cursor, pages: Dict[int, List[Note]], positions: Dict[int, int]):
+        cursor.executemany("INSERT OR REPLACE INTO note_headers (page, data) VALUES (?, ?)", (
+            (page, b"".join([pack_header(note, positions[note.id]) for note in members]))
+            for page, members in pages.items()))
+        cursor.executemany("INSERT OR REPLACE INTO note_bodies (page, data) VALUES (?, ?)", (
+            (page, json.dumps([note_body(note) for note in members]))
+            for page, members in pages.items()))
+
+    @staticmethod
+    def _write_tags(cursor: sqlite3.Cursor, tags: Iterable[Tag]):
+        # Notes store only tag ids, so every registered tag is written once here
+        cursor.executemany("INSERT OR REPLACE INTO tags (id, name, color) VALUES (?, ?, ?)",
+                           ((tag.id, tag.name, tag.color) for tag in tags))
+
+    @staticmethod
+    def _write_map_elements(cursor: sqlite3.Cursor, elements: Iterable[MapElement]):
+        cursor.executemany("INSERT OR REPLACE INTO map_elements (id, type, data) VALUES (?, ?, ?)", (
+            (element.id, type(element).__name__, json.dumps(element.to_dict())) for element in elements))
+
+    def needs_compaction(self, threshold: float = 0.25, min_pages: int = 256) -> bool:
+        """Whether enough of the file is free pages left behind by rewrites to be worth a VACUUM."""
+        page_count = self.connection.execute("PRAGMA page_count").fetchone()[0]
+        free_pages = self.connection.execute("PRAGMA freelist_count").fetchone()[0]
+        return page_count >= min_pages and free_pages / page_count > threshold
+
+    @staticmethod
+    def compact(path: str):
+        """Fold the write-ahead log back into the file and rebuild it without free pages."""
+        Compaction(path).run()
+
+    def read_meta(self) -> Dict[str, str]:
+        return dict(self.connection.execute("SELECT key, value FROM meta"))
+
+    def read_tags(self) -> TagRegistry:
+        return TagRegistry(Tag(id, name, color) for id, name, color
+                           in self.connection.execute("SELECT id, name, color FROM tags ORDER BY id"))
+
+    def read_map_elements(self) -> Dict[int, MapElement]:
+        elements = (MapElement.from_dict(json.loads(data))
+                    for (data,) in self.connection.execute("SELECT data FROM map_elements"))
+        return {element.id: element for element in elements}
+
+    def read_notes(self, tags: Optional[TagRegistry] = None) -> Dict[int, Note]:
+        with gc_paused():
+            return self._read_notes(tags if tags is not None else self.read_tags())
+
+    def read_headers(self) -> Dict[int, List[tuple]]:
+        """Unpacked note headers for every page."""
+        return {page: list(NOTE_HEADER.iter_unpack(data))
+                for page, data in self.connection.execute("SELECT page, data FROM note_headers ORDER BY page")}
+
+    def read_page(self, page: int) -> tuple:
+        """Packed headers and JSON bodies of one page."""
+        row = self.connection.execute(
+            "SELECT h.data, b.data FROM note_headers h JOIN note_bodies b ON b.page = h.page WHERE h.page = ?",
+            (page,)).fetchall()
+        if not row:
+            raise KeyError(page)
+        return row[0]
+
+    def iter_note_pages(self, headers: Dict[int, List[tuple]],
+                        tags: Optional[TagRegistry] = None) -> Iterator[List[Note]]:
+        """Unlinked notes of each page in page order, for loading a project progressively."""
+        tags = tags if tags is not None else self.read_tags()
+        for page, data in self.connection.execute("SELECT page, data FROM note_bodies ORDER BY page"):
+            with gc_paused():
+                notes = [restore_note(header, body, tags) for header, body in zip(headers[page], json.loads(data))]
+            yield notes
+
+    def _read_notes(self, tags: TagRegistry) -> Dict[int, Note]:
+        headers = self.read_headers()
+        notes = {}
+        for page, data in self.connection.execute("SELECT page, data FROM note_bodies ORDER BY page"):
+            for header, body in zip(headers[page], json.loads(data)):
+                notes[header[0]] = restore_note(header, body, tags)
+        link_notes(notes, (header for page in headers.values() for header in page))
+        return notes
+
+    def read_subtree(self, root_id: int) -> Note:
+        """Load one note and its descendants, decoding only the pages they live on."""
+        pages = self.read_headers()
+        families: Dict[int, List[int]] = {}
+        known = set()
+        for page in pages.values():
+            for header in page:
+                known.add(header[0])
+                if header[12] & HAS_PARENT:
+                    families.setdefault(header[1], []).append(header[0])
+        if root_id not in known:
+            raise KeyError(root_id)
+
+        wanted = set()
+        stack = [root_id]
+        while stack:
+            note_id = stack.pop()
+            wanted.add(note_id)
+            stack.extend(families.get(note_id, ()))
+
+        tags = self.read_tags()
+        notes = {}
+        with gc_paused():
+            for page in sorted({page_of(note_id) for note_id in wanted}):
+                (data,) = self.connection.execute("SELECT data FROM note_bodies WHERE page = ?", (page,)).fetchone()
+                for header, body in zip(pages[page], json.loads(data)):
+                    if header[0] in wanted:
+                        notes[header[0]] = restore_note(header, body, tags)
+            # The root's parent is not loaded, so link_notes leaves it a root
+            link_notes(notes, (header for page in pages.values() for header in page if header[0] in wanted))
+        return notes[root_id]
+
+    def read_settings(self, meta: Dict[str, str]) -> Settings:
+        """The project settings, after checking the file format."""
+        if int(meta.get("format_version", 0)) > FORMAT_VERSION:
+            raise ValueError(f"{self.path} was saved by a newer version of Legends.")
+        return Settings.from_dict(json.loads(meta["settings"]))
+
+    @instrument()
+    def read_project(self, lazy: bool = False, max_bytes: int = 64 * 1024 * 1024) -> 'Project':
+        """Load the project.
+
+        With lazy, only note headers are read now; the returned project keeps this store
+        open and reads note bodies from it as they are used (see NoteStore).
+        """
+        from .note_store import NoteStore
+        from .project import Project
+
+        meta = self.read_meta()
+        settings = self.read_settings(meta)
+        tags = self.read_tags()
+        notes = NoteStore(self, max_bytes, tags) if lazy else self.read_notes(tags)
+        project = Project(json.loads(meta["id"]), meta["name"], settings, self.read_map_elements(),
+                          notes, path=self.path, tags=tags)
+        project.mark_clean(self.path)
+        return project
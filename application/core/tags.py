@@ -0,0 +1,276 @@
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, Iterator, List, Mapping, Union
+import numpy as np
+
+from .note import Note, Tag
+
+TagRef = Union[Tag, int]
+
+def _tag_id(tag: TagRef) -> int:
+    return tag.id if isinstance(tag, Tag) else tag
+
+class TagRegistry(Mapping):
+    """Every tag of a project exactly once, by id.
+
+    Notes share the registry's Tag objects, so renaming or recolouring a tag shows on
+    every note carrying it. Each tag also gets a fixed bit, in order of first use, for
+    the per-note tag bitmaps of TagIndex.
+    """
+
+    def __init__(self, tags: Iterable[Tag] = ()):
+        self._tags: Dict[int, Tag] = {}
+        self._bits: Dict[int, int] = {}
+        self._by_bit: List[int] = []
+        for tag in tags:
+            self.intern(tag)
+
+    def __getitem__(self, tag_id: int) -> Tag:
+        return self._tags[tag_id]
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._tags)
+
+    def __len__(self) -> int:
+        return len(self._tags)
+
+    def __repr__(self):
+        return f"TagRegistry({list(self._tags.values())})"
+
+    def intern(self, tag: Tag) -> Tag:
+        """The registered Tag with this tag's id, registering the tag if it is new."""
+        existing = self._tags.get(tag.id)
+        if existing is not None:
+            return existing
+        self._tags[tag.id] = tag
+        self._bits[tag.id] = len(self._by_bit)
+        self._by_bit.append(tag.id)
+        return tag
+
+    def intern_note(self, note: Note):
+        """Point a note's tags at the registered Tag objects."""
+        tags = [self.intern(tag) for tag in note.tags]
+        if any(tag is not original for tag, original in zip(tags, note.tags)):
+            note.tags = tags
+
+    def bit(self, tag: TagRef) -> int:
+        return self._bits[_tag_id(tag)]
+
+    def mask(self, tags: Iterable[TagRef]) -> int:
+        """Bitmap of a set of registered tags."""
+        mask = 0
+        for tag in tags:
+            mask |= 1 << self._bits[_tag_id(tag)]
+        return mask
+
+    def tag_ids(self, mask: int) -> List[int]:
+        """Ids of the tags in a bitmap, in bit order."""
+        tag_ids = []
+        while mask:
+            low = mask & -mask
+            tag_ids.append(self._by_bit[low.bit_length() - 1])
+            mask ^= low
+        return tag_ids
+
+    def to_dict(self) -> List[dict]:
+        """Serialize the registry as a list of tag dictionaries, in bit order."""
+        return [tag.to_dict() for tag in self._tags.values()]
+
+    @staticmethod
+    def from_dict(data: List[dict]) -> 'TagRegistry':
+        """Reconstruct a TagRegistry from a list of tag dictionaries."""
+        return TagRegistry(Tag.from_dict(tag) for tag in data)
+
+class TagFilter(ABC):
+    """A boolean expression over tags, combined with &, | and ~ and evaluated by TagIndex."""
+
+    def __and__(self, other: 'TagFilter') -> 'TagFilter':
+        return _And(self, other)
+
+    def __or__(self, other: 'TagFilter') -> 'TagFilter':
+        return _Or(self, other)
+
+    def __invert__(self) -> 'TagFilter':
+        return _Not(self)
+
+    @abstractmethod
+    def evaluate(self, index: 'TagIndex') -> np.ndarray:
+        """Bitmap words of the matching rows; may contain free rows, which TagIndex masks out."""
+
+class _All(TagFilter):
+    def __repr__(self):
+        return "everything"
+
+    def evaluate(self, index: 'TagIndex') -> np.ndarray:
+        return index._live.copy()
+
+class _Has(TagFilter):
+    def __init__(self, tag_id: int):
+        self.tag_id = tag_id
+
+    def __repr__(self):
+        return f"has({self.tag_id})"
+
+    def evaluate(self, index: 'TagIndex') -> np.ndarray:
+        column = index._column(self.tag_id)
+        return column.copy() if column is not None else np.zeros_like(index._live)
+
+class _And(TagFilter):
+    def __init__(self, left: TagFilter, right: TagFilter):
+        self.left, self.right = left, right
+
+    def __repr__(self):
+        return f"({self.left!r} & {self.right!r})"
+
+    def evaluate(self, index: 'TagIndex') -> np.ndarray:
+        return np.bitwise_and(self.left.evaluate(index), self.right.evaluate(index))
+
+class _Or(TagFilter):
+    def __init__(self, left: TagFilter, right: TagFilter):
+        self.left, self.right = left, right
+
+    def __repr__(self):
+        return f"({self.left!r} | {self.right!r})"
+
+    def evaluate(self, index: 'TagIndex') -> np.ndarray:
+        return np.bitwise_or(self.left.evaluate(index), self.right.evaluate(index))
+
+class _Not(TagFilter):
+    def __init__(self, operand: TagFilter):
+        self.operand = operand
+
+    def __repr__(self):
+        return f"~{self.operand!r}"
+
+    def evaluate(self, index: 'TagIndex') -> np.ndarray:
+        return np.invert(self.operand.evaluate(index))
+
+def has(tag: TagRef) -> TagFilter:
+    """Notes carrying this tag."""
+    return _Has(_tag_id(tag))
+
+def tag_filter(all_of: Iterable[TagRef] = (), any_of: Iterable[TagRef] = (),
+               none_of: Iterable[TagRef] = ()) -> TagFilter:
+    """Notes carrying every tag of all_of, at least one of any_of (if given) and none of none_of."""
+    result: TagFilter = _All()
+    for tag in all_of:
+        result = result & has(tag)
+    any_of = list(any_of)
+    if any_of:
+        alternatives = has(any_of[0])
+        for tag in any_of[1:]:
+            alternatives = alternatives | has(tag)
+        result = result & alternatives
+    for tag in none_of:
+        result = result & ~has(tag)
+    return result
+
+class TagIndex:
+    """Tag bitmaps of every note, for evaluating tag filters over a whole project at once.
+
+    Each note holds a row. Per tag, a column of 64-bit words has the bit of every row
+    carrying the tag, so a filter costs a few numpy operations over n / 64 words however
+    many notes match. Each note's own tags are kept as one integer bitmap over the
+    registry's bits, so checking a single note is a mask comparison.
+    """
+
+    def __init__(self, registry: TagRegistry):
+        self.registry = registry
+        self.rows = 0
+        self._rows: Dict[int, int] = {}
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._free: List[int] = []
+        self._masks: Dict[int, int] = {}
+        self._columns: Dict[int, np.ndarray] = {}
+        self._live = np.zeros(0, dtype=np.uint64)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, note_id) -> bool:
+        return note_id in self._rows
+
+    @staticmethod
+    def from_notes(notes: Iterable[Note], registry: TagRegistry) -> 'TagIndex':
+        index = TagIndex(registry)
+        for note in notes:
+            index.update(note)
+        return index
+
+    def mask(self, note_id: int) -> int:
+        """Bitmap of a note's tags over the registry's bits."""
+        return self._masks.get(note_id, 0)
+
+    # Updates
+
+    def update(self, note: Note):
+        """Index a new note or re-read an edited note's tags, registering tags not seen before."""
+        self.registry.intern_note(note)
+        tag_ids = {tag.id for tag in note.tags}
+        mask = self.registry.mask(tag_ids)
+        row = self._rows.get(note.id)
+        if row is None:
+            row = self._allocate(note.id)
+        elif self._masks[note.id] == mask:
+            return
+        old = self._masks.get(note.id, 0)
+        word, bit = divmod(row, 64)
+        bit = np.uint64(1 << bit)
+        for tag_id in self.registry.tag_ids(old ^ mask):
+            column = self._column(tag_id, create=True)
+            if tag_id in tag_ids:
+                column[word] |= bit
+            else:
+                column[word] &= ~bit
+        self._masks[note.id] = mask
+
+    def discard(self, note_id: int):
+        row = self._rows.pop(note_id, None)
+        if row is None:
+            return
+        word, bit = divmod(row, 64)
+        bit = np.uint64(1 << bit)
+        for tag_id in self.registry.tag_ids(self._masks.pop(note_id)):
+            self._columns[tag_id][word] &= ~bit
+        self._live[word] &= ~bit
+        self._free.append(row)
+
+    def _allocate(self, note_id: int) -> int:
+        if self._free:
+            row = self._free.pop()
+        else:
+            row = self.rows
+            self.rows += 1
+            if row >= len(self._ids):
+                self._grow(max(64, 2 * len(self._ids)))
+        self._rows[note_id] = row
+        self._ids[row] = note_id
+        self._live[row // 64] |= np.uint64(1 << (row % 64))
+        return row
+
+    def _grow(self, rows: int):
+        words = rows // 64
+        self._ids = np.concatenate([self._ids, np.zeros(rows - len(self._ids), dtype=np.int64)])
+        extra = words - len(self._live)
+        self._live = np.concatenate([self._live, np.zeros(extra, dtype=np.uint64)])
+        for tag_id, column in self._columns.items():
+            self._columns[tag_id] = np.concatenate([column, np.zeros(extra, dtype=np.uint64)])
+
+    def _column(self, tag_id: int, create: bool = False):
+        column = self._columns.get(tag_id)
+        if column is None and create:
+            column = self._columns[tag_id] = np.zeros(len(self._live), dtype=np.uint64)
+        return column
+
+    # Queries
+
+    def bitmap(self, expression: TagFilter) -> np.ndarray:
+        """Bitmap words of the notes matching a filter."""
+        return np.bitwise_and(expression.evaluate(self), self._live)
+
+    def matching(self, expression: TagFilter) -> np.ndarray:
+        """Ids of the notes matching a filter, in row order."""
+        bits = np.unpackbits(self.bitmap(expression).view(np.uint8), bitorder="little")[:self.rows]
+        return self._ids[np.flatnonzero(bits)]
+
+    def count(self, expression: TagFilter) -> int:
+        return int(np.unpackbits(self.bitmap(expression).view(np.uint8)).sum())
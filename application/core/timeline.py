@@ -0,0 +1,413 @@
+import random
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from application.utils import Timestamp, Timerange
+from application.utils.calendar_engine import get_calendar_engine
+from .note import Note
+
+TimePoint = Union[Timestamp, int]
+
+class _IntervalNode:
+    __slots__ = ("start", "end", "note_id", "priority", "left", "right", "max_end")
+
+    def __init__(self, start: int, end: int, note_id: int, priority: float):
+        self.start = start
+        self.end = end
+        self.note_id = note_id
+        self.priority = priority
+        self.left: Optional[_IntervalNode] = None
+        self.right: Optional[_IntervalNode] = None
+        self.max_end = end
+
+    def key(self) -> tuple:
+        return self.start, self.end, self.note_id
+
+    def refresh(self):
+        """Recompute the subtree maximum end after a child changed."""
+        max_end = self.end
+        if self.left is not None and self.left.max_end > max_end:
+            max_end = self.left.max_end
+        if self.right is not None and self.right.max_end > max_end:
+            max_end = self.right.max_end
+        self.max_end = max_end
+
+class _RankNode:
+    __slots__ = ("key", "priority", "left", "right", "size")
+
+    def __init__(self, key: Tuple[int, int], priority: float):
+        self.key = key
+        self.priority = priority
+        self.left: Optional[_RankNode] = None
+        self.right: Optional[_RankNode] = None
+        self.size = 1
+
+    def refresh(self):
+        self.size = 1 + (self.left.size if self.left else 0) + (self.right.size if self.right else 0)
+
+class _RankTree:
+    """Treap of (tick, note_id) keys with subtree sizes, counting the keys below a tick in O(log n) expected."""
+
+    def __init__(self, keys: Iterable[Tuple[int, int]] = ()):
+        # Cartesian tree over the sorted keys, as in TimelineIndex.build
+        stack: List[_RankNode] = []
+        for key in sorted(keys):
+            node = _RankNode(key, random.random())
+            last = None
+            while stack and stack[-1].priority < node.priority:
+                last = stack.pop()
+            node.left = last
+            if stack:
+                stack[-1].right = node
+            stack.append(node)
+        self._root = stack[0] if stack else None
+        # Sizes bottom-up: children come after their parent in preorder
+        order = []
+        stack = [self._root] if self._root else []
+        while stack:
+            node = stack.pop()
+            order.append(node)
+            if node.left:
+                stack.append(node.left)
+            if node.right:
+                stack.append(node.right)
+        for node in reversed(order):
+            node.refresh()
+
+    def add(self, key: Tuple[int, int]):
+        self._root = self._insert(self._root, _RankNode(key, random.random()))
+
+    def remove(self, key: Tuple[int, int]):
+        self._root = self._remove(self._root, key)
+
+    def count_below(self, tick: int) -> int:
+        """Number of keys whose tick is less than the given one."""
+        count = 0
+        node = self._root
+        while node is not None:
+            if node.key[0] < tick:
+                count += 1 + (node.left.size if node.left else 0)
+                node = node.right
+            else:
+                node = node.left
+        return count
+
+    def count_at_most(self, tick: int) -> int:
+        """Number of keys whose tick is at most the given one."""
+        return self.count_below(tick + 1)
+
+    def _insert(self, node: Optional[_RankNode], new: _RankNode) -> _RankNode:
+        if node is None:
+            return new
+        if new.key < node.key:
+            node.left = self._insert(node.left, new)
+            if node.left.priority > node.priority:
+                node = self._rotate_right(node)
+        else:
+            node.right = self._insert(node.right, new)
+            if node.right.priority > node.priority:
+                node = self._rotate_left(node)
+        node.refresh()
+        return node
+
+    def _remove(self, node: Optional[_RankNode], key: Tuple[int, int]) -> Optional[_RankNode]:
+        if node is None:
+            raise KeyError(key[1])
+        if key < node.key:
+            node.left = self._remove(node.left, key)
+        elif key > node.key:
+            node.right = self._remove(node.right, key)
+        else:
+            if node.left is None:
+                return node.right
+            if node.right is None:
+                return node.left
+            if node.left.priority > node.right.priority:
+                node = self._rotate_right(node)
+                node.right = self._remove(node.right, key)
+            else:
+                node = self._rotate_left(node)
+                node.left = self._remove(node.left, key)
+        node.refresh()
+        return node
+
+    @staticmethod
+    def _rotate_right(node: _RankNode) -> _RankNode:
+        pivot = node.left
+        node.left = pivot.right
+        pivot.right = node
+        node.refresh()
+        pivot.refresh()
+        return pivot
+
+    @staticmethod
+    def _rotate_left(node: _RankNode) -> _RankNode:
+        pivot = node.right
+        node.right = pivot.left
+        pivot.left = node
+        node.refresh()
+        pivot.refresh()
+        return pivot
+
+class TimelineIndex:
+    """Interval index over Note timeranges, kept as a treap ordered by start tick.
+
+    Every node also stores the largest end tick in its subtree, so overlap queries skip
+    any subtree that ends before the window and any right subtree that starts after it.
+    Inserts and removals are O(log n) expected; queries visit O(log n) nodes per match.
+
+    Start and end ticks are also kept in counting treaps, which answer overlap counts in
+    O(log n) expected, for query planning to compare the timeline against other indexes
+    before running a query, and stay O(log n) to edit.
+    """
+
+    def __init__(self, calendar=None):
+        self.engine = get_calendar_engine(calendar)
+        self._root: Optional[_IntervalNode] = None
+        self._spans: Dict[int, Tuple[int, int]] = {}
+        self._starts = _RankTree()
+        self._ends = _RankTree()
+
+    def __len__(self):
+        return len(self._spans)
+
+    def __contains__(self, note_id: int):
+        return note_id in self._spans
+
+    def span(self, note_id: int) -> Tuple[int, int]:
+        """Returns the (start, end) ticks indexed for a note."""
+        return self._spans[note_id]
+
+    def _ticks(self, point: TimePoint) -> int:
+        if isinstance(point, Timestamp):
+            return self.engine.to_ticks(point.day, point.month, point.year)
+        return point
+
+    def _timerange_ticks(self, timerange: Timerange) -> Tuple[int, int]:
+        start, end = self._ticks(timerange.start), self._ticks(timerange.end)
+        return (start, end) if start <= end else (end, start)
+
+    # Building and editing
+
+    @staticmethod
+    def from_notes(notes: Iterable[Note], calendar=None) -> 'TimelineIndex':
+        """Bulk build an index from notes in O(n log n) without per-note rebalancing.
+
+        Notes without a timerange are skipped.
+        """
+        index = TimelineIndex(calendar)
+        index.build((note.id, *index._timerange_ticks(note.timerange)) for note in notes
+                    if note.timerange is not None)
+        return index
+
+    def build(self, spans: Iterable[Tuple[int, int, int]]):
+        """Replace the contents with (note_id, start, end) spans."""
+        self._spans = {}
+        for note_id, start, end in spans:
+            self._spans[note_id] = (start, end) if start <= end else (end, start)
+
+        nodes = sorted((_IntervalNode(start, end, note_id, random.random())
+                        for note_id, (start, end) in self._spans.items()), key=_IntervalNode.key)
+
+        # Cartesian tree construction over the sorted keys keeps the heap order on priority
+        stack: List[_IntervalNode] = []
+        for node in nodes:
+            last = None
+            while stack and stack[-1].priority < node.priority:
+                last = stack.pop()
+            node.left = last
+            if stack:
+                stack[-1].right = node
+            stack.append(node)
+        self._root = stack[0] if stack else None
+        self._refresh_all()
+        self._starts = _RankTree((start, note_id) for note_id, (start, _) in self._spans.items())
+        self._ends = _RankTree((end, note_id) for note_id, (_, end) in self._spans.items())
+
+    def _refresh_all(self):
+        """Recompute max_end bottom-up over the whole tree."""
+        order = []
+        stack = [self._root] if self._root else []
+        while stack:
+            node = stack.pop()
+            order.append(node)
+            if node.left:
+                stack.append(node.left)
+            if node.right:
+                stack.append(node.right)
+        for node in reversed(order):
+            node.refresh()
+
+    def insert(self, note: Note):
+        """Index a note by its timerange, replacing any previous entry for the same id."""
+        start, end = self._timerange_ticks(note.timerange)
+        self.insert_span(note.id, start, end)
+
+    def insert_span(self, note_id: int, start: int, end: int):
+        """Index a raw (start, end) tick span for a note id."""
+        if note_id in self._spans:
+            self.remove(note_id)
+        if start > end:
+            start, end = end, start
+        self._spans[note_id] = (start, end)
+        self._root = self._insert(self._root, _IntervalNode(start, end, note_id, random.random()))
+        self._starts.add((start, note_id))
+        self._ends.add((end, note_id))
+
+    def update(self, note: Note):
+        """Re-index a note after its timerange was edited; a note without one is dropped."""
+        if note.timerange is None:
+            self.discard(note.id)
+            return
+        start, end = self._timerange_ticks(note.timerange)
+        if self._spans.get(note.id) != (start, end):
+            self.insert_span(note.id, start, end)
+
+    def remove(self, note_id: int):
+        """Drop a note from the index. Raises KeyError if it is not indexed."""
+        start, end = self._spans.pop(note_id)
+        self._root = self._remove(self._root, (start, end, note_id))
+        self._starts.remove((start, note_id))
+        self._ends.remove((end, note_id))
+
+    def discard(self, note_id: int):
+        """Drop a note from the index if present."""
+        if note_id in self._spans:
+            self.remove(note_id)
+
+    def _insert(self, node: Optional[_IntervalNode], new: _IntervalNode) -> _IntervalNode:
+        if node is None:
+            return new
+        if new.key() < node.key():
+            node.left = self._insert(node.left, new)
+            if node.left.priority > node.priority:
+                node = self._rotate_right(node)
+        else:
+            node.right = self._insert(node.right, new)
+            if node.right.priority > node.priority:
+                node = self._rotate_left(node)
+        node.refresh()
+        return node
+
+    def _remove(self, node: Optional[_IntervalNode], key: tuple) -> Optional[_IntervalNode]:
+        if node is None:
+            raise KeyError(key[2])
+        node_key = node.key()
+        if key < node_key:
+            node.left = self._remove(node.left, key)
+        elif key > node_key:
+            node.right = self._remove(node.right, key)
+        else:
+            if node.left is None:
+                return node.right
+            if node.right is None:
+                return node.left
+            # Rotate the higher priority child up, then keep sinking the node being removed
+            if node.left.priority > node.right.priority:
+                node = self._rotate_right(node)
+                node.right = self._remove(node.right, key)
+            else:
+                node = self._rotate_left(node)
+                node.left = self._remove(node.left, key)
+        node.refresh()
+        return node
+
+    @staticmethod
+    def _rotate_right(node: _IntervalNode) -> _IntervalNode:
+        pivot = node.left
+        node.left = pivot.right
+        pivot.right = node
+        node.refresh()
+        pivot.refresh()
+        return pivot
+
+    @staticmethod
+    def _rotate_left(node: _IntervalNode) -> _IntervalNode:
+        pivot = node.right
+        node.right = pivot.left
+        pivot.left = node
+        node.refresh()
+        pivot.refresh()
+        return pivot
+
+    # Queries
+
+    def count_overlapping(self, start: TimePoint, end: TimePoint) -> int:
+        """Number of notes overlapping [start, end], in O(log n) without visiting them."""
+        lo, hi = self._ticks(start), self._ticks(end)
+        # Everything starting by the end of the window, less what ended before it began
+        return max(0, self._starts.count_at_most(hi) - self._ends.count_below(lo))
+
+    def count_before(self, point: TimePoint) -> Tuple[int, int]:
+        """Numbers of notes that start, and that end, strictly before a point."""
+        tick = self._ticks(point)
+        return self._starts.count_below(tick), self._ends.count_below(tick)
+
+    def iter_starting(self, start: TimePoint, end: TimePoint) -> Iterator[int]:
+        """Yield ids of notes whose timerange starts within [start, end]."""
+        lo, hi = self._ticks(start), self._ticks(end)
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            if node.start >= lo:
+                stack.append(node.left)
+                if node.start <= hi:
+                    yield node.note_id
+            if node.start <= hi:
+                stack.append(node.right)
+
+    def iter_overlapping(self, start: TimePoint, end: TimePoint) -> Iterator[int]:
+        """Yield ids of notes whose timerange shares at least one tick with [start, end]."""
+        lo, hi = self._ticks(start), self._ticks(end)
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if node is None or node.max_end < lo:
+                continue
+            stack.append(node.left)
+            if node.start <= hi:
+                if node.end >= lo:
+                    yield node.note_id
+                stack.append(node.right)
+
+    def overlapping(self, start: TimePoint, end: TimePoint) -> List[int]:
+        """Ids of notes whose timerange shares at least one tick with [start, end]."""
+        return list(self.iter_overlapping(start, end))
+
+    def at(self, point: TimePoint) -> List[int]:
+        """Ids of notes whose timerange includes the given point in time."""
+        return list(self.iter_overlapping(point, point))
+
+    def within(self, start: TimePoint, end: TimePoint) -> List[int]:
+        """Ids of notes whose timerange lies entirely inside [start, end]."""
+        lo, hi = self._ticks(start), self._ticks(end)
+        results = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            if node.start >= lo:
+                stack.append(node.left)
+                if node.start <= hi and node.end <= hi:
+                    results.append(node.note_id)
+            if node.start <= hi:
+                stack.append(node.right)
+        return results
+
+    def containing(self, start: TimePoint, end: TimePoint) -> List[int]:
+        """Ids of notes whose timerange covers all of [start, end]."""
+        lo, hi = self._ticks(start), self._ticks(end)
+        results = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if node is None or node.max_end < hi:
+                continue
+            stack.append(node.left)
+            if node.start <= lo:
+                if node.end >= hi:
+                    results.append(node.note_id)
+                stack.append(node.right)
+        return results
@@ -4,6 +4,8 @@ from .location import Scale
 from .time import Timestamp
 from .time import Timerange
 
+from .calendar_engine import CalendarEngine
+
 from .markdown import Description
 
 from .image import LegendsImage
\ No newline at end of file
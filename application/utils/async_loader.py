@@ -0,0 +1,144 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Callable, Dict, Hashable, List, Optional
+import asyncio
+import heapq
+import itertools
+
+from .image import image_cache
+
+if TYPE_CHECKING:
+    from PIL import Image
+    from .tiles import TilePyramid
+
+# Request priorities; lower numbers run first
+VISIBLE = 0
+DEFAULT = 5
+PREFETCH = 10
+
+class _Request:
+    __slots__ = ("priority", "seq", "future", "func", "args", "key", "queued")
+
+    def __init__(self, priority: int, seq: int, future: asyncio.Future, func: Callable, args: tuple,
+                 key: Optional[Hashable]):
+        self.priority = priority
+        self.seq = seq
+        self.future = future
+        self.func = func
+        self.args = args
+        self.key = key
+        self.queued = True
+
+    def __lt__(self, other: '_Request') -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+class AsyncLoader:
+    """Runs blocking I/O on a few threads for an asyncio event loop, highest priority first.
+
+    submit returns an asyncio future right away; the work waits in a priority queue until
+    a thread is free, so requests for the visible viewport overtake queued prefetches.
+    Cancelling a queued future drops the request before it runs; a request already
+    running finishes on its thread and its result is discarded. Requests with the same
+    key share one future, and asking again at a higher priority moves the request up.
+    """
+
+    def __init__(self, workers: int = 4):
+        self.workers = workers
+        self.running = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="legends-io")
+        self._queue: List[_Request] = []
+        self._keyed: Dict[Hashable, _Request] = {}
+        self._seq = itertools.count()
+
+    def __len__(self):
+        """Requests waiting for a thread."""
+        return sum(1 for request in self._queue if request.queued and not request.future.done())
+
+    def submit(self, func: Callable, *args, priority: int = DEFAULT, key: Optional[Hashable] = None) -> asyncio.Future:
+        """Schedule func(*args) on a worker thread; must be called from the event loop."""
+        loop = asyncio.get_running_loop()
+        existing = self._keyed.get(key) if key is not None else None
+        if existing is not None and not existing.future.done():
+            if existing.queued and priority < existing.priority:
+                # Requeue at the new priority; the old entry is skipped when popped
+                existing.queued = False
+                self._push(_Request(priority, next(self._seq), existing.future, func, args, key))
+            return existing.future
+
+        future = loop.create_future()
+        self._push(_Request(priority, next(self._seq), future, func, args, key))
+        self._dispatch(loop)
+        return future
+
+    def _push(self, request: _Request):
+        heapq.heappush(self._queue, request)
+        if request.key is not None:
+            self._keyed[request.key] = request
+
+    def _dispatch(self, loop: asyncio.AbstractEventLoop):
+        while self.running < self.workers and self._queue:
+            request = heapq.heappop(self._queue)
+            if not request.queued:
+                continue
+            request.queued = False
+            if request.future.cancelled():
+                self._forget(request)
+                continue
+            self.running += 1
+            work = loop.run_in_executor(self._executor, request.func, *request.args)
+            work.add_done_callback(lambda work, request=request: self._finished(loop, request, work))
+
+    def _finished(self, loop: asyncio.AbstractEventLoop, request: _Request, work: asyncio.Future):
+        self.running -= 1
+        self._forget(request)
+        if not request.future.done():
+            if work.cancelled():
+                request.future.cancel()
+            elif work.exception() is not None:
+                request.future.set_exception(work.exception())
+            else:
+                request.future.set_result(work.result())
+        self._dispatch(loop)
+
+    def _forget(self, request: _Request):
+        if request.key is not None and self._keyed.get(request.key) is request:
+            del self._keyed[request.key]
+
+    def cancel_pending(self, priority: int = PREFETCH) -> int:
+        """Cancel every queued request at this priority or lower, e.g. prefetches for a viewport left behind."""
+        cancelled = 0
+        for request in self._queue:
+            if request.queued and request.priority >= priority and request.future.cancel():
+                cancelled += 1
+        return cancelled
+
+    def close(self):
+        """Cancel queued requests and stop the threads once running requests finish."""
+        for request in self._queue:
+            request.future.cancel()
+        self._queue.clear()
+        self._keyed.clear()
+        self._executor.shutdown(wait=False)
+
+    # Images
+
+    def fetch_image(self, image_path: str, priority: int = DEFAULT) -> 'asyncio.Future[Image.Image]':
+        """Decoded image through the shared image cache."""
+        return self.submit(image_cache.load, image_path, priority=priority, key=("image", image_path))
+
+    def fetch_tile(self, pyramid: 'TilePyramid', level: int, column: int, row: int,
+                   priority: int = DEFAULT) -> 'asyncio.Future[Image.Image]':
+        """One decoded tile of a pyramid, building the pyramid first if needed.
+
+        An unbuilt pyramid is built by a single keyed request that every tile fetched
+        meanwhile waits on, rather than each tile's thread blocking on the build.
+        """
+        key = ("tile", pyramid.key, pyramid.tile_size, level, column, row)
+        if pyramid.is_built():
+            return self.submit(pyramid.tile, level, column, row, priority=priority, key=key)
+        build = self.submit(pyramid.build, priority=priority, key=("pyramid", pyramid.directory))
+
+        async def after_build() -> 'Image.Image':
+            # Shielded, so cancelling one tile does not cancel the build the others wait on
+            await asyncio.shield(build)
+            return await self.submit(pyramid.tile, level, column, row, priority=priority, key=key)
+        return asyncio.ensure_future(after_build())
@@ -0,0 +1,266 @@
+from array import array
+from typing import Callable, Dict, Iterator, List, Optional, TextIO, Tuple
+import json
+import re
+
+_WHITESPACE = re.compile(r'\s*')
+# Characters that can only continue a number, never follow a complete value
+_NUMBER_CHARS = frozenset("0123456789.eE+-")
+
+class _JsonStream:
+    """Minimal pull parser over a JSON text file that only buffers what it is looking at.
+
+    Array elements are decoded one at a time with json's C decoder, so memory is bounded
+    by the chunk size plus the largest single element rather than the size of the file.
+    """
+
+    def __init__(self, file: TextIO, chunk_size: int = 1 << 16):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self) -> bool:
+        """Drop the consumed prefix and read another chunk. Returns False at end of file."""
+        if self.eof:
+            return False
+        chunk = self.file.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Next non-whitespace character, without consuming it."""
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                raise ValueError("Unexpected end of Azgaar JSON file.")
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} at offset {self.pos} of the current buffer, "
+                             f"found {self.buffer[self.pos]!r}.")
+        self.pos += 1
+
+    def read_value(self):
+        """Decode the next complete value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                # Most likely the value runs past the end of the buffer
+                if self._fill():
+                    continue
+                raise
+            if not self.eof and (end == len(self.buffer) or self.buffer[end] in _NUMBER_CHARS):
+                # The value may continue in the next chunk, e.g. a number cut after "1." or "2e"
+                if self._fill():
+                    continue
+            self.pos = end
+            return value
+
+    def skip_value(self):
+        """Consume the next value without keeping it.
+
+        Containers are walked one element or member at a time, so at most one element is
+        ever decoded (by the C decoder, which beats scanning characters in Python) and the
+        buffer never has to hold the whole container.
+        """
+        char = self.peek()
+        if char == "[":
+            for _ in self.iter_array():
+                pass
+        elif char == "{":
+            for _ in self.iter_object():
+                self.skip_value()
+        else:
+            self.read_value()
+
+    def iter_array(self) -> Iterator:
+        """Yield the elements of the array at the current position one by one."""
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.read_value()
+            char = self.peek()
+            self.pos += 1
+            if char == "]":
+                return
+            if char != ",":
+                raise ValueError(f"Expected ',' or ']' in array, found {char!r}.")
+
+    def iter_object(self) -> Iterator[str]:
+        """Yield the keys of the object at the current position, leaving each value unread."""
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.read_value()
+            self.expect(":")
+            yield key
+            char = self.peek()
+            self.pos += 1
+            if char == "}":
+                return
+            if char != ",":
+                raise ValueError(f"Expected ',' or '}}' in object, found {char!r}.")
+
+class AzgaarLayer:
+    """Column store for one kind of Azgaar record: typed arrays plus a list of names."""
+
+    def __init__(self, columns: Dict[str, str]):
+        self.columns: Dict[str, array] = {name: array(typecode) for name, typecode in columns.items()}
+        self.names: List[str] = []
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, column: str) -> array:
+        return self.columns[column]
+
+    def __repr__(self):
+        return f"AzgaarLayer(size={len(self)}, columns={list(self.columns)})"
+
+    def append(self, name: str, **values):
+        self.names.append(name)
+        for column, values_array in self.columns.items():
+            values_array.append(values.get(column) or 0)
+
+    def nbytes(self) -> int:
+        """Memory used by the numeric columns."""
+        return sum(column.itemsize * len(column) for column in self.columns.values())
+
+    def locations(self) -> 'LocationArray':
+        """Positions as a LocationArray, for layers with x/y columns."""
+        from .location_array import LocationArray
+        return LocationArray.from_columns(self.columns["x"], self.columns["y"])
+
+class AzgaarMap:
+    """Compact result of an Azgaar import."""
+
+    def __init__(self):
+        self.info: dict = {}
+        self.burgs = AzgaarLayer({"id": "i", "x": "d", "y": "d", "cell": "i", "state": "i",
+                                  "population": "d", "capital": "b"})
+        self.states = AzgaarLayer({"id": "i", "capital": "i", "center": "i", "x": "d", "y": "d"})
+        self.cells = AzgaarLayer({"id": "i", "x": "d", "y": "d", "height": "h", "biome": "h",
+                                  "state": "i", "burg": "i"})
+        self.markers = AzgaarLayer({"id": "i", "x": "d", "y": "d", "cell": "i"})
+        # Marker types live alongside the column data
+        self.marker_types: List[str] = []
+        # Azgaar "notes" hold a name and lore text for burgs, markers and so on, keyed e.g. "burg12"
+        self.legends: Dict[str, Tuple[str, str]] = {}
+
+    def __repr__(self):
+        return (f"AzgaarMap(burgs={len(self.burgs)}, states={len(self.states)}, "
+                f"cells={len(self.cells)}, markers={len(self.markers)})")
+
+    def legend(self, kind: str, id: int) -> Optional[Tuple[str, str]]:
+        """(name, legend) of the Azgaar note attached to e.g. ("marker", 3), if any."""
+        return self.legends.get(f"{kind}{id}")
+
+    # Per-record converters, skipping Azgaar's placeholder and removed entries
+
+    def _add_burg(self, burg: dict):
+        if not burg or burg.get("removed") or not burg.get("i"):
+            return
+        self.burgs.append(burg.get("name", ""), id=burg["i"], x=burg.get("x"), y=burg.get("y"),
+                          cell=burg.get("cell"), state=burg.get("state"),
+                          population=burg.get("population"), capital=burg.get("capital"))
+
+    def _add_state(self, state: dict):
+        if not state or state.get("removed") or not state.get("i"):
+            return
+        pole = state.get("pole") or (0.0, 0.0)
+        self.states.append(state.get("name", ""), id=state["i"], capital=state.get("capital"),
+                           center=state.get("center"), x=pole[0], y=pole[1])
+
+    def _add_cell(self, cell: dict):
+        point = cell.get("p") or (0.0, 0.0)
+        self.cells.append("", id=cell.get("i"), x=point[0], y=point[1], height=cell.get("h"),
+                          biome=cell.get("biome"), state=cell.get("state"), burg=cell.get("burg"))
+
+    def _add_marker(self, marker: dict):
+        if not marker or marker.get("removed"):
+            return
+        self.markers.append(marker.get("type", ""), id=marker.get("i"),
+                            x=marker.get("x"), y=marker.get("y"), cell=marker.get("cell"))
+        self.marker_types.append(marker.get("type", ""))
+
+    def _add_note(self, note: dict):
+        if note and note.get("id"):
+            self.legends[note["id"]] = (note.get("name") or "", note.get("legend") or "")
+
+    def _resolve_marker_names(self):
+        """Markers carry no name of their own; use the attached note's name where there is one."""
+        for i, marker_id in enumerate(self.markers["id"]):
+            legend = self.legend("marker", marker_id)
+            if legend and legend[0]:
+                self.markers.names[i] = legend[0]
+
+    def _resolve_state_positions(self):
+        """States without a saved pole are placed at their capital."""
+        burg_index = {burg_id: i for i, burg_id in enumerate(self.burgs["id"])}
+        xs, ys = self.states["x"], self.states["y"]
+        for i, capital in enumerate(self.states["capital"]):
+            if xs[i] == 0.0 and ys[i] == 0.0 and capital in burg_index:
+                xs[i] = self.burgs["x"][burg_index[capital]]
+                ys[i] = self.burgs["y"][burg_index[capital]]
+
+LAYERS = ("burgs", "states", "cells", "markers")
+
+def import_azgaar(json_path: str, layers=LAYERS, chunk_size: int = 1 << 16) -> AzgaarMap:
+    """Stream an Azgaar Fantasy Map Generator JSON export into compact column arrays.
+
+    Handles the full, minimal and pack-cells exports, where the data sits under "pack",
+    "cells" or at the top level. Grid cells and everything else not requested is skipped
+    without being decoded, so peak memory stays at a few chunks plus the extracted columns.
+    """
+    result = AzgaarMap()
+    handlers: Dict[str, Callable[[dict], None]] = {
+        "burgs": result._add_burg,
+        "states": result._add_state,
+        "cells": result._add_cell,
+        "markers": result._add_marker,
+    }
+    handlers = {key: handler for key, handler in handlers.items() if key in layers}
+
+    with open(json_path, encoding="utf-8") as file:
+        stream = _JsonStream(file, chunk_size)
+        for key in stream.iter_object():
+            if key == "info":
+                result.info = stream.read_value()
+            elif key == "notes" and stream.peek() == "[":
+                for note in stream.iter_array():
+                    result._add_note(note)
+            elif key in ("pack", "cells") and stream.peek() == "{":
+                _read_container(stream, handlers)
+            elif key in handlers and stream.peek() == "[":
+                for record in stream.iter_array():
+                    handlers[key](record)
+            else:
+                stream.skip_value()
+
+    result._resolve_state_positions()
+    result._resolve_marker_names()
+    return result
+
+def _read_container(stream: _JsonStream, handlers: Dict[str, Callable[[dict], None]]):
+    """Walk the "pack" (or pack-cells "cells") object, streaming the requested arrays."""
+    for key in stream.iter_object():
+        if key in handlers and stream.peek() == "[":
+            for record in stream.iter_array():
+                handlers[key](record)
+        else:
+            stream.skip_value()
@@ -0,0 +1,288 @@
+from bisect import bisect_right
+from typing import Dict, Optional, Tuple
+import hashlib
+import itertools
+import json
+
+class CalendarEngine:
+    """Precomputed, immutable date arithmetic for a settings.Calendar.
+
+    Ticks are whole days counted from day 1 of month 1 of year 0. The TimeUnit
+    list is walked once here; every conversion afterwards is table lookups plus
+    closed-form leap-cycle math, O(1) to ticks and O(log months) back.
+
+    Build engines with compile_calendar, which shares one engine between
+    calendars with the same content.
+    """
+
+    def __init__(self, calendar):
+        self.calendar = calendar
+
+        units = []
+        current = calendar.time_unit_list
+        while current:
+            units.append(current)
+            current = current.child
+        self.units = tuple(units)
+        self.unit_names: Tuple[str, ...] = tuple(unit.name for unit in units)
+        self.unit_index: Dict[str, int] = {name: i for i, name in enumerate(self.unit_names)}
+
+        month_index = self._find_month_index(units)
+        day_index = self._find_day_index(units, calendar.leap_unit, month_index)
+
+        month_unit = units[month_index]
+        default_length = 1
+        for unit in units[day_index:month_index]:
+            default_length *= unit.number
+
+        self.day_unit = units[day_index]
+        self.month_unit = month_unit
+        self.months_per_year = month_unit.number
+        if self.months_per_year <= 0:
+            raise ValueError("Calendar must have at least one month per year.")
+
+        self.month_names: Tuple[Optional[str], ...] = tuple(
+            month_unit.names[i] if i < len(month_unit.names) else None
+            for i in range(self.months_per_year)
+        )
+
+        # Named instances override the default length; "<name> Leap" entries override it in leap years
+        common_lengths = [
+            month_unit.custom_lengths.get(name, default_length) if name else default_length
+            for name in self.month_names
+        ]
+        leap_lengths = [
+            month_unit.custom_lengths.get(f"{name} Leap", length) if name else length
+            for name, length in zip(self.month_names, common_lengths)
+        ]
+
+        # Only honour leap years the calendar itself would report via calculate_leap_year_adjustment
+        self.leap_freq = calendar.leap_day_freq if calendar.leap_day_freq and calendar.leap_day_amount else 0
+        if self.leap_freq and leap_lengths == common_lengths:
+            # No month declares a leap length, so the leap day(s) go at the end of the year
+            leap_lengths[-1] += calendar.leap_day_amount
+        self.common_lengths: Tuple[int, ...] = tuple(common_lengths)
+        self.leap_lengths: Tuple[int, ...] = tuple(leap_lengths)
+
+        self.common_offsets = self._cumulative(self.common_lengths)
+        self.leap_offsets = self._cumulative(self.leap_lengths)
+        self.common_year_length = self.common_offsets[-1]
+        self.leap_year_length = self.leap_offsets[-1]
+        self.leap_extra = self.leap_year_length - self.common_year_length if self.leap_freq else 0
+
+        if self.common_year_length <= 0:
+            raise ValueError("Calendar years must contain at least one day.")
+
+        # Length of one full leap cycle, used to estimate the year of a tick without iterating
+        self._cycle_years = self.leap_freq or 1
+        self._cycle_length = self.common_year_length * self._cycle_years + self.leap_extra
+
+        # Length of every unit in ticks: the nominal product of the smaller units up to a day,
+        # the real average month and year from there on, and whole years above that
+        day_index, month_index = self.unit_index[self.day_unit.name], self.unit_index[month_unit.name]
+        self.average_year_length = average_year = self._cycle_length / self._cycle_years
+        lengths = [0.0] * len(units)
+        lengths[day_index] = 1.0
+        for i in range(day_index - 1, -1, -1):
+            lengths[i] = lengths[i + 1] / units[i].number
+        for i in range(day_index + 1, month_index):
+            lengths[i] = lengths[i - 1] * units[i - 1].number
+        lengths[month_index] = average_year / self.months_per_year
+        for i in range(month_index + 1, len(units)):
+            lengths[i] = average_year if i == month_index + 1 else lengths[i - 1] * units[i - 1].number
+        self.unit_lengths: Tuple[float, ...] = tuple(lengths)
+
+        # Nominal sizes, ignoring custom lengths: how many of each unit make one of the next
+        # larger unit, and one of the largest (TimeUnit.total_length)
+        self.unit_numbers: Tuple[int, ...] = tuple(unit.number for unit in units)
+        totals = []
+        total = 1
+        for unit in reversed(units):
+            total *= unit.number
+            totals.append(total)
+        self.unit_totals: Tuple[int, ...] = tuple(reversed(totals))
+
+        # Named instance lengths per unit, flattened out of each TimeUnit's custom_lengths
+        self.instance_lengths: Dict[Tuple[str, str], int] = {
+            (unit.name, name): length for unit in units for name, length in unit.custom_lengths.items()}
+        self._frozen = True
+
+    def __setattr__(self, name, value):
+        if getattr(self, "_frozen", False):
+            raise AttributeError("CalendarEngine is immutable; compile a new one instead.")
+        super().__setattr__(name, value)
+
+    def unit_length(self, unit: str) -> float:
+        """Length of one unit in ticks (days); months and years are averaged over a leap cycle."""
+        return self.unit_lengths[self.unit_index[unit]]
+
+    def convert(self, amount: float, from_unit: str, to_unit: str) -> float:
+        """Convert an amount between any two units of the calendar in constant time."""
+        return amount * self.unit_lengths[self.unit_index[from_unit]] / self.unit_lengths[self.unit_index[to_unit]]
+
+    def instance_length(self, unit: str, name: str) -> Optional[int]:
+        """Custom length of a named instance of a unit (e.g. "Month", "February Leap"), if it has one."""
+        return self.instance_lengths.get((unit, name))
+
+    def nominal_length(self, unit: str, name: Optional[str] = None) -> int:
+        """How many of a unit make one of the next larger unit: a named instance's custom length, or the default."""
+        length = self.instance_lengths.get((unit, name)) if name else None
+        return length if length is not None else self.unit_numbers[self.unit_index[unit]]
+
+    def total_length(self, unit: str) -> int:
+        """Nominal count of the given unit in one of the largest unit of the calendar."""
+        return self.unit_totals[self.unit_index[unit]]
+
+    def leap_year_adjustment(self, year: int) -> int:
+        """Days a leap year adds over a common one; 0 for common years."""
+        return self.leap_extra if self.is_leap_year(year) else 0
+
+    @staticmethod
+    def _find_month_index(units: list) -> int:
+        for i, unit in enumerate(units):
+            if unit.name.lower() == "month":
+                return i
+        for i, unit in enumerate(units):
+            if unit.names:
+                return i
+        raise ValueError("Calendar has no month unit.")
+
+    @staticmethod
+    def _find_day_index(units: list, leap_unit, month_index: int) -> int:
+        for i, unit in enumerate(units[:month_index]):
+            if unit is leap_unit:
+                return i
+        for i, unit in enumerate(units[:month_index]):
+            if unit.name.lower() == "day":
+                return i
+        if month_index == 0:
+            raise ValueError("Calendar has no unit smaller than a month.")
+        return month_index - 1
+
+    @staticmethod
+    def _cumulative(lengths) -> Tuple[int, ...]:
+        offsets = [0]
+        for length in lengths:
+            offsets.append(offsets[-1] + length)
+        return tuple(offsets)
+
+    def is_leap_year(self, year: int) -> bool:
+        """Returns whether the given year uses the leap month lengths."""
+        return bool(self.leap_freq) and year % self.leap_freq == 0
+
+    def leap_years_before(self, year: int) -> int:
+        """Returns the signed number of leap years in [0, year)."""
+        if not self.leap_freq:
+            return 0
+        return -((-year) // self.leap_freq)
+
+    def days_before_year(self, year: int) -> int:
+        """Returns the tick of day 1 of month 1 of the given year."""
+        return year * self.common_year_length + self.leap_years_before(year) * self.leap_extra
+
+    def days_in_year(self, year: int) -> int:
+        return self.leap_year_length if self.is_leap_year(year) else self.common_year_length
+
+    def days_in_month(self, month: int, year: int) -> int:
+        if not 1 <= month <= self.months_per_year:
+            raise ValueError(f"Month {month} is out of range 1-{self.months_per_year}.")
+        lengths = self.leap_lengths if self.is_leap_year(year) else self.common_lengths
+        return lengths[month - 1]
+
+    def to_ticks(self, day: int, month: int, year: int) -> int:
+        """Converts a day/month/year date into absolute ticks."""
+        length = self.days_in_month(month, year)
+        if not 1 <= day <= length:
+            raise ValueError(f"Day {day} is out of range 1-{length} for month {month} of year {year}.")
+        offsets = self.leap_offsets if self.is_leap_year(year) else self.common_offsets
+        return self.days_before_year(year) + offsets[month - 1] + day - 1
+
+    def from_ticks(self, ticks: int) -> Tuple[int, int, int]:
+        """Converts absolute ticks back into a (day, month, year) tuple."""
+        year = (ticks * self._cycle_years) // self._cycle_length
+        # The estimate is at most one year off in either direction
+        while self.days_before_year(year) > ticks:
+            year -= 1
+        while self.days_before_year(year + 1) <= ticks:
+            year += 1
+
+        remainder = ticks - self.days_before_year(year)
+        offsets = self.leap_offsets if self.is_leap_year(year) else self.common_offsets
+        month = bisect_right(offsets, remainder, 0, self.months_per_year) - 1
+        return remainder - offsets[month] + 1, month + 1, year
+
+    def __repr__(self):
+        return (f"CalendarEngine(months_per_year={self.months_per_year}, "
+                f"common_year_length={self.common_year_length}, leap_freq={self.leap_freq})")
+
+def calendar_hash(calendar) -> str:
+    """Digest of a calendar's content, equal for calendars that count time the same way."""
+    return hashlib.sha1(json.dumps(calendar.to_dict(), sort_keys=True).encode()).hexdigest()
+
+_compiled: Dict[str, CalendarEngine] = {}
+# Increasing stamps for edits of Calendars and TimeUnits; see calendar_edited
+_stamps = itertools.count(1)
+
+def calendar_edited(item):
+    """Record that a Calendar or TimeUnit changed, invalidating the engine cached on its calendar.
+
+    Assigning any Calendar or TimeUnit attribute calls this; call it after changing a
+    unit's names or custom_lengths in place.
+    """
+    # Set directly, as an ordinary assignment would count as another edit
+    object.__setattr__(item, "_stamp", next(_stamps))
+
+def _calendar_version(calendar) -> int:
+    """The latest edit stamp of a calendar and its units.
+
+    Stamps only grow, so any edit, including swapping a unit for an older one, raises it;
+    edits of other calendars leave it alone.
+    """
+    version = calendar._stamp
+    unit = calendar.time_unit_list
+    while unit is not None:
+        if unit._stamp > version:
+            version = unit._stamp
+        unit = unit.child
+    leap_unit = calendar.leap_unit
+    if leap_unit is not None and leap_unit._stamp > version:
+        version = leap_unit._stamp
+    return version
+
+def compile_calendar(calendar) -> CalendarEngine:
+    """The engine for a calendar, compiled once per distinct calendar content.
+
+    The engine is also cached on the calendar itself, so asking again for an unedited
+    calendar skips hashing its content.
+    """
+    version = _calendar_version(calendar)
+    cached = getattr(calendar, "_engine", None)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    key = calendar_hash(calendar)
+    engine = _compiled.get(key)
+    if engine is None:
+        engine = _compiled[key] = CalendarEngine(calendar)
+    object.__setattr__(calendar, "_engine", (version, engine))
+    return engine
+
+_active_engine: Optional[CalendarEngine] = None
+
+def set_active_calendar(calendar) -> CalendarEngine:
+    """Compiles the project calendar and makes it the default for Timestamp arithmetic."""
+    global _active_engine
+    _active_engine = calendar if isinstance(calendar, CalendarEngine) else compile_calendar(calendar)
+    return _active_engine
+
+def get_calendar_engine(calendar=None) -> CalendarEngine:
+    """Returns an engine for the given Calendar or engine, falling back to the active calendar."""
+    global _active_engine
+    if isinstance(calendar, CalendarEngine):
+        return calendar
+    if calendar is not None:
+        return compile_calendar(calendar)
+    if _active_engine is None:
+        # Imported here as core depends on utils
+        from application.core.settings import default_calendar
+        _active_engine = compile_calendar(default_calendar())
+    return _active_engine
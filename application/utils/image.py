@@ -1,12 +1,104 @@
-from PIL import Image
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Optional
 import os
 import json
+import threading
+
+from .instrumentation import instrumentation
+
+# Pillow is imported where pixels or headers are first read, keeping it out of startup
+if TYPE_CHECKING:
+    from PIL import Image
+
+class ImageCache:
+    """Process-wide LRU cache of decoded images, bounded by an approximate byte budget."""
+
+    def __init__(self, max_bytes: int = 512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._images: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._images)
+
+    def __contains__(self, image_path: str):
+        return os.path.abspath(image_path) in self._images
+
+    @staticmethod
+    def _size_of(image: 'Image.Image') -> int:
+        """Approximate decoded size in bytes."""
+        return image.width * image.height * len(image.getbands())
+
+    def load(self, image_path: str) -> 'Image.Image':
+        """Return the decoded image, decoding it and evicting cold images if needed."""
+        key = os.path.abspath(image_path)
+        with self._lock:
+            cached = self._images.get(key)
+            if cached is not None:
+                self._images.move_to_end(key)
+                return cached[0]
+
+        from PIL import Image
+
+        # Decode outside the lock so other images can be served meanwhile
+        with instrumentation.measure("LegendsImage.decode"):
+            image = Image.open(key)
+            image.load()  # Also closes the file handle for single-frame images
+        size = self._size_of(image)
+
+        with self._lock:
+            if key in self._images:
+                self._images.move_to_end(key)
+                return self._images[key][0]
+            if size <= self.max_bytes:
+                self._images[key] = (image, size)
+                self.current_bytes += size
+                self._evict()
+        return image
+
+    def _evict(self):
+        while self.current_bytes > self.max_bytes and self._images:
+            _, (_, size) = self._images.popitem(last=False)
+            self.current_bytes -= size
+
+    def resize(self, max_bytes: int):
+        """Change the byte budget, evicting immediately if it shrank."""
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def discard(self, image_path: str):
+        """Drop one image, e.g. after the file changed on disk."""
+        with self._lock:
+            entry = self._images.pop(os.path.abspath(image_path), None)
+            if entry is not None:
+                self.current_bytes -= entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._images.clear()
+            self.current_bytes = 0
+
+image_cache = ImageCache()
 
 class LegendsImage:
-    def __init__(self, image_path: str):
-        self.image = Image.open(image_path)
-        self.width, self.height = self.image.size
-        self.file_type = self._get_file_type(image_path)
+    def __init__(self, image_path: str, width: Optional[int] = None, height: Optional[int] = None,
+                 file_type: Optional[str] = None):
+        self.image_path = image_path
+        self.file_type = file_type or self._get_file_type(image_path)
+        if width is None or height is None:
+            from PIL import Image
+
+            # Image.open only parses the header; the pixels are decoded on first use of .image
+            with instrumentation.measure("LegendsImage.read_header"), Image.open(image_path) as header:
+                width, height = header.size
+        self.width, self.height = width, height
+
+    @property
+    def image(self) -> 'Image.Image':
+        """Decoded pixel data, loaded on first access and shared through the image cache."""
+        return image_cache.load(self.image_path)
 
     def _get_file_type(self, image_path: str):
         """Get the file type from the image extension."""
@@ -29,8 +121,8 @@ class LegendsImage:
     @staticmethod
     def from_dict(data: dict) -> 'LegendsImage':
         """Reconstruct a LegendsImage object from a dictionary."""
-        # Reinitialize the image using the saved image path
-        return LegendsImage(data["image_path"])
+        # The saved dimensions spare a header read; the pixels stay on disk until needed
+        return LegendsImage(data["image_path"], data.get("width"), data.get("height"), data.get("file_type"))
 
     def serialize(self) -> str:
         """Serialize the LegendsImage to a JSON string."""
@@ -39,4 +131,4 @@ class LegendsImage:
     @staticmethod
     def deserialize(data: str) -> 'LegendsImage':
         """Deserialize a JSON string to a LegendsImage object."""
-        return LegendsImage.from_dict(json.loads(data))
\ No newline at end of file
+        return LegendsImage.from_dict(json.loads(data))
@@ -0,0 +1,169 @@
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+import functools
+import json
+import marshal
+import os
+import threading
+import time
+import tracemalloc
+
+# File name under which operations appear in pstats dumps
+PSTATS_FILE = "legends"
+
+class OperationStats:
+    """Counts, times in seconds and net allocated bytes of one instrumented operation."""
+
+    __slots__ = ("count", "primitive", "total", "own", "max", "allocated", "callers")
+
+    def __init__(self):
+        self.count = 0
+        # Calls that were not nested inside another call of the same operation
+        self.primitive = 0
+        self.total = 0.0
+        self.own = 0.0
+        self.max = 0.0
+        self.allocated = 0
+        # Per calling operation: [calls, primitive calls, own time, total time]
+        self.callers: Dict[str, List] = {}
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "total": self.total,
+            "own": self.own,
+            "mean": self.total / self.count if self.count else 0.0,
+            "max": self.max,
+            "allocated": self.allocated,
+            "callers": {caller: calls for caller, (calls, _, _, _) in self.callers.items()}
+        }
+
+class Instrumentation:
+    """Process-wide, switchable recorder of how often hot operations run and what they cost.
+
+    Instrumented functions check a single flag while disabled, so leaving the decorators in
+    place is close to free. When enabled, each call records its inclusive and own time and,
+    with allocations, the net memory it allocated as seen by tracemalloc. Stats export to
+    JSON or to a pstats file that pstats.Stats and profile viewers open like a cProfile dump.
+
+    Setting the LEGENDS_INSTRUMENT environment variable enables it at startup; a value of
+    "allocations" also traces memory.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.allocations = False
+        self.operations: Dict[str, OperationStats] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._started_tracing = False
+
+    def enable(self, allocations: bool = False):
+        if allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        self.allocations = allocations
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        self.allocations = False
+
+    def reset(self):
+        with self._lock:
+            self.operations.clear()
+
+    def _stack(self) -> list:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    @contextmanager
+    def measure(self, name: str) -> Iterator[None]:
+        """Record the enclosed block as one call of the operation name."""
+        if not self.enabled:
+            yield
+            return
+        stack = self._stack()
+        caller = stack[-1][0] if stack else None
+        frame = [name, 0.0]
+        stack.append(frame)
+        memory = tracemalloc.get_traced_memory()[0] if self.allocations else 0
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            allocated = tracemalloc.get_traced_memory()[0] - memory if self.allocations else 0
+            stack.pop()
+            if stack:
+                stack[-1][1] += elapsed
+            primitive = all(outer[0] != name for outer in stack)
+            self._record(name, caller, elapsed, elapsed - frame[1], allocated, primitive)
+
+    def _record(self, name: str, caller: Optional[str], elapsed: float, own: float, allocated: int, primitive: bool):
+        with self._lock:
+            stats = self.operations.get(name)
+            if stats is None:
+                stats = self.operations[name] = OperationStats()
+            stats.count += 1
+            stats.own += own
+            stats.max = max(stats.max, elapsed)
+            stats.allocated += allocated
+            if primitive:
+                stats.primitive += 1
+                stats.total += elapsed
+            if caller is not None:
+                edge = stats.callers.setdefault(caller, [0, 0, 0.0, 0.0])
+                edge[0] += 1
+                edge[1] += primitive
+                edge[2] += own
+                edge[3] += elapsed if primitive else 0.0
+
+    # Export
+
+    def stats(self) -> Dict[str, dict]:
+        """Stats of every operation, most expensive first."""
+        with self._lock:
+            ranked = sorted(self.operations.items(), key=lambda item: -item[1].total)
+            return {name: stats.to_dict() for name, stats in ranked}
+
+    def export_json(self, path: str):
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.stats(), file, indent=2)
+
+    def export_pstats(self, path: str):
+        """Write the stats in the marshalled format of cProfile's dump_stats."""
+        def key(name: str) -> Tuple[str, int, str]:
+            return (PSTATS_FILE, 0, name)
+
+        with self._lock:
+            dump = {
+                key(name): (stats.primitive, stats.count, stats.own, stats.total,
+                            {key(caller): tuple(edge) for caller, edge in stats.callers.items()})
+                for name, stats in self.operations.items()
+            }
+        with open(path, "wb") as file:
+            marshal.dump(dump, file)
+
+instrumentation = Instrumentation()
+if os.environ.get("LEGENDS_INSTRUMENT"):
+    instrumentation.enable(allocations=os.environ["LEGENDS_INSTRUMENT"] == "allocations")
+
+def instrument(name: Optional[str] = None) -> Callable[[Callable], Callable]:
+    """Decorator recording every call of a function under name, by default its qualified name."""
+    def decorate(func: Callable) -> Callable:
+        label = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not instrumentation.enabled:
+                return func(*args, **kwargs)
+            with instrumentation.measure(label):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
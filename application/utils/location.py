@@ -1,6 +1,8 @@
 import math
 
 class Location:
+    __slots__ = ("x", "y", "z")
+
     def __init__(self, x: float, y: float, z: float):
         self.x = x
         self.y = y
@@ -9,6 +11,15 @@ class Location:
     def __repr__(self):
         return f"Location(x={self.x}, y={self.y}, z={self.z})"
 
+    def to_dict(self) -> dict:
+        """Serialize the Location to a dictionary."""
+        return {"x": self.x, "y": self.y, "z": self.z}
+
+    @staticmethod
+    def from_dict(data: dict) -> 'Location':
+        """Reconstruct a Location from a dictionary."""
+        return Location(data["x"], data["y"], data["z"])
+
     def distance_to(self, location: "Location") -> float:
         if not isinstance(location, Location):
             raise TypeError("Argument must be of type Location.")
@@ -20,10 +31,21 @@ class Location:
         return math.sqrt(dx**2 + dy**2 + dz**2)
 
 class Scale:
+    __slots__ = ("x", "y", "z")
+
     def __init__(self, x: float, y: float, z: float):
         self.x = x
         self.y = y
         self.z = z
 
     def __repr__(self):
-        return f"Scale(x={self.x}, y={self.y}, z={self.z})"
\ No newline at end of file
+        return f"Scale(x={self.x}, y={self.y}, z={self.z})"
+
+    def to_dict(self) -> dict:
+        """Serialize the Scale to a dictionary."""
+        return {"x": self.x, "y": self.y, "z": self.z}
+
+    @staticmethod
+    def from_dict(data: dict) -> 'Scale':
+        """Reconstruct a Scale from a dictionary."""
+        return Scale(data["x"], data["y"], data["z"])
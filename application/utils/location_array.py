@@ -0,0 +1,138 @@
+from typing import Iterable, Iterator, Union
+import numpy as np
+
+from .location import Location
+
+class LocationArray:
+    """Columnar storage for many positions as one contiguous (n, 3) float64 buffer.
+
+    Each position costs 24 bytes instead of a full Location object, and distance
+    queries run as NumPy kernels over the whole column.
+    """
+
+    def __init__(self, capacity: int = 16):
+        self._data = np.empty((max(capacity, 1), 3), dtype=np.float64)
+        self._size = 0
+
+    @staticmethod
+    def from_locations(locations: Iterable[Location]) -> 'LocationArray':
+        """Build an array from Location (or any x/y/z) objects."""
+        locations = list(locations)
+        array = LocationArray(len(locations))
+        array._data[:len(locations)] = [(loc.x, loc.y, loc.z) for loc in locations]
+        array._size = len(locations)
+        return array
+
+    @staticmethod
+    def from_columns(x, y, z=None) -> 'LocationArray':
+        """Build an array from separate x, y and optional z columns."""
+        x = np.asarray(x, dtype=np.float64)
+        array = LocationArray(len(x))
+        array._data[:len(x), 0] = x
+        array._data[:len(x), 1] = y
+        array._data[:len(x), 2] = 0.0 if z is None else z
+        array._size = len(x)
+        return array
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, index: int) -> Location:
+        if not -self._size <= index < self._size:
+            raise IndexError("LocationArray index out of range.")
+        x, y, z = self._data[index % self._size].tolist()
+        return Location(x, y, z)
+
+    def __setitem__(self, index: int, location: Location):
+        if not -self._size <= index < self._size:
+            raise IndexError("LocationArray index out of range.")
+        self._data[index % self._size] = (location.x, location.y, location.z)
+
+    def __iter__(self) -> Iterator[Location]:
+        for x, y, z in self._data[:self._size].tolist():
+            yield Location(x, y, z)
+
+    def __repr__(self):
+        return f"LocationArray(size={self._size})"
+
+    @property
+    def coords(self) -> np.ndarray:
+        """View of the stored positions as an (n, 3) array."""
+        return self._data[:self._size]
+
+    @property
+    def x(self) -> np.ndarray:
+        return self._data[:self._size, 0]
+
+    @property
+    def y(self) -> np.ndarray:
+        return self._data[:self._size, 1]
+
+    @property
+    def z(self) -> np.ndarray:
+        return self._data[:self._size, 2]
+
+    def _reserve(self, size: int):
+        if size > len(self._data):
+            grown = np.empty((max(size, 2 * len(self._data)), 3), dtype=np.float64)
+            grown[:self._size] = self._data[:self._size]
+            self._data = grown
+
+    def append(self, location: Location) -> int:
+        """Add a position and return its index."""
+        self._reserve(self._size + 1)
+        self._data[self._size] = (location.x, location.y, location.z)
+        self._size += 1
+        return self._size - 1
+
+    def extend(self, other: Union['LocationArray', Iterable[Location]]):
+        """Add many positions at once."""
+        if not isinstance(other, LocationArray):
+            other = LocationArray.from_locations(other)
+        self._reserve(self._size + len(other))
+        self._data[self._size:self._size + len(other)] = other.coords
+        self._size += len(other)
+
+    def distances_to(self, location: Location) -> np.ndarray:
+        """Distance from every stored position to one location."""
+        return distances_to(self, location)
+
+    def within_radius(self, location: Location, radius: float) -> np.ndarray:
+        """Indices of positions within the given distance of a location."""
+        delta = self.coords - (location.x, location.y, location.z)
+        return np.flatnonzero(np.einsum("ij,ij->i", delta, delta) <= radius * radius)
+
+    def nearest(self, location: Location, k: int = 1) -> np.ndarray:
+        """Indices of the k closest positions to a location, closest first."""
+        distances = self.distances_to(location)
+        k = min(k, self._size)
+        if k <= 0:
+            return np.empty(0, dtype=np.intp)
+        candidates = np.argpartition(distances, k - 1)[:k]
+        return candidates[np.argsort(distances[candidates], kind="stable")]
+
+def _coords(locations) -> np.ndarray:
+    if isinstance(locations, LocationArray):
+        return locations.coords
+    if isinstance(locations, Location):
+        return np.array([[locations.x, locations.y, locations.z]], dtype=np.float64)
+    return np.asarray(locations, dtype=np.float64).reshape(-1, 3)
+
+def distances_to(locations, location: Location) -> np.ndarray:
+    """One-to-many distances from a LocationArray (or (n, 3) array) to a single location."""
+    delta = _coords(locations) - (location.x, location.y, location.z)
+    return np.sqrt(np.einsum("ij,ij->i", delta, delta))
+
+def paired_distances(a, b) -> np.ndarray:
+    """Element-wise distances between two equally sized sets of positions."""
+    delta = _coords(a) - _coords(b)
+    return np.sqrt(np.einsum("ij,ij->i", delta, delta))
+
+def pairwise_distances(a, b=None) -> np.ndarray:
+    """Full (len(a), len(b)) distance matrix; compares a with itself if b is omitted."""
+    a = _coords(a)
+    b = a if b is None else _coords(b)
+    # |a - b|^2 = |a|^2 + |b|^2 - 2ab avoids building an (n, m, 3) intermediate
+    squared = (np.einsum("ij,ij->i", a, a)[:, None] + np.einsum("ij,ij->i", b, b)[None, :] - 2.0 * a @ b.T)
+    np.maximum(squared, 0.0, out=squared)
+    return np.sqrt(squared)
@@ -1,11 +1,203 @@
-from rich.markdown import Markdown
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Callable, List, Optional
+import functools
+import hashlib
+import re
+import threading
+
+from .instrumentation import instrument
+
+if TYPE_CHECKING:
+    from rich.markdown import Markdown
+
+# Markup removed by strip_markdown, applied in order
+_MARKDOWN_PATTERNS = [
+    # Code fences, keeping the code
+    (re.compile(r"```[^\n]*\n?"), ""),
+    # Images and links, keeping the alt text or label
+    (re.compile(r"!?\[([^\]]*)\]\([^)]*\)"), r"\1"),
+    # Inline HTML
+    (re.compile(r"<[^>\n]+>"), ""),
+    # Heading, quote and list markers
+    (re.compile(r"^\s{0,3}(#{1,6}|>+|[-*+]|\d+[.)])\s+", re.MULTILINE), ""),
+    # Horizontal rules
+    (re.compile(r"^\s{0,3}([-*_]\s*){3,}$", re.MULTILINE), ""),
+    # Emphasis, strikethrough and code spans
+    (re.compile(r"[*_~`]+"), ""),
+]
+
+def strip_markdown(text: str) -> str:
+    """Plain text of a markdown document, for indexing and previews."""
+    for pattern, replacement in _MARKDOWN_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return text
+
+def summarize(text: str, max_length: int = 160) -> str:
+    """First paragraph of plain text after any leading heading, cut at a word boundary."""
+    blocks = split_blocks(text)
+    if len(blocks) > 1 and blocks[0].lstrip().startswith("#"):
+        blocks = blocks[1:]
+    summary = " ".join(strip_markdown(blocks[0]).split()) if blocks else ""
+    if len(summary) <= max_length:
+        return summary
+    cut = summary.rfind(" ", 0, max_length)
+    return summary[:cut if cut > 0 else max_length].rstrip(",;:") + "…"
+
+_FENCE = re.compile(r"^\s{0,3}(```|~~~)")
+_LIST_ITEM = re.compile(r"^\s{0,3}([-*+]|\d+[.)])\s")
+# Reference definitions resolve across the whole document, so such text is parsed in one piece
+_REFERENCE = re.compile(r"^\s{0,3}\[[^\]]+\]:", re.MULTILINE)
+# HTML blocks that run to a closing marker rather than to the next blank line, with that marker
+_HTML_BLOCKS = [
+    (re.compile(r"^\s{0,3}<(pre|script|style|textarea)(\s|>|$)", re.IGNORECASE),
+     re.compile(r"</(pre|script|style|textarea)>", re.IGNORECASE)),
+    (re.compile(r"^\s{0,3}<!--"), re.compile(r"-->")),
+    (re.compile(r"^\s{0,3}<\?"), re.compile(r"\?>")),
+    (re.compile(r"^\s{0,3}<!\[CDATA\["), re.compile(r"\]\]>")),
+    (re.compile(r"^\s{0,3}<![A-Za-z]"), re.compile(r">")),
+]
+
+def _html_block_end(line: str) -> Optional['re.Pattern']:
+    """Closing marker of an HTML block opened but not closed on this line, if any."""
+    for start, end in _HTML_BLOCKS:
+        match = start.match(line)
+        if match:
+            return None if end.search(line, match.end()) else end
+    return None
+
+def split_blocks(text: str) -> List[str]:
+    """Split markdown at blank lines into top-level blocks that parse the same on their own.
+
+    Fenced code, HTML blocks such as comments and <pre>, indented continuations and
+    consecutive list items stay together.
+    """
+    blocks: List[str] = []
+    current: List[str] = []
+    fence: Optional[str] = None
+    html_end: Optional['re.Pattern'] = None
+    after_blank = False
+    for line in text.split("\n"):
+        inside = fence is not None or html_end is not None
+        if not inside and not line.strip():
+            after_blank = True
+            current.append(line)
+            continue
+        if (not inside and after_blank and current and not line[:1].isspace()
+                and not (_LIST_ITEM.match(line) and _LIST_ITEM.match(current[0]))):
+            blocks.append("\n".join(current).strip("\n"))
+            current = []
+        if not current and not line.strip():
+            continue
+        current.append(line)
+        after_blank = False
+        if html_end is not None:
+            if html_end.search(line):
+                html_end = None
+            continue
+        match = _FENCE.match(line)
+        if match:
+            fence = match.group(1) if fence is None else (None if match.group(1) == fence else fence)
+        elif fence is None:
+            html_end = _html_block_end(line)
+    if current:
+        blocks.append("\n".join(current).strip("\n"))
+    return [block for block in blocks if block]
+
+class RenderCache:
+    """Process-wide LRU cache keyed by content hash, shared by every Description."""
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: 'OrderedDict[bytes, Any]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def key(kind: str, text: str) -> bytes:
+        return hashlib.blake2b(f"{kind}\0{text}".encode(), digest_size=16).digest()
+
+    def get(self, kind: str, text: str, build: Callable[[str], Any]) -> Any:
+        """Cached result of build(text), building and possibly evicting on a miss."""
+        key = self.key(kind, text)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        value = build(text)
+        with self._lock:
+            self._entries[key] = value
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+render_cache = RenderCache()
+
+@functools.lru_cache(maxsize=None)
+def _renderer() -> tuple:
+    """rich's Markdown, a subclass taking parsed tokens, and the parser configuration Markdown uses.
+
+    rich and markdown-it take longer to import than the rest of the model, so they are
+    imported on the first render rather than with this module.
+    """
+    from markdown_it import MarkdownIt
+    from rich.markdown import Markdown
+
+    class ParsedMarkdown(Markdown):
+        """A rich Markdown built from already parsed tokens instead of parsing its text again."""
+
+        def __init__(self, markup: str, parsed: list):
+            super().__init__("")
+            self.markup = markup
+            self.parsed = parsed
+
+    return Markdown, ParsedMarkdown, MarkdownIt().enable("strikethrough").enable("table")
+
+@instrument("Description.parse")
+def _parse_document(text: str) -> 'Markdown':
+    markdown, parsed_markdown, parser = _renderer()
+    if _REFERENCE.search(text):
+        return markdown(text)
+    tokens = []
+    for block in split_blocks(text):
+        tokens.extend(render_cache.get("block", block, parser.parse))
+    return parsed_markdown(text, tokens)
 
 class Description:
     def __init__(self, text: str):
         self.text = text
 
-    def render(self):
-        return Markdown(self.text)
+    @instrument()
+    def render(self) -> 'Markdown':
+        """Rich renderable of the text, from the shared cache; after an edit only the changed blocks are parsed."""
+        return render_cache.get("document", self.text, _parse_document)
+
+    def plain_text(self) -> str:
+        return strip_markdown(self.text)
+
+    def summary(self, max_length: int = 160) -> str:
+        """Short plain-text preview for note lists, without rendering."""
+        return summarize(self.text, max_length)
 
     def __repr__(self):
-        return f"Description(text={self.text}"
\ No newline at end of file
+        return f"Description(text={self.text}"
+
+    def to_dict(self) -> dict:
+        """Serialize the Description to a dictionary."""
+        return {"text": self.text}
+
+    @staticmethod
+    def from_dict(data: dict) -> 'Description':
+        """Reconstruct a Description from a dictionary."""
+        return Description(data["text"])
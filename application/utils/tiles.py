@@ -0,0 +1,239 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from PIL import Image
+import hashlib
+import json
+import math
+import mmap
+import os
+import threading
+import uuid
+
+from .image import image_cache
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "legends", "tiles")
+
+# Modes Image.frombuffer can map without copying, so workers share the page cache
+_BUFFER_MODES = {"L", "RGBA", "RGBX"}
+# Tile formats that keep an alpha channel; tiles in any other format are saved as RGB
+_ALPHA_FORMATS = {"png", "webp", "tiff", "tif"}
+
+Tile = Tuple[int, int, int]  # (level, column, row)
+
+# One build at a time per pyramid directory within this process
+_build_locks: Dict[str, threading.Lock] = {}
+_build_locks_guard = threading.Lock()
+
+def _build_lock(directory: str) -> threading.Lock:
+    with _build_locks_guard:
+        return _build_locks.setdefault(os.path.abspath(directory), threading.Lock())
+
+def _allow_large_images():
+    """Worker initializer: hand-drawn world maps are far beyond PIL's decompression bomb limit.
+
+    Only pyramid worker processes lift it, so every thread of the main process keeps the check.
+    """
+    Image.MAX_IMAGE_PIXELS = None
+
+def _large_image_pool(workers: int = 1) -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(max_workers=workers, initializer=_allow_large_images)
+
+def _image_size(path: str) -> Tuple[int, int]:
+    with Image.open(path) as header:
+        return header.size
+
+def _raw_path(directory: str, level: int, token: str) -> str:
+    return os.path.join(directory, f"level_{level}.{token}.raw")
+
+def _decode_levels(image_path: str, directory: str, token: str, levels: int) -> List[Tuple[str, str, Tuple[int, int]]]:
+    """Worker: decode the source once and write each level, halved from the previous one, as a raw buffer.
+
+    Returns the (path, mode, size) of every level's buffer.
+    """
+    with Image.open(image_path) as source:
+        level_image = source.convert(TilePyramid._buffer_mode(source))
+    buffers = []
+    for level in range(levels):
+        if level:
+            level_image = level_image.reduce(2)
+        raw_path = _raw_path(directory, level, token)
+        with open(raw_path, "wb") as file:
+            file.write(level_image.tobytes())
+        buffers.append((raw_path, level_image.mode, level_image.size))
+    return buffers
+
+def content_hash(path: str, chunk_size: int = 1 << 20) -> str:
+    """SHA-1 of a file's contents, read in chunks."""
+    digest = hashlib.sha1()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _slice_tile_row(raw_path: str, mode: str, size: Tuple[int, int], level_dir: str, row: int,
+                    tile_size: int, tile_format: str, token: str) -> int:
+    """Worker: cut one row of tiles out of a memory-mapped raw level image.
+
+    Each tile is written under a name private to this build and renamed into place, so
+    readers and other processes building the same pyramid never see a partial file.
+    """
+    width, height = size
+    with open(raw_path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        level = Image.frombuffer(mode, size, buffer, "raw", mode, 0, 1)
+        top = row * tile_size
+        count = 0
+        for column in range(math.ceil(width / tile_size)):
+            left = column * tile_size
+            tile = level.crop((left, top, min(left + tile_size, width), min(top + tile_size, height)))
+            if tile.mode == "RGBX" or (tile.mode == "RGBA" and tile_format.lower() not in _ALPHA_FORMATS):
+                tile = tile.convert("RGB")
+            path = os.path.join(level_dir, f"{column}_{row}.{tile_format}")
+            temp_path = os.path.join(level_dir, f".{column}_{row}.{token}.{tile_format}")
+            tile.save(temp_path)
+            os.replace(temp_path, path)
+            count += 1
+        del level
+    return count
+
+class TilePyramid:
+    """Multi-resolution tiles of one image, stored on disk under the image's content hash.
+
+    Level 0 is full resolution and each level above halves both dimensions, up to the
+    first level that fits in a single tile. Tiles are decoded through the shared image
+    cache, so only the tiles for the current viewport and zoom ever sit in memory.
+    """
+
+    def __init__(self, image_path: str, cache_dir: Optional[str] = None, tile_size: int = 256,
+                 tile_format: str = "png"):
+        self.image_path = image_path
+        self.tile_size = tile_size
+        self.tile_format = tile_format
+        self.key = content_hash(image_path)
+        self.directory = os.path.join(cache_dir or DEFAULT_CACHE_DIR, f"{self.key}_{tile_size}")
+
+        if self.is_built():
+            with open(self.manifest_path) as file:
+                manifest = json.load(file)
+            self.width, self.height = manifest["width"], manifest["height"]
+        else:
+            try:
+                self.width, self.height = _image_size(image_path)
+            except Image.DecompressionBombError:
+                with _large_image_pool() as pool:
+                    self.width, self.height = pool.submit(_image_size, image_path).result()
+        self.max_level = 0
+        while max(self.level_size(self.max_level)) > tile_size:
+            self.max_level += 1
+
+    def __repr__(self):
+        return (f"TilePyramid(width={self.width}, height={self.height}, tile_size={self.tile_size}, "
+                f"levels={self.max_level + 1})")
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.directory, "manifest.json")
+
+    def is_built(self) -> bool:
+        return os.path.exists(self.manifest_path)
+
+    def level_size(self, level: int) -> Tuple[int, int]:
+        """Pixel size of the image at the given level."""
+        return max(1, math.ceil(self.width / 2 ** level)), max(1, math.ceil(self.height / 2 ** level))
+
+    def grid_size(self, level: int) -> Tuple[int, int]:
+        """Number of tile columns and rows at the given level."""
+        width, height = self.level_size(level)
+        return math.ceil(width / self.tile_size), math.ceil(height / self.tile_size)
+
+    def tile_path(self, level: int, column: int, row: int) -> str:
+        return os.path.join(self.directory, str(level), f"{column}_{row}.{self.tile_format}")
+
+    def level_for_zoom(self, zoom: float) -> int:
+        """Coarsest level that still has at least one image pixel per screen pixel.
+
+        `zoom` is screen pixels per full-resolution image pixel.
+        """
+        if zoom >= 1 or zoom <= 0:
+            return 0
+        return min(self.max_level, int(math.floor(math.log2(1 / zoom))))
+
+    def tiles_in_view(self, min_x: float, min_y: float, max_x: float, max_y: float, level: int) -> List[Tile]:
+        """Tiles at a level covering a box given in full-resolution image pixels."""
+        columns, rows = self.grid_size(level)
+        span = self.tile_size * 2 ** level
+        first_column, last_column = max(0, int(min_x // span)), min(columns - 1, int(max_x // span))
+        first_row, last_row = max(0, int(min_y // span)), min(rows - 1, int(max_y // span))
+        return [(level, column, row)
+                for row in range(first_row, last_row + 1)
+                for column in range(first_column, last_column + 1)]
+
+    def tile(self, level: int, column: int, row: int) -> Image.Image:
+        """Decoded tile image, building the pyramid first if it is not cached yet."""
+        if not self.is_built():
+            self.build()
+        return image_cache.load(self.tile_path(level, column, row))
+
+    def build(self, workers: Optional[int] = None) -> int:
+        """Generate every level, slicing tiles in a process pool. Returns the number of tiles written.
+
+        The source is decoded once, in a worker, as PIL's decompression bomb limit is only
+        lifted there; each level is halved from the previous one and written as a raw buffer
+        that the workers memory-map instead of receiving pickled pixels. With `workers=0`
+        the tiles are sliced in this process. Concurrent calls in one process
+        build once; another process building the same pyramid writes its own temporary
+        files and renames the same results into place.
+        """
+        with _build_lock(self.directory):
+            if self.is_built():
+                return 0
+            return self._build(workers)
+
+    def _build(self, workers: Optional[int]) -> int:
+        os.makedirs(self.directory, exist_ok=True)
+        token = uuid.uuid4().hex
+
+        workers = os.cpu_count() if workers is None else workers
+        executor = _large_image_pool(max(workers, 1))
+        jobs = []
+        count = 0
+        try:
+            buffers = executor.submit(_decode_levels, self.image_path, self.directory, token,
+                                      self.max_level + 1).result()
+            for level, (raw_path, mode, size) in enumerate(buffers):
+                level_dir = os.path.join(self.directory, str(level))
+                os.makedirs(level_dir, exist_ok=True)
+                for row in range(self.grid_size(level)[1]):
+                    job_args = (raw_path, mode, size, level_dir, row, self.tile_size, self.tile_format, token)
+                    if workers:
+                        jobs.append(executor.submit(_slice_tile_row, *job_args))
+                    else:
+                        count += _slice_tile_row(*job_args)
+            count += sum(job.result() for job in jobs)
+        finally:
+            executor.shutdown(cancel_futures=True)
+            for level in range(self.max_level + 1):
+                raw_path = _raw_path(self.directory, level, token)
+                if os.path.exists(raw_path):
+                    os.remove(raw_path)
+
+        # The manifest is written last, so a half-built pyramid is never mistaken for a complete one
+        temp_path = f"{self.manifest_path}.{token}"
+        with open(temp_path, "w") as file:
+            json.dump({
+                "source": os.path.abspath(self.image_path),
+                "width": self.width,
+                "height": self.height,
+                "tile_size": self.tile_size,
+                "levels": self.max_level + 1,
+                "format": self.tile_format
+            }, file)
+        os.replace(temp_path, self.manifest_path)
+        return count
+
+    @staticmethod
+    def _buffer_mode(image: Image.Image) -> str:
+        if image.mode in _BUFFER_MODES:
+            return image.mode
+        if "A" in image.getbands() or "transparency" in image.info:
+            return "RGBA"
+        return "RGBX"
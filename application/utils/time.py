@@ -1,23 +1,71 @@
+from .calendar_engine import get_calendar_engine
+
 class Timestamp:
+    __slots__ = ("day", "month", "year")
+
     def __init__(self, day: int, month: int, year: int):
         self.day = day
         self.month = month
         self.year = year
 
-    def time_between(self, timestamp: "Timestamp"):
+    def to_ticks(self, calendar=None) -> int:
+        """Absolute day count of this timestamp, using the active calendar unless one is given."""
+        return get_calendar_engine(calendar).to_ticks(self.day, self.month, self.year)
+
+    @staticmethod
+    def from_ticks(ticks: int, calendar=None) -> 'Timestamp':
+        """Build a Timestamp from an absolute day count."""
+        day, month, year = get_calendar_engine(calendar).from_ticks(ticks)
+        return Timestamp(day, month, year)
+
+    def time_between(self, timestamp: "Timestamp", calendar=None) -> int:
+        """Number of days from this timestamp to the given one (negative if it is earlier)."""
         if not isinstance(timestamp, Timestamp):
             raise TypeError("Argument must be of type Timestamp.")
-        # Can't really make until I set up the global "time" system for setting up the fictional calendar
-        return -1
+        engine = get_calendar_engine(calendar)
+        return (engine.to_ticks(timestamp.day, timestamp.month, timestamp.year) -
+                engine.to_ticks(self.day, self.month, self.year))
 
     def __repr__(self):
         return f"Timestamp(day={self.day}, month={self.month}, year={self.year})"
 
+    def to_dict(self) -> dict:
+        """Serialize the Timestamp to a dictionary."""
+        return {"day": self.day, "month": self.month, "year": self.year}
+
+    @staticmethod
+    def from_dict(data: dict) -> 'Timestamp':
+        """Reconstruct a Timestamp from a dictionary."""
+        return Timestamp(data["day"], data["month"], data["year"])
+
 class Timerange:
+    __slots__ = ("start", "end", "_length")
+
     def __init__(self, start: Timestamp, end: Timestamp):
         self.start = start
         self.end = end
-        self.length = start.time_between(end)
+        self._length = None
+
+    def length_in(self, calendar) -> int:
+        """Days from start to end in the given calendar or engine, e.g. project.calendar_engine.
+
+        The calendar is required, as a range's length depends on whose calendar it is in.
+        The result is cached together with the engine it was measured with.
+        """
+        engine = get_calendar_engine(calendar)
+        cached = self._length
+        if cached is None or cached[0] is not engine:
+            cached = self._length = (engine, self.start.time_between(self.end, engine))
+        return cached[1]
 
     def __repr__(self):
-        return f"Timerange(start={repr(self.start)}, end={repr(self.end)}, length={self.length})"
\ No newline at end of file
+        return f"Timerange(start={repr(self.start)}, end={repr(self.end)})"
+
+    def to_dict(self) -> dict:
+        """Serialize the Timerange to a dictionary."""
+        return {"start": self.start.to_dict(), "end": self.end.to_dict()}
+
+    @staticmethod
+    def from_dict(data: dict) -> 'Timerange':
+        """Reconstruct a Timerange from a dictionary."""
+        return Timerange(Timestamp.from_dict(data["start"]), Timestamp.from_dict(data["end"]))
@@ -0,0 +1,90 @@
+from typing import Iterable, Tuple
+import numpy as np
+
+from .calendar_engine import CalendarEngine, get_calendar_engine
+from .time import Timestamp
+
+def _tables(engine: CalendarEngine) -> Tuple[np.ndarray, np.ndarray]:
+    """Month lengths and cumulative offsets as (2, months) arrays, row 1 being leap years."""
+    lengths = np.array([engine.common_lengths, engine.leap_lengths], dtype=np.int64)
+    offsets = np.array([engine.common_offsets, engine.leap_offsets], dtype=np.int64)
+    return lengths, offsets
+
+def _leap_mask(engine: CalendarEngine, years: np.ndarray) -> np.ndarray:
+    if not engine.leap_freq:
+        return np.zeros(years.shape, dtype=bool)
+    return years % engine.leap_freq == 0
+
+def _days_before_year(engine: CalendarEngine, years: np.ndarray) -> np.ndarray:
+    days = years * engine.common_year_length
+    if engine.leap_freq:
+        days += -((-years) // engine.leap_freq) * engine.leap_extra
+    return days
+
+def to_ticks(days, months, years, calendar=None) -> np.ndarray:
+    """Convert day, month and year columns into an int64 array of absolute ticks."""
+    engine = get_calendar_engine(calendar)
+    days = np.asarray(days, dtype=np.int64)
+    months = np.asarray(months, dtype=np.int64)
+    years = np.asarray(years, dtype=np.int64)
+    if not days.shape == months.shape == years.shape:
+        raise ValueError("Day, month and year columns must have the same shape.")
+
+    bad = (months < 1) | (months > engine.months_per_year)
+    if bad.any():
+        index = int(np.flatnonzero(bad.ravel())[0])
+        raise ValueError(f"Month {int(months.ravel()[index])} at index {index} is out of range "
+                         f"1-{engine.months_per_year}.")
+
+    lengths, offsets = _tables(engine)
+    leap = _leap_mask(engine, years).astype(np.intp)
+    month_index = months - 1
+
+    bad = (days < 1) | (days > lengths[leap, month_index])
+    if bad.any():
+        index = int(np.flatnonzero(bad.ravel())[0])
+        raise ValueError(f"Day {int(days.ravel()[index])} at index {index} is out of range for its month.")
+
+    return _days_before_year(engine, years) + offsets[leap, month_index] + days - 1
+
+def from_ticks(ticks, calendar=None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Convert absolute ticks back into (days, months, years) int64 columns."""
+    engine = get_calendar_engine(calendar)
+    ticks = np.asarray(ticks, dtype=np.int64)
+
+    years = (ticks * engine._cycle_years) // engine._cycle_length
+    # Same correction as the scalar path; the estimate is at most one year off
+    while True:
+        over = _days_before_year(engine, years) > ticks
+        if not over.any():
+            break
+        years -= over
+    while True:
+        under = _days_before_year(engine, years + 1) <= ticks
+        if not under.any():
+            break
+        years += under
+
+    remainder = ticks - _days_before_year(engine, years)
+    _, offsets = _tables(engine)
+    leap = _leap_mask(engine, years)
+
+    month_index = np.empty(ticks.shape, dtype=np.intp)
+    for row, mask in ((0, ~leap), (1, leap)):
+        month_index[mask] = np.searchsorted(offsets[row, :-1], remainder[mask], side="right") - 1
+
+    days = remainder - offsets[leap.astype(np.intp), month_index] + 1
+    return days, month_index.astype(np.int64) + 1, years
+
+def timestamps_to_ticks(timestamps: Iterable[Timestamp], calendar=None) -> np.ndarray:
+    """Convert a sequence of Timestamps into absolute ticks in one batch."""
+    timestamps = list(timestamps)
+    days = np.fromiter((t.day for t in timestamps), dtype=np.int64, count=len(timestamps))
+    months = np.fromiter((t.month for t in timestamps), dtype=np.int64, count=len(timestamps))
+    years = np.fromiter((t.year for t in timestamps), dtype=np.int64, count=len(timestamps))
+    return to_ticks(days, months, years, calendar)
+
+def ticks_to_timestamps(ticks, calendar=None) -> list:
+    """Convert absolute ticks back into Timestamp objects."""
+    days, months, years = from_ticks(ticks, calendar)
+    return [Timestamp(d, m, y) for d, m, y in zip(days.tolist(), months.tolist(), years.tolist())]
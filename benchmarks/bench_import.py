@@ -0,0 +1,60 @@
+"""Compare importing notes one by one with the batched, pooled bulk import.
+
+Run from the repository root:
+    python -m benchmarks.bench_import [notes] [images]
+"""
+import sys
+import os
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from PIL import Image
+
+from application.core import Note, Project, bulk_import
+from application.core.settings import Settings, default_calendar
+from application.utils import Location, Description, LegendsImage
+
+def make_records(directory: str, count: int, images: int) -> list:
+    """Flat note records, each with a thumbnail from a pool of image files without saved sizes."""
+    paths = []
+    for i in range(images):
+        path = os.path.join(directory, f"image{i}.png")
+        Image.new("RGB", (64 + i % 32, 64), (i % 256, 0, 0)).save(path)
+        paths.append(path)
+    return [{"id": i, "location": {"x": i % 1000, "y": i // 1000, "z": 0},
+             "description": {"text": f"# Note {i}\n\nImported lore."},
+             "thumbnail": {"image_path": paths[i % images]}} for i in range(count)]
+
+def one_by_one(project: Project, records: list):
+    """What importing took before: build and add each note, opening each image synchronously."""
+    for data in records:
+        note = Note(data["id"], Location.from_dict(data["location"]), None, Description.from_dict(data["description"]),
+                    LegendsImage(data["thumbnail"]["image_path"]))
+        project.add_note(note)
+
+def empty_project() -> Project:
+    project = Project(1, "Import benchmark", Settings(default_calendar()), {}, {})
+    project.spatial_index()
+    return project
+
+def main(count: int = 20_000, images: int = 2_000):
+    with tempfile.TemporaryDirectory() as directory:
+        records = make_records(directory, count, images)
+        print(f"{count:,} notes over {images:,} images\n")
+
+        project = empty_project()
+        begin = time.perf_counter()
+        one_by_one(project, records)
+        project.spatial_index()
+        print(f"{'one by one':<24}{time.perf_counter() - begin:>8.2f} s")
+
+        for label, processes in (("bulk, threads", False), ("bulk, processes", True)):
+            project = empty_project()
+            report = bulk_import(project, records, processes=processes)
+            project.spatial_index()
+            print(f"{label:<24}{report.elapsed:>8.2f} s  {report.notes_per_second:>10,.0f} notes/s")
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,60 @@
+"""Compare the binary project file with the JSON export.
+
+Run from the repository root:
+    python -m benchmarks.bench_project [notes]
+"""
+import sys
+import os
+import random
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from application.core import Note, Project, load_project
+from application.core.note import Tag
+from application.core.settings import Settings, default_calendar
+from application.utils import Location, Timestamp, Timerange, Description
+
+def build_project(count: int, seed: int = 0) -> Project:
+    """A project with `count` notes in a tree of eight children per note."""
+    rng = random.Random(seed)
+    settings = Settings(default_calendar())
+    tags = [Tag(i, f"tag{i}", rng.randrange(1 << 24)) for i in range(20)]
+    notes = {}
+    for i in range(count):
+        year = rng.randint(-3000, 3000)
+        timerange = Timerange(Timestamp(rng.randint(1, 28), rng.randint(1, 12), year),
+                              Timestamp(rng.randint(1, 28), rng.randint(1, 12), year + rng.randint(0, 50)))
+        note = Note(i, Location(rng.uniform(0, 1e4), rng.uniform(0, 1e4), 0), timerange,
+                    Description(f"# Note {i}\n\nSome *lore* about place {i}."), None,
+                    tags=rng.sample(tags, rng.randint(0, 3)))
+        if i:
+            note.parent = notes[(i - 1) // 8]
+            note.parent.children.append(note)
+        notes[i] = note
+    return Project(1, "Benchmark", settings, {}, notes)
+
+def timed(label: str, func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    print(f"{label:<24}{time.perf_counter() - start:>10.3f} s")
+    return result
+
+def main(count: int = 100_000):
+    project = build_project(count)
+    print(f"{count:,} notes")
+    with tempfile.TemporaryDirectory() as directory:
+        binary_path = os.path.join(directory, "bench.legends")
+        json_path = os.path.join(directory, "bench.json")
+
+        timed("binary save", project.save, binary_path)
+        timed("binary load", load_project, binary_path)
+        timed("lazy load", load_project, binary_path, True).close()
+        timed("json export", project.export_json, json_path)
+        timed("json load", load_project, json_path)
+        print(f"{'binary size':<24}{os.path.getsize(binary_path) / 1e6:>10.1f} MB")
+        print(f"{'json size':<24}{os.path.getsize(json_path) / 1e6:>10.1f} MB")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -0,0 +1,78 @@
+"""Time combined space and time queries against a full scan on a synthetic world.
+
+Run from the repository root:
+    python -m benchmarks.bench_query [notes]
+"""
+import sys
+import os
+import random
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from application.core import Note, Project
+from application.core.settings import Settings, default_calendar
+from application.utils import Location, Timestamp, Timerange
+
+WORLD_SIZE = 100_000.0
+
+def build_world(count: int, seed: int = 0) -> Project:
+    """Flat notes spread over a square world and six thousand years, clustered around a few hundred cities."""
+    rng = random.Random(seed)
+    cities = [(rng.uniform(0, WORLD_SIZE), rng.uniform(0, WORLD_SIZE)) for _ in range(300)]
+    notes = {}
+    for i in range(count):
+        x, y = cities[i % len(cities)]
+        year = rng.randint(-3000, 3000)
+        timerange = Timerange(Timestamp(1, rng.randint(1, 12), year), Timestamp(1, 1, year + rng.randint(0, 80)))
+        notes[i] = Note(i, Location(x + rng.gauss(0, 2000), y + rng.gauss(0, 2000), 0), timerange, None, None)
+    return Project(1, "Query benchmark", Settings(default_calendar()), {}, notes)
+
+def scan(project: Project, box, start: int, end: int) -> list:
+    """What answering the question took before: check every note."""
+    min_x, min_y, max_x, max_y = box
+    timeline = project.timeline_index()
+    results = []
+    for note in project.notes.values():
+        location = note.location
+        if min_x <= location.x <= max_x and min_y <= location.y <= max_y:
+            note_start, note_end = timeline._timerange_ticks(note.timerange)
+            if note_start <= end and note_end >= start:
+                results.append(note)
+    return results
+
+def best_of(func, repeat: int = 3) -> tuple:
+    best = float("inf")
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - begin)
+    return best, result
+
+def main(count: int = 100_000):
+    begin = time.perf_counter()
+    project = build_world(count)
+    print(f"{count:,} notes, built in {time.perf_counter() - begin:.1f} s")
+    begin = time.perf_counter()
+    project.spatial_index()
+    project.timeline_index()
+    print(f"indexes built in {time.perf_counter() - begin:.1f} s\n")
+
+    engine = project.timeline_index().engine
+    cases = {
+        "city, one century": ((40_000, 40_000, 45_000, 45_000), (100, 200)),
+        "region, whole history": ((20_000, 20_000, 50_000, 50_000), (-4000, 4000)),
+        "world, one year": ((0, 0, WORLD_SIZE, WORLD_SIZE), (1200, 1201)),
+    }
+    print(f"{'query':<24}{'plan':>6}{'results':>9}{'query s':>10}{'first s':>10}{'scan s':>10}")
+    for label, (box, (first_year, last_year)) in cases.items():
+        start, end = engine.to_ticks(1, 1, first_year), engine.to_ticks(1, 1, last_year)
+        query = project.query(box=box, start=start, end=end)
+        elapsed, results = best_of(lambda: list(query))
+        first, _ = best_of(lambda: next(iter(query), None))
+        scanned, expected = best_of(lambda: scan(project, box, start, end), repeat=1)
+        assert len(results) == len(expected)
+        print(f"{label:<24}{query.plan():>6}{len(results):>9,}{elapsed:>10.4f}{first:>10.4f}{scanned:>10.3f}")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -0,0 +1,63 @@
+"""Measure how long importing the model takes in a fresh interpreter, and what it drags in.
+
+Each statement runs in a new process so nothing is already imported; the time covers
+the imports alone, not interpreter startup. The command fails when importing the core
+model types takes longer than BUDGET_MS or loads one of HEAVY_MODULES, which should
+only be imported once an image is decoded, a description rendered or an index built.
+
+Run from the repository root:
+    python -m benchmarks.bench_startup [rounds]
+"""
+import sys
+import os
+import json
+import subprocess
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+BUDGET_MS = 50.0
+HEAVY_MODULES = ("PIL", "rich", "markdown_it", "numpy")
+
+STATEMENTS = {
+    "core model types": (
+        "from application.core import Note, Tag\n"
+        "from application.core.settings import Settings\n"
+        "from application.core.map import MapElement\n"
+        "from application.utils import Location, Timestamp, Timerange, Description, LegendsImage"),
+    "project": "from application.core import Project",
+    "everything": (
+        "from application.core import Project, bulk_import, iter_project_load\n"
+        "from application.utils import Description\n"
+        "from application.utils.tiles import TilePyramid\n"
+        "Description('*lore*').render()"),
+}
+
+_CHILD = """
+import json, sys, time
+start = time.perf_counter()
+exec(compile({statement!r}, "<startup>", "exec"))
+elapsed = time.perf_counter() - start
+print(json.dumps({{"ms": elapsed * 1000, "heavy": [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+def measure(statement: str) -> dict:
+    """Import time in milliseconds and heavy modules loaded by a statement, in a fresh interpreter."""
+    output = subprocess.run([sys.executable, "-c", _CHILD.format(statement=statement, heavy=HEAVY_MODULES)],
+                            cwd=ROOT, check=True, capture_output=True, text=True).stdout
+    return json.loads(output)
+
+def main(rounds: int = 7) -> int:
+    failed = False
+    for label, statement in STATEMENTS.items():
+        runs = [measure(statement) for _ in range(rounds)]
+        best = min(run["ms"] for run in runs)
+        heavy = runs[0]["heavy"]
+        print(f"{label:<20}{best:>8.1f} ms   {', '.join(heavy) or '-'}")
+        if label == "core model types" and (best > BUDGET_MS or heavy):
+            failed = True
+    if failed:
+        print(f"core model types must import in under {BUDGET_MS:.0f} ms without {', '.join(HEAVY_MODULES)}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else 7))
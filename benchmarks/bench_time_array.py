@@ -0,0 +1,47 @@
+"""Compare scalar and batch timestamp conversion.
+
+Run from the repository root:
+    python -m benchmarks.bench_time_array [count]
+"""
+import sys
+import os
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from application.core.settings import default_calendar
+from application.utils import CalendarEngine
+from application.utils import time_array
+
+def random_dates(engine: CalendarEngine, count: int, seed: int = 0):
+    """Valid random (days, months, years) columns."""
+    rng = np.random.default_rng(seed)
+    ticks = rng.integers(-engine.days_before_year(5000), engine.days_before_year(5000), count)
+    return time_array.from_ticks(ticks, engine)
+
+def timed(label: str, func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<24}{elapsed:>10.3f} s")
+    return result, elapsed
+
+def main(count: int = 1_000_000):
+    engine = CalendarEngine(default_calendar())
+    days, months, years = random_dates(engine, count)
+    columns = list(zip(days.tolist(), months.tolist(), years.tolist()))
+    print(f"{count:,} timestamps")
+
+    scalar, scalar_time = timed("scalar to_ticks", lambda: [engine.to_ticks(*date) for date in columns])
+    batch, batch_time = timed("batch to_ticks", time_array.to_ticks, days, months, years, engine)
+    assert np.array_equal(batch, np.array(scalar, dtype=np.int64))
+    print(f"{'speedup':<24}{scalar_time / batch_time:>10.1f} x")
+
+    ticks = batch.tolist()
+    _, scalar_time = timed("scalar from_ticks", lambda: [engine.from_ticks(t) for t in ticks])
+    _, batch_time = timed("batch from_ticks", time_array.from_ticks, batch, engine)
+    print(f"{'speedup':<24}{scalar_time / batch_time:>10.1f} x")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
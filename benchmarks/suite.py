@@ -0,0 +1,185 @@
+"""Micro-benchmarks of the model's hot paths, recorded over time to catch regressions.
+
+Each case times one operation over a synthetic world and reports microseconds per
+operation, best of several rounds. With --save the run is appended to a history file;
+with --check the run is compared with the median of the last saved runs from the same
+machine and the command fails when a case got slower than the threshold allows.
+
+Run from the repository root:
+    python -m benchmarks.suite [--quick] [--save] [--check] [--only NAME ...]
+"""
+import sys
+import os
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from typing import Callable, Dict, List, Tuple
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from PIL import Image
+
+from application.core import Note
+from application.core.map import MapElement
+from application.core.settings import Calendar, Settings, default_calendar, stormlight_calendar
+from application.utils import Location, Timestamp, Timerange, Description, LegendsImage
+from application.utils.image import image_cache
+from benchmarks.world import generate_world
+
+HISTORY_PATH = os.path.join(os.path.dirname(__file__), "history.jsonl")
+
+# A case prepares its data and returns (operation, operations per call of it)
+Case = Callable[[int, str], Tuple[Callable[[], object], int]]
+CASES: Dict[str, Case] = {}
+
+def case(name: str):
+    def register(prepare: Case) -> Case:
+        CASES[name] = prepare
+        return prepare
+    return register
+
+@case("note construction")
+def _note_construction(size: int, directory: str):
+    location, timerange = Location(1, 2, 0), Timerange(Timestamp(1, 1, 0), Timestamp(1, 1, 5))
+    description = Description("Some *lore*.")
+    return lambda: [Note(i, location, timerange, description, None) for i in range(size)], size
+
+@case("note to_dict")
+def _note_to_dict(size: int, directory: str):
+    notes = list(generate_world(notes=size, map_elements=0).notes.values())
+    return lambda: [note.to_dict() for note in notes], size
+
+@case("note from_dicts")
+def _note_from_dicts(size: int, directory: str):
+    records = [record for note in generate_world(notes=size, map_elements=0).root_notes()
+               for record in note.subtree_to_dicts()]
+    return lambda: Note.from_dicts(records), size
+
+@case("note subtree serialize")
+def _note_serialize(size: int, directory: str):
+    roots = generate_world(notes=size, map_elements=0).root_notes()
+    return lambda: [Note.deserialize(root.serialize()) for root in roots], size
+
+@case("settings round trip")
+def _settings_round_trip(size: int, directory: str):
+    settings = [Settings(default_calendar()), Settings(stormlight_calendar())]
+    count = max(1, size // 50)
+    return lambda: [Settings.deserialize(item.serialize()) for _ in range(count) for item in settings], 2 * count
+
+@case("calendar from_dict")
+def _calendar_from_dict(size: int, directory: str):
+    data = [default_calendar().to_dict(), stormlight_calendar().to_dict()]
+    count = max(1, size // 20)
+    return lambda: [Calendar.from_dict(item) for _ in range(count) for item in data], 2 * count
+
+@case("map element from_dict")
+def _map_element_from_dict(size: int, directory: str):
+    records = [element.to_dict() for element in generate_world(notes=0, map_elements=size).map_elements.values()]
+    return lambda: [MapElement.from_dict(record) for record in records], size
+
+@case("image header")
+def _image_header(size: int, directory: str):
+    paths = _images(directory, 50)
+    count = max(1, size // 50)
+    return lambda: [LegendsImage(path) for _ in range(count) for path in paths], count * len(paths)
+
+@case("image decode")
+def _image_decode(size: int, directory: str):
+    images = [LegendsImage(path) for path in _images(directory, 50)]
+
+    def decode():
+        image_cache.clear()
+        return [image.image for image in images]
+    return decode, len(images)
+
+@case("location distance_to")
+def _location_distance(size: int, directory: str):
+    locations = [Location(i * 0.5, -i * 0.25, i % 7) for i in range(size)]
+    origin = Location(3, 4, 5)
+    return lambda: [location.distance_to(origin) for location in locations], size
+
+def _images(directory: str, count: int) -> List[str]:
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"image{i}.png")
+        if not os.path.exists(path):
+            Image.new("RGB", (256, 128 + i), (i, 0, 0)).save(path)
+        paths.append(path)
+    return paths
+
+def run(names: List[str], size: int, rounds: int) -> Dict[str, float]:
+    """Best microseconds per operation of each case."""
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name in names:
+            operation, count = CASES[name](size, directory)
+            best = float("inf")
+            for _ in range(rounds):
+                begin = time.perf_counter()
+                operation()
+                best = min(best, time.perf_counter() - begin)
+            results[name] = best / count * 1e6
+            print(f"{name:<28}{results[name]:>12.3f} us/op")
+    return results
+
+def machine() -> str:
+    return f"{platform.node()} {platform.machine()} python {platform.python_version()}"
+
+def revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(__file__), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def load_history(path: str = HISTORY_PATH) -> List[dict]:
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+def save_run(results: Dict[str, float], size: int, path: str = HISTORY_PATH):
+    run = {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "revision": revision(), "machine": machine(),
+           "size": size, "results": results}
+    with open(path, "a", encoding="utf-8") as file:
+        file.write(json.dumps(run) + "\n")
+
+def regressions(results: Dict[str, float], history: List[dict], size: int, threshold: float = 0.25,
+                window: int = 5) -> List[Tuple[str, float, float]]:
+    """(case, baseline, now) of cases slower than the median of the last comparable runs by more than threshold."""
+    runs = [run for run in history if run["machine"] == machine() and run["size"] == size][-window:]
+    slower = []
+    for name, now in results.items():
+        previous = [run["results"][name] for run in runs if name in run["results"]]
+        if previous:
+            baseline = statistics.median(previous)
+            if now > baseline * (1 + threshold):
+                slower.append((name, baseline, now))
+    return slower
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--quick", action="store_true", help="smaller data and fewer rounds")
+    parser.add_argument("--save", action="store_true", help="append this run to the history file")
+    parser.add_argument("--check", action="store_true", help="fail on regressions against the history")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown, 0.25 is 25%%")
+    parser.add_argument("--history", default=HISTORY_PATH)
+    parser.add_argument("--only", nargs="+", choices=sorted(CASES), default=list(CASES))
+    args = parser.parse_args(argv)
+
+    size, rounds = (1_000, 3) if args.quick else (10_000, 5)
+    results = run(args.only, size, rounds)
+    history = load_history(args.history)
+    slower = regressions(results, history, size, args.threshold) if args.check else []
+    for name, baseline, now in slower:
+        print(f"REGRESSION {name}: {baseline:.3f} -> {now:.3f} us/op ({now / baseline - 1:+.0%})")
+    if args.save:
+        save_run(results, size, args.history)
+    return 1 if slower else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
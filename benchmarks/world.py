@@ -0,0 +1,105 @@
+"""Seeded synthetic worlds for benchmarks: deep note trees, dense maps and long timelines.
+
+The same seed and sizes always produce the same project, so timings stay comparable
+between runs and between commits.
+"""
+import sys
+import os
+import random
+from typing import List, Optional
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from application.core import Note, Project
+from application.core.map import MapElement, MapImageElement, MapAzgaarElement
+from application.core.note import Tag
+from application.core.settings import Settings, default_calendar
+from application.utils import Location, Scale, Timestamp, Timerange, Description, LegendsImage
+
+_WORDS = ("storm", "highprince", "shardblade", "chasm", "spren", "oath", "plateau", "gemheart", "tower",
+          "surge", "radiant", "city", "river", "ruin", "war", "king", "bridge", "fabrial", "stone", "song")
+
+def random_description(rng: random.Random, paragraphs: int) -> Description:
+    """Markdown with a heading, emphasis, links and lists, a few paragraphs long."""
+    blocks = [f"# {rng.choice(_WORDS).title()} of {rng.choice(_WORDS)}"]
+    for _ in range(paragraphs):
+        words = [rng.choice(_WORDS) for _ in range(rng.randint(20, 80))]
+        words[rng.randrange(len(words))] = f"**{rng.choice(_WORDS)}**"
+        words[rng.randrange(len(words))] = f"[{rng.choice(_WORDS)}](note://{rng.randrange(1000)})"
+        blocks.append(" ".join(words) + ".")
+    if rng.random() < 0.3:
+        blocks.append("\n".join(f"- {rng.choice(_WORDS)}" for _ in range(rng.randint(2, 6))))
+    return Description("\n\n".join(blocks))
+
+def random_timerange(rng: random.Random, first_year: int, last_year: int) -> Timerange:
+    """Mostly short spans with a long tail of eras, anywhere in [first_year, last_year]."""
+    year = rng.randint(first_year, last_year)
+    years = min(int(rng.expovariate(1 / 20)), last_year - year)
+    return Timerange(Timestamp(rng.randint(1, 28), rng.randint(1, 12), year),
+                     Timestamp(rng.randint(1, 28), rng.randint(1, 12), year + years + 1))
+
+def generate_notes(rng: random.Random, count: int, max_depth: int = 24, world_size: float = 100_000.0,
+                   years: tuple = (-5000, 5000), tags: Optional[List[Tag]] = None,
+                   images: Optional[List[LegendsImage]] = None, first_id: int = 0) -> List[Note]:
+    """Linked notes forming a few deep trees; children sit near their parent in space and time.
+
+    Each note descends from the note before it or from one of that note's ancestors, so
+    branches run up to max_depth levels deep and the tree stays in parents-first order.
+    """
+    tags = tags or []
+    notes: List[Note] = []
+    path: List[Note] = []
+    for i in range(count):
+        # Usually go one level deeper, otherwise branch off an ancestor or start a new tree
+        if len(path) < max_depth and rng.random() < 0.75:
+            level = len(path)
+        else:
+            level = rng.randint(0, max(0, len(path) - 1))
+        parent = path[level - 1] if level else None
+        if parent is None:
+            location = Location(rng.uniform(0, world_size), rng.uniform(0, world_size), 0)
+            timerange = random_timerange(rng, *years)
+        else:
+            location = Location(parent.location.x + rng.gauss(0, 500), parent.location.y + rng.gauss(0, 500), 0)
+            start_year = parent.timerange.start.year + rng.randint(0, 10)
+            timerange = random_timerange(rng, start_year, start_year + 5)
+        note = Note(first_id + i, location, timerange, random_description(rng, rng.randint(1, 4)),
+                    rng.choice(images) if images and rng.random() < 0.2 else None,
+                    tags=rng.sample(tags, min(len(tags), rng.randint(0, 3))))
+        if parent is not None:
+            note.parent = parent
+            parent.children.append(note)
+        path = path[:level] + [note]
+        notes.append(note)
+    return notes
+
+def generate_map_elements(rng: random.Random, count: int, world_size: float = 100_000.0,
+                          image: Optional[LegendsImage] = None, first_id: int = 0) -> List[MapElement]:
+    """A dense mix of plain, image and Azgaar map elements clustered around a few regions."""
+    image = image or LegendsImage("maps/region.png", 2048, 2048, "png")
+    regions = [(rng.uniform(0, world_size), rng.uniform(0, world_size)) for _ in range(max(1, count // 50))]
+    elements = []
+    for i in range(count):
+        x, y = rng.choice(regions)
+        location = Location(x + rng.gauss(0, 2000), y + rng.gauss(0, 2000), rng.randint(0, 5))
+        scale = Scale(rng.uniform(0.5, 4), rng.uniform(0.5, 4), 1)
+        rotation = rng.uniform(0, 360)
+        kind = rng.random()
+        if kind < 0.5:
+            elements.append(MapImageElement(first_id + i, location, scale, rotation, image))
+        elif kind < 0.6:
+            elements.append(MapAzgaarElement(first_id + i, location, scale, rotation, f"maps/region{i}.json"))
+        else:
+            elements.append(MapElement(first_id + i, location, scale, rotation))
+    return elements
+
+def generate_world(seed: int = 0, notes: int = 10_000, map_elements: int = 1_000, tags: int = 50,
+                   max_depth: int = 24, years: tuple = (-5000, 5000),
+                   images: Optional[List[LegendsImage]] = None) -> Project:
+    """A whole synthetic project, identical for identical arguments."""
+    rng = random.Random(seed)
+    tag_list = [Tag(i, f"{rng.choice(_WORDS)} {i}", rng.randrange(1 << 24)) for i in range(tags)]
+    note_list = generate_notes(rng, notes, max_depth, years=years, tags=tag_list, images=images)
+    element_list = generate_map_elements(rng, map_elements)
+    return Project(seed, f"Synthetic world {seed}", Settings(default_calendar()),
+                   {element.id: element for element in element_list}, {note.id: note for note in note_list})
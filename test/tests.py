@@ -5,7 +5,14 @@ import pytest
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../application')))
 
 from application.core import Note
-from application.utils import Location, Timestamp, Timerange, Description, LegendsImage
+from application.utils import Location, Timestamp, Timerange, Description, LegendsImage, CalendarEngine
+from application.utils.calendar_engine import set_active_calendar
+
+@pytest.fixture(autouse=True)
+def default_active_calendar():
+    """Projects switch the active calendar; every test starts from the default one."""
+    from application.core.settings import default_calendar
+    set_active_calendar(default_calendar())
 
 def test_notes():
     location = Location(0, 0, 0)
@@ -19,4 +26,998 @@ def test_notes():
 
     legends_image = None
 
-    note1 = Note(location, timerange, description, legends_image, legends_image, None, None)
\ No newline at end of file
+    note1 = Note(location, timerange, description, legends_image, legends_image, None, None)
+
+def _naive_dates(calendar, years):
+    """Walk every day of the first few years the slow way."""
+    month_unit = calendar.time_unit_list
+    while month_unit.name != "Month":
+        month_unit = month_unit.child
+    engine = CalendarEngine(calendar)
+    for year in range(years):
+        for month in range(1, month_unit.number + 1):
+            for day in range(1, engine.days_in_month(month, year) + 1):
+                yield day, month, year
+
+def test_calendar_engine_round_trip():
+    from application.core.settings import default_calendar, stormlight_calendar
+
+    for calendar in (default_calendar(), stormlight_calendar()):
+        engine = CalendarEngine(calendar)
+        for ticks, date in enumerate(_naive_dates(calendar, 9)):
+            assert engine.to_ticks(*date) == ticks
+            assert engine.from_ticks(ticks) == date
+
+    engine = CalendarEngine(default_calendar())
+    assert engine.days_in_year(2024) == 366
+    assert engine.days_in_year(2023) == 365
+    assert engine.from_ticks(engine.to_ticks(29, 2, -4)) == (29, 2, -4)
+    assert Timestamp(1, 1, 0).time_between(Timestamp(1, 1, 4)) == 365 * 4 + 1
+
+    with pytest.raises(ValueError):
+        engine.to_ticks(29, 2, 2023)
+
+def test_calendar_engine_custom_lengths():
+    from application.core.settings import Calendar, TimeUnit
+
+    days = TimeUnit(name="Day", number=20)
+    months = TimeUnit(name="Month", number=3, names=["Frost", "Thaw"], custom_lengths={"Frost": 10, "Thaw": 15})
+    days.add_child(months)
+    calendar = Calendar(time_unit_list=days, leap_day_freq=3, leap_day_amount=2, leap_unit=days)
+
+    engine = CalendarEngine(calendar)
+    assert engine.common_lengths == (10, 15, 20)
+    assert engine.days_in_year(3) == 47
+    for ticks in range(-200, 200):
+        assert engine.to_ticks(*engine.from_ticks(ticks)) == ticks
+
+def test_compiled_calendar():
+    from application.core.settings import Calendar, default_calendar, stormlight_calendar
+    from application.utils.calendar_engine import compile_calendar
+
+    engine = compile_calendar(default_calendar())
+    assert compile_calendar(Calendar.deserialize(default_calendar().serialize())) is engine
+    assert compile_calendar(stormlight_calendar()) is not engine
+    assert engine.convert(2, "Day", "Minute") == pytest.approx(2 * 24 * 60)
+    assert engine.convert(4 * 12, "Month", "Day") == pytest.approx(365 * 4 + 1)
+    assert engine.instance_length("Month", "February Leap") == 29
+
+    stormlight = compile_calendar(stormlight_calendar())
+    assert stormlight.convert(1, "Year", "Week") == pytest.approx(100)
+    with pytest.raises(AttributeError):
+        engine.months_per_year = 10
+
+    # The engine is cached on the calendar until the calendar is edited
+    from application.utils.calendar_engine import calendar_edited
+    calendar = default_calendar()
+    assert compile_calendar(calendar) is compile_calendar(calendar)
+    calendar.leap_day_freq = 0
+    assert compile_calendar(calendar).days_in_year(2024) == 365
+    month = calendar.time_unit_list
+    while month.name != "Month":
+        month = month.child
+    month.custom_lengths["February"] = 30
+    calendar_edited(month)
+    assert compile_calendar(calendar).days_in_year(2023) == 367
+    # Building or editing other calendars leaves the cached engine in place
+    cached = compile_calendar(calendar)
+    default_calendar().leap_day_freq = 5
+    assert calendar._engine[1] is cached and compile_calendar(calendar) is cached
+    month.number = 13
+    assert compile_calendar(calendar).months_per_year == 13
+
+    # Unit lengths come from the engine of the calendar holding the unit
+    calendar = default_calendar()
+    units = {unit.name: unit for unit in calendar.time_unit_list.chain()}
+    assert units["Day"].total_length(calendar) == 30 * 12 and units["Hour"].total_length(calendar) == 24 * 30 * 12
+    assert units["Month"].get_length("February", calendar) == 28 and units["Month"].get_length(None, calendar) == 12
+    assert calendar.calculate_leap_year_adjustment(2024) == 1 and calendar.calculate_leap_year_adjustment(2023) == 0
+
+def test_time_array_matches_scalar():
+    import numpy as np
+    from application.core.settings import default_calendar, stormlight_calendar
+    from application.utils import time_array
+
+    for calendar in (default_calendar(), stormlight_calendar()):
+        engine = CalendarEngine(calendar)
+        ticks = np.arange(-3000, 3000, 7, dtype=np.int64)
+        days, months, years = time_array.from_ticks(ticks, engine)
+        assert [engine.from_ticks(t) for t in ticks.tolist()] == list(zip(days.tolist(), months.tolist(), years.tolist()))
+        assert np.array_equal(time_array.to_ticks(days, months, years, engine), ticks)
+
+    with pytest.raises(ValueError):
+        time_array.to_ticks([30], [2], [2024])
+
+def test_timeline_index_queries():
+    import random
+    from application.core.timeline import TimelineIndex
+
+    rng = random.Random(3)
+    spans = {}
+    for note_id in range(400):
+        start = rng.randint(0, 5000)
+        spans[note_id] = (start, start + rng.randint(0, 300))
+
+    index = TimelineIndex()
+    index.build((note_id, start, end) for note_id, (start, end) in spans.items())
+    for note_id in range(0, 400, 3):
+        index.remove(note_id)
+        del spans[note_id]
+    for note_id in range(400, 500):
+        start = rng.randint(0, 5000)
+        spans[note_id] = (start, start + rng.randint(0, 300))
+        index.insert_span(note_id, *spans[note_id])
+
+    for _ in range(50):
+        lo = rng.randint(-100, 5200)
+        hi = lo + rng.randint(0, 400)
+        assert sorted(index.overlapping(lo, hi)) == sorted(i for i, (s, e) in spans.items() if s <= hi and e >= lo)
+        assert sorted(index.within(lo, hi)) == sorted(i for i, (s, e) in spans.items() if s >= lo and e <= hi)
+        assert sorted(index.containing(lo, hi)) == sorted(i for i, (s, e) in spans.items() if s <= lo and e >= hi)
+        assert sorted(index.at(lo)) == sorted(i for i, (s, e) in spans.items() if s <= lo <= e)
+        # Counts stay exact through the edits above
+        assert index.count_overlapping(lo, hi) == len(index.overlapping(lo, hi))
+        assert index.count_before(lo) == (sum(s < lo for s, _ in spans.values()), sum(e < lo for _, e in spans.values()))
+
+    note = Note(7, Location(0, 0, 0), Timerange(Timestamp(1, 1, 10), Timestamp(1, 1, 12)), None, None)
+    index.update(note)
+    assert 7 in index.at(Timestamp(5, 6, 11))
+
+def test_spatial_index_queries():
+    import random
+    from application.core.spatial import SpatialIndex
+
+    rng = random.Random(5)
+    points = {i: Location(rng.uniform(-500, 500), rng.uniform(-500, 500), rng.uniform(0, 10)) for i in range(600)}
+    index = SpatialIndex(cell_size=40)
+    for key, location in points.items():
+        index.insert(key, location)
+    for key in range(0, 600, 5):
+        points[key] = Location(rng.uniform(-900, 900), rng.uniform(-900, 900), 0)
+        index.move(key, points[key])
+    for key in range(1, 600, 7):
+        index.remove(key)
+        del points[key]
+
+    assert sorted(index.in_box(-100, -50, 200, 300)) == sorted(
+        k for k, p in points.items() if -100 <= p.x <= 200 and -50 <= p.y <= 300)
+
+    for query in (Location(0, 0, 0), Location(850, -870, 3), Location(5000, 5000, 0)):
+        assert sorted(index.in_radius(query, 150)) == sorted(
+            k for k, p in points.items() if p.distance_to(query) <= 150)
+        expected = sorted(points, key=lambda k: points[k].distance_to(query))[:10]
+        nearest = index.nearest(query, 10)
+        assert [k for k, _ in nearest] == expected
+        assert nearest[0][1] == pytest.approx(points[expected[0]].distance_to(query))
+
+def test_location_array_distances():
+    import numpy as np
+    from application.utils.location_array import LocationArray, pairwise_distances, paired_distances
+
+    locations = [Location(i, -i * 0.5, i % 3) for i in range(50)]
+    array = LocationArray(capacity=4)
+    array.extend(locations[:10])
+    for location in locations[10:]:
+        array.append(location)
+    assert len(array) == 50
+    assert not hasattr(locations[0], "__dict__")
+
+    query = Location(3, 2, 1)
+    assert np.allclose(array.distances_to(query), [loc.distance_to(query) for loc in locations])
+    assert array.nearest(query, 3).tolist() == sorted(range(50), key=lambda i: locations[i].distance_to(query))[:3]
+    assert array.within_radius(query, 4).tolist() == [i for i, loc in enumerate(locations) if loc.distance_to(query) <= 4]
+
+    matrix = pairwise_distances(array, LocationArray.from_locations(locations[:5]))
+    assert matrix.shape == (50, 5)
+    assert np.allclose(matrix[7, 2], locations[7].distance_to(locations[2]))
+    assert np.allclose(paired_distances(array, array), 0)
+
+def test_legends_image_lazy_cache(tmp_path):
+    from PIL import Image
+    from application.utils.image import image_cache
+
+    paths = []
+    for i in range(3):
+        path = tmp_path / f"map{i}.png"
+        Image.new("RGB", (40, 30), (i, 0, 0)).save(path)
+        paths.append(str(path))
+
+    image_cache.clear()
+    image_cache.resize(2 * 40 * 30 * 3)
+    try:
+        images = [LegendsImage(path) for path in paths]
+        assert (images[0].width, images[0].height, images[0].file_type) == (40, 30, "png")
+        assert len(image_cache) == 0
+
+        assert images[0].image.getpixel((0, 0)) == (0, 0, 0)
+        images[1].image
+        images[2].image
+        assert paths[0] not in image_cache and paths[2] in image_cache
+        assert image_cache.current_bytes <= image_cache.max_bytes
+
+        restored = LegendsImage.deserialize(images[1].serialize())
+        assert restored.image_path == paths[1] and restored.height == 30
+    finally:
+        image_cache.clear()
+        image_cache.resize(512 * 1024 * 1024)
+
+def test_tile_pyramid(tmp_path):
+    from PIL import Image
+    from application.core.map import MapImageElement
+    from application.utils import Scale
+
+    path = tmp_path / "world.png"
+    Image.new("RGB", (1000, 600), (10, 20, 30)).save(path)
+
+    element = MapImageElement(1, Location(100, 0, 0), Scale(2, 2, 1), 0, LegendsImage(str(path)))
+    pyramid = element.tile_pyramid(str(tmp_path / "tiles"))
+    assert pyramid.max_level == 2
+    assert pyramid.grid_size(0) == (4, 3) and pyramid.grid_size(2) == (1, 1)
+    assert pyramid.build(workers=2) == 12 + 4 + 1
+    assert pyramid.build() == 0
+    assert pyramid.tile(1, 1, 1).size == (244, 44)
+    assert pyramid.tile(0, 0, 0).getpixel((5, 5)) == (10, 20, 30)
+
+    assert element.visible_tiles(100, 0, 300, 200, zoom=0.5) == [(0, 0, 0)]
+    assert element.visible_tiles(0, 0, 4000, 4000, zoom=0.1) == [(2, 0, 0)]
+
+    # Tiles asked for at once from several threads share one build of an unbuilt pyramid
+    from concurrent.futures import ThreadPoolExecutor
+    from application.utils.tiles import TilePyramid
+
+    fresh = TilePyramid(str(path), str(tmp_path / "fresh"))
+    with ThreadPoolExecutor(4) as pool:
+        tiles = list(pool.map(lambda tile: fresh.tile(*tile), [(0, 0, 0), (0, 3, 2), (1, 1, 1), (2, 0, 0)]))
+    assert [tile.size for tile in tiles] == [(256, 256), (232, 88), (244, 44), (250, 150)]
+    leftovers = [name for _, _, names in os.walk(fresh.directory) for name in names
+                 if name.startswith(".") or name.endswith(".raw") or name.startswith("manifest.json.")]
+    assert leftovers == []
+
+    # Images over PIL's pixel limit are decoded in workers; this process keeps the limit
+    limit = Image.MAX_IMAGE_PIXELS
+    Image.MAX_IMAGE_PIXELS = 100_000
+    try:
+        large = TilePyramid(str(path), str(tmp_path / "large"))
+        assert (large.width, large.height) == (1000, 600) and large.build(workers=0) == 17
+        assert Image.MAX_IMAGE_PIXELS == 100_000
+        assert TilePyramid(str(path), str(tmp_path / "large")).width == 1000
+    finally:
+        Image.MAX_IMAGE_PIXELS = limit
+
+    # Formats without alpha get RGB tiles, even from a transparent source
+    clear = tmp_path / "clear.png"
+    Image.new("RGBA", (300, 100), (10, 20, 30, 0)).save(clear)
+    jpeg = TilePyramid(str(clear), str(tmp_path / "jpeg"), tile_format="jpeg")
+    assert jpeg.build(workers=0) == 2 + 1
+    assert jpeg.tile(0, 1, 0).mode == "RGB"
+
+def test_azgaar_streaming_import(tmp_path):
+    import json
+    from application.core.map import MapAzgaarElement
+    from application.core.spatial import SpatialIndex
+    from application.utils import Scale
+    from application.utils.azgaar import import_azgaar
+
+    export = {
+        "info": {"mapName": "Testland", "width": 960, "height": 540},
+        "settings": {"distanceUnit": "km", "escaped": "quote \" and brace { inside"},
+        "pack": {
+            "cells": [{"i": i, "p": [i * 1.5, i * 2.0], "h": 20 + i, "biome": i % 5, "state": 1, "burg": 0}
+                      for i in range(300)],
+            "burgs": [{}, {"i": 1, "name": "Ardenne", "x": 10.5, "y": 20.25, "cell": 7, "state": 1,
+                           "population": 12.3, "capital": 1},
+                      {"i": 2, "name": "Gone", "x": 1, "y": 1, "removed": True},
+                      {"i": 3, "name": "Brell", "x": 100, "y": 50, "cell": 9, "state": 1}],
+            "states": [{"i": 0, "name": "Neutrals"}, {"i": 1, "name": "Valmark", "capital": 1, "center": 7}],
+            "markers": [{"i": 0, "type": "volcanoes", "x": 300, "y": 200, "cell": 40}],
+        },
+        "grid": {"cells": [{"i": i, "h": i % 100} for i in range(2000)]},
+        "notes": [{"id": "burg1", "name": "Ardenne", "legend": "Old \\u00e9 capital"},
+                  {"id": "marker0", "name": "Mount Fury", "legend": "Smoke"}],
+    }
+    path = tmp_path / "export.json"
+    path.write_text(json.dumps(export, indent=1))
+
+    data = import_azgaar(str(path), chunk_size=97)
+    assert data.info["mapName"] == "Testland"
+    assert data.burgs.names == ["Ardenne", "Brell"]
+    assert list(data.burgs["x"]) == [10.5, 100.0] and list(data.burgs["capital"]) == [1, 0]
+    assert data.states.names == ["Valmark"] and (data.states["x"][0], data.states["y"][0]) == (10.5, 20.25)
+    assert len(data.cells) == 300 and data.cells["height"][299] == 319
+    assert data.markers.names == ["Mount Fury"] and data.marker_types == ["volcanoes"]
+
+    element = MapAzgaarElement(1, Location(1000, 0, 0), Scale(2, 2, 1), 0, str(path))
+    index = SpatialIndex(cell_size=50)
+    timerange = Timerange(Timestamp(1, 1, 0), Timestamp(1, 1, 1))
+    notes = element.create_notes(100, timerange, spatial_index=index)
+    assert [note.id for note in notes] == [100, 101, 102]
+    assert (notes[0].location.x, notes[0].location.y) == (1021.0, 40.5)
+    assert "Smoke" in notes[2].description.text
+    assert index.nearest(Location(1600, 400, 0))[0][0] == 102
+
+    element.index_layer(index, "cells")
+    assert ("cells", 3) in index
+
+def test_json_stream_chunk_boundaries():
+    import io
+    import json
+    from application.utils.azgaar import _JsonStream
+
+    text = json.dumps([1.5, -2e-3, 3E+20, 10, 0.25, -7, True, None, "x1.5", {"a": 12.75, "b": [6e5]}, 123456])
+    expected = json.loads(text)
+    # Every chunk size cuts some number right after its "." or "e"
+    for chunk_size in range(1, 24):
+        stream = _JsonStream(io.StringIO(text), chunk_size)
+        assert list(stream.iter_array()) == expected
+
+def _sample_project(path=None):
+    from application.core import Project
+    from application.core.map import MapElement, MapAzgaarElement
+    from application.core.note import Tag
+    from application.core.settings import Settings, stormlight_calendar
+    from application.utils import Scale
+
+    settings = Settings(stormlight_calendar())
+    set_active_calendar(settings.calendar)
+    city = Tag(1, "city", 0xff0000)
+    notes = {}
+    for i in range(30):
+        timerange = Timerange(Timestamp(1 + i % 50, 1 + i % 10, 100 + i), Timestamp(3, 4, 200 + i))
+        notes[i] = Note(i, Location(i, -i, 0.5), timerange, Description(f"Note *{i}*"), None,
+                        tags=[city] if i % 3 == 0 else None)
+    notes[5].thumbnail = LegendsImage("portraits/kaladin.png", 64, 64)
+    notes[5].attach_image(LegendsImage("maps/shattered_plains.jpg", 4000, 3000))
+    for i in range(1, 30):
+        parent = notes[(i - 1) // 3]
+        notes[i].parent = parent
+        parent.children.append(notes[i])
+    map_elements = {
+        1: MapElement(1, Location(0, 0, 0), Scale(1, 1, 1), 0.0),
+        2: MapAzgaarElement(2, Location(5, 5, 0), Scale(2, 2, 1), 45.0, "world.json"),
+    }
+    return Project(7, "Roshar", settings, map_elements, notes, path)
+
+def _assert_same_project(loaded, project):
+    assert (loaded.id, loaded.name) == (project.id, project.name)
+    assert loaded.settings.calendar.to_dict() == project.settings.calendar.to_dict()
+    assert [n.id for n in loaded.root_notes()] == [n.id for n in project.root_notes()]
+    for note_id, note in project.notes.items():
+        other = loaded.notes[note_id]
+        assert other.to_dict() == note.to_dict()
+        engine = project.calendar_engine
+        assert other.timerange.length_in(engine) == note.timerange.length_in(engine)
+    assert {k: e.to_dict() for k, e in loaded.map_elements.items()} == {k: e.to_dict() for k, e in project.map_elements.items()}
+
+def test_project_save_and_load(tmp_path):
+    from application.core import load_project
+
+    project = _sample_project(str(tmp_path / "roshar.legends"))
+    project.save()
+    loaded = load_project(project.path)
+    _assert_same_project(loaded, project)
+    assert [tag.name for tag in loaded.notes[3].tags] == ["city"]
+    assert loaded.notes[3].tags[0] is loaded.notes[6].tags[0]
+
+    project.export_json(str(tmp_path / "roshar.json"))
+    _assert_same_project(load_project(str(tmp_path / "roshar.json")), project)
+
+def test_projects_keep_their_own_calendar(tmp_path):
+    from application.core import Project, load_project
+    from application.core.settings import Settings, default_calendar, stormlight_calendar
+    from application.utils.calendar_engine import compile_calendar, get_calendar_engine
+
+    default = compile_calendar(default_calendar())
+    set_active_calendar(default)
+    roshar = _sample_project(str(tmp_path / "roshar.legends"))
+    set_active_calendar(default)
+    roshar.save()
+    # Building, loading and deserializing other projects leaves the active calendar alone
+    earth = Project(2, "Earth", Settings(default_calendar()), {}, {})
+    loaded = load_project(roshar.path)
+    Project.deserialize(roshar.serialize())
+    assert get_calendar_engine() is default and earth.calendar_engine is default
+
+    stormlight = loaded.calendar_engine
+    assert stormlight is compile_calendar(stormlight_calendar())
+    during = loaded.query(start=Timestamp(1, 1, 225), end=Timestamp(1, 1, 300))
+    assert sorted(note.id for note in during) == list(range(25, 30))
+    timerange = loaded.notes[3].timerange
+    assert timerange.length_in(stormlight) == timerange.start.time_between(timerange.end, stormlight)
+    assert timerange.length_in(default) == timerange.start.time_between(timerange.end, default)
+    assert timerange.length_in(stormlight) != timerange.length_in(default)
+    # Printing never measures, so dates valid only in the project calendar still have a repr
+    assert repr(Timerange(Timestamp(40, 1, 0), Timestamp(45, 1, 0))).endswith("day=45, month=1, year=0))")
+    loaded.activate()
+    assert get_calendar_engine() is stormlight
+
+def test_project_incremental_save(tmp_path):
+    from application.core import load_project
+    from application.core.map import MapElement
+    from application.utils import Scale
+
+    project = _sample_project(str(tmp_path / "roshar.legends"))
+    project.save()
+    assert not project.has_unsaved_changes()
+
+    project.notes[4].description = Description("Edited")
+    project.mark_dirty(project.notes[4])
+    project.remove_note(2)
+    project.add_note(Note(700, Location(1, 2, 3), Timerange(Timestamp(1, 1, 1), Timestamp(2, 1, 1)),
+                          Description("New"), None), parent=project.notes[0])
+    project.remove_map_element(2)
+    project.add_map_element(MapElement(3, Location(1, 1, 0), Scale(1, 1, 1), 90.0))
+    assert project.has_unsaved_changes()
+    project.save()
+
+    loaded = load_project(project.path)
+    _assert_same_project(loaded, project)
+    assert 2 not in loaded.notes and 8 not in loaded.notes
+    assert [child.id for child in loaded.notes[0].children] == [1, 3, 700]
+
+def test_project_saves_assigned_fields(tmp_path):
+    from application.core import load_project
+    from application.core.storage import Compaction
+
+    project = _sample_project(str(tmp_path / "roshar.legends"))
+    project.save()
+    # Assigning a field is enough, for loaded notes as well as lazily loaded ones
+    project.notes[4].location = Location(40, 40, 0)
+    project.notes[6].attach_image(LegendsImage("maps/urithiru.png", 800, 600))
+    removed = project.notes[2]
+    project.remove_note(2)
+    removed.description = Description("Gone")
+    assert project.has_unsaved_changes() and 2 not in project._dirty_notes
+    project.save()
+
+    lazy = load_project(project.path, lazy=True)
+    try:
+        assert lazy.notes[4].location.x == 40 and len(lazy.notes[6].attached_images) == 1
+        assert not lazy.has_unsaved_changes()
+        lazy.notes[10].timerange = Timerange(Timestamp(1, 1, 1), Timestamp(2, 1, 1))
+        lazy.notes[12].description = Description("Edited lazily")
+        lazy.save()
+    finally:
+        lazy.close()
+    loaded = load_project(project.path)
+    assert loaded.notes[10].timerange.end.year == 1 and loaded.notes[12].description.text == "Edited lazily"
+
+    # A save cancels a running compaction instead of waiting for it; the file is left intact
+    compaction = Compaction(project.path)
+    compaction.start()
+    project._compaction = compaction
+    project.notes[4].location = Location(41, 41, 0)
+    project.save()
+    assert compaction.cancelled and not compaction.is_alive()
+    assert load_project(project.path).notes[4].location.x == 41
+
+def test_note_flat_records(tmp_path):
+    from application.core.storage import ProjectStore
+
+    project = _sample_project(str(tmp_path / "roshar.legends"))
+    root = project.notes[0]
+    # A chain far deeper than the recursion limit
+    deepest = root
+    for i in range(100, 100 + sys.getrecursionlimit() * 2):
+        child = Note(i, None, None, None, None)
+        project.add_note(child, parent=deepest)
+        deepest = child
+
+    records = root.subtree_to_dicts()
+    assert all(isinstance(child_id, int) for record in records for child_id in record["children"])
+    registry = {}
+    # Records name their tags by id, resolved through the project's registry
+    roots = Note.from_dicts(reversed(records), registry, project.tags)
+    assert [note.id for note in roots] == [0]
+    assert registry[deepest.id].parent.id == deepest.parent.id
+    assert [child.id for child in registry[1].children] == [4, 5, 6]
+    assert Note.deserialize(root.serialize()).to_dict() == root.to_dict()
+
+    subtree = Note.load_subtree(records, 2, tags=project.tags)
+    assert subtree.parent is None
+    assert sorted(note.id for note in subtree.iter_subtree()) == [2, 7, 8, 9, 22, 23, 24, 25, 26, 27, 28, 29]
+
+    # Files written before flat records nested children inside their parents
+    nested = {"id": 1, "children": [{"id": 2, "children": [{"id": 3}]}, {"id": 4}]}
+    legacy = Note.from_dicts([nested])[0]
+    assert [child.id for child in legacy.children] == [2, 4]
+    assert legacy.children[0].children[0].parent.id == 2
+
+    project.save()
+    with ProjectStore(project.path) as store:
+        loaded = store.read_subtree(1)
+    assert loaded.parent is None
+    assert [note.to_dict() for note in loaded.iter_subtree()][1:] == [note.to_dict() for note in project.notes[1].iter_subtree()][1:]
+
+def test_project_lazy_notes(tmp_path):
+    from application.core import load_project
+    from application.core.note_store import NoteStore
+    from application.core.storage import PAGE_SIZE
+
+    project = _sample_project(str(tmp_path / "roshar.legends"))
+    for i in range(30, 3 * PAGE_SIZE):
+        timerange = Timerange(Timestamp(1, 1, i), Timestamp(1, 1, i + 1))
+        project.add_note(Note(i, Location(i, 0, 0), timerange, Description(f"Filler {i} " * 20), None),
+                         parent=project.notes[i % 30])
+    project.save()
+
+    lazy = load_project(project.path, lazy=True)
+    try:
+        assert isinstance(lazy.notes, NoteStore)
+        assert lazy.notes.loaded_pages() == []
+        assert lazy.notes[40].location.x == 40 and lazy.notes[40].parent.id == 10
+        assert lazy.notes.loaded_pages() == []
+
+        lazy.notes.max_bytes = 1
+        lazy.notes[2 * PAGE_SIZE].description = Description("Edited")
+        assert lazy.notes[5].attached_images[0].image_path == "maps/shattered_plains.jpg"
+        # The page holding the edited note is pinned; the last page read stays loaded
+        assert lazy.notes.loaded_pages() == [2, 0]
+        assert lazy.notes[PAGE_SIZE].description.text.startswith("Filler")
+        assert lazy.notes.loaded_pages() == [2, 1]
+        assert not lazy.notes[5].is_loaded()
+
+        assert [child.id for child in lazy.notes[1].children] == [c.id for c in project.notes[1].children]
+        lazy.save()
+        # Once saved, nothing is pinned and every page can be evicted
+        assert lazy.notes.loaded_pages() == []
+        assert lazy.notes[2 * PAGE_SIZE].description.text == "Edited"
+
+        # Reading a loaded note makes its page the most recently used; the coldest page goes first
+        lazy.notes.max_bytes = float("inf")
+        lazy.notes[0].description, lazy.notes[PAGE_SIZE].description
+        sizes = lazy.notes.current_bytes
+        lazy.notes.trim()
+        assert lazy.notes.loaded_pages() == [2, 0, 1]
+        lazy.notes[2 * PAGE_SIZE + 1].tags
+        assert lazy.notes.loaded_pages() == [0, 1, 2]
+        lazy.notes.max_bytes = sizes - 1
+        lazy.notes.trim()
+        assert lazy.notes.loaded_pages() == [1, 2]
+    finally:
+        lazy.close()
+
+    project.notes[2 * PAGE_SIZE].description = Description("Edited")
+    _assert_same_project(load_project(project.path), project)
+
+def test_project_search(tmp_path):
+    from application.core import load_project
+    from application.core.note import Tag
+
+    project = _sample_project(str(tmp_path / "roshar.legends"))
+    project.notes[4].description = Description("# Urithiru\n\nThe *tower* city of the [Radiants](radiants.md).")
+    project.notes[7].description = Description("A towering highstorm over the Shattered Plains.")
+    project.notes[9].description = Description("Tower, tower, tower! The tower of Urithiru.")
+    project.mark_dirty(project.notes[4], project.notes[7], project.notes[9])
+
+    assert [note.id for note in project.search("tower", prefix=False)] == [9, 4]
+    assert [note.id for note in project.search("tow")] == [9, 7, 4]
+    assert [note.id for note in project.search("tower urith")] == [9, 4]
+    assert [note.id for note in project.search("radiants", prefix=False)] == [4]
+    assert project.search("tow", tags=[1]) == [project.notes[9]]
+    # Tag names are indexed alongside the text
+    assert {note.id for note in project.search("city", limit=None)} == set(range(0, 30, 3)) | {4}
+    assert {note.id for note in project.search("", tags=[1], limit=None)} == set(range(0, 30, 3))
+    # A short prefix keeps the terms found in the most notes, not the alphabetically first
+    project.add_note(Note(500, None, None, Description(" ".join(f"ta{i:03}" for i in range(100))), None))
+    assert len(project.search_index().expand_prefix("t")) == 64
+    assert {9, 4} <= {note.id for note in project.search("t", limit=None)}
+    assert len(project.search_index().expand_prefix("t", None)) > 100
+    project.remove_note(500)
+
+    project.save()
+    project.notes[9].description = Description("Nothing left here")
+    project.mark_dirty(project.notes[9])
+    project.save()
+
+    # A project edited and saved without loading the index catches it up on next use
+    project.notes[4].tags.append(Tag(2, "Spren", 0))
+    project.mark_dirty(project.notes[4])
+    project._search_index = None
+    project.save()
+    assert project.search("spren") == [project.notes[4]]
+
+    loaded = load_project(project.path)
+    assert [note.id for note in loaded.search("tower")] == [7, 4]
+    assert loaded.search("spren") == [loaded.notes[4]]
+    assert loaded._search_index_saved
+
+def test_description_render_cache():
+    from rich.console import Console
+    from rich.markdown import Markdown
+    from application.utils.markdown import render_cache, split_blocks
+
+    def rendered(renderable):
+        console = Console(width=60, record=True, color_system=None, file=open(os.devnull, "w"))
+        console.print(renderable)
+        return console.export_text()
+
+    text = ("# Kholinar\n\nCapital of *Alethkar*.\n\n- Palace\n- Wall\n\n- Windrunner\n  statue\n\n"
+            "```\nstorm = 1\n\ncalm = 0\n```\n\n> Life before death.\n\n| a | b |\n|---|---|\n| 1 | 2 |\n\nThe end.")
+    description = Description(text)
+    render_cache.clear()
+    assert rendered(description.render()) == rendered(Markdown(text))
+    assert description.render() is description.render()
+
+    # Editing one paragraph only parses that paragraph again
+    misses = render_cache.misses
+    description.text = text.replace("Capital", "Seat")
+    assert rendered(description.render()) == rendered(Markdown(description.text))
+    assert render_cache.misses == misses + 2  # The document and the changed block
+
+    assert description.summary() == "Seat of Alethkar."
+
+    # HTML blocks run to their closing marker, across blank lines
+    html = ("Before.\n\n<!--\nhidden\n\nstill hidden\n-->\n\n<pre>\nsky\n\n  ward\n</pre>\n\n"
+            "```\n<!--\n```\n\nAfter.")
+    assert [block.split("\n")[0] for block in split_blocks(html)] == ["Before.", "<!--", "<pre>", "```", "After."]
+    assert rendered(Description(html).render()) == rendered(Markdown(html))
+    assert "still hidden" not in rendered(Description(html).render())
+    assert Description("word " * 100).summary(22) == "word word word word…"
+
+def test_project_spatio_temporal_query():
+    from application.core.note import Tag
+
+    project = _sample_project()
+    # Notes i sit at (i, -i) and run from year 100 + i to 200 + i
+    def ids(query):
+        return sorted(note.id for note in query)
+
+    in_box = project.query(box=(10, -20, 20, -10))
+    assert ids(in_box) == list(range(10, 21))
+    during = project.query(start=Timestamp(1, 1, 225), end=Timestamp(1, 1, 300))
+    assert during.plan() == "time" and ids(during) == list(range(25, 30))
+
+    both = project.query(box=(0, -29, 29, 0), start=Timestamp(1, 1, 225), end=Timestamp(1, 1, 300))
+    assert both.plan() == "time" and ids(both) == list(range(25, 30))
+    narrow = project.query(center=Location(12, -12, 0.5), radius=1.5, start=Timestamp(1, 1, 0))
+    assert narrow.plan() == "space" and ids(narrow) == [11, 12, 13]
+    assert ids(project.query(box=(0, -29, 29, 0), tags=[Tag(1, "city", 0)])) == list(range(0, 30, 3))
+
+    # Edits are picked up by the next query
+    project.notes[12].location = Location(500, 500, 0)
+    project.notes[13].timerange = Timerange(Timestamp(1, 1, 900), Timestamp(1, 1, 901))
+    project.mark_dirty(project.notes[12], project.notes[13])
+    project.remove_note(11)
+    assert ids(project.query(center=Location(12, -12, 0.5), radius=1.5, start=Timestamp(1, 1, 0),
+                             end=Timestamp(1, 1, 500))) == []
+
+    with pytest.raises(ValueError):
+        project.query(box=(0, 0, 1, 1), center=Location(0, 0, 0), radius=1)
+
+def test_indexes_follow_edits_across_saves(tmp_path):
+    project = _sample_project(str(tmp_path / "roshar.legends"))
+    project.save()
+    box = project.query(box=(0, -7, 7, 0))
+    assert sorted(note.id for note in box) == list(range(8))
+
+    # Saving clears the dirty sets, so the indexes must have caught up by then
+    project.notes[0].location = Location(400, 400, 0)
+    project.notes[3].timerange = Timerange(Timestamp(1, 1, 900), Timestamp(1, 1, 901))
+    project.mark_dirty(project.notes[0], project.notes[3])
+    project.remove_note(5)
+    project.save()
+    assert sorted(note.id for note in project.query(box=(0, -7, 7, 0))) == [1, 2, 3, 4, 6, 7]
+    assert [note.id for note in project.query(start=Timestamp(1, 1, 850))] == [3]
+
+def test_tag_registry_filters(tmp_path):
+    import random
+    from application.core import Project, has, tag_filter, load_project
+    from application.core.note import Tag
+    from application.core.settings import Settings, default_calendar
+
+    rng = random.Random(11)
+    tags = [Tag(i, f"tag{i}", i) for i in range(5)]
+    notes = {}
+    for i in range(300):
+        # Each note gets its own copies, which the registry folds into one Tag per id
+        picked = [Tag(tag.id, tag.name, tag.color) for tag in tags if rng.random() < 0.4]
+        notes[i] = Note(i, None, None, None, None, tags=picked)
+    project = Project(1, "Tagged", Settings(default_calendar()), {}, notes)
+    assert len(project.tags) == 5
+    assert all(tag is project.tags[tag.id] for note in notes.values() for tag in note.tags)
+
+    def naive(predicate):
+        return sorted(note.id for note in project.notes.values() if predicate({tag.id for tag in note.tags}))
+
+    def matching(expression):
+        return sorted(note.id for note in project.filter_tags(expression))
+
+    assert matching(has(0) & has(1)) == naive(lambda ids: {0, 1} <= ids)
+    assert matching(has(2) | ~has(3)) == naive(lambda ids: 2 in ids or 3 not in ids)
+    assert matching(tag_filter(all_of=[4], any_of=[0, 1], none_of=[2])) == naive(
+        lambda ids: 4 in ids and ids & {0, 1} and 2 not in ids)
+    assert matching(has(99)) == []
+    # A filter class without evaluate fails when built, not when queried
+    from application.core.tags import TagFilter
+    with pytest.raises(TypeError):
+        type("Unfinished", (TagFilter,), {})()
+
+    # Edits and removals reach the index on its next use
+    project.notes[7].tags = [Tag(9, "new", 0)]
+    project.mark_dirty(project.notes[7])
+    project.remove_note(8)
+    assert matching(has(9)) == [7]
+    assert matching(~has(9)) == naive(lambda ids: 9 not in ids)
+    assert sorted(note.id for note in project.query(tags=[9])) == [7]
+
+    assert project.notes[7].to_dict(tag_ids=True)["tags"] == [9]
+    # Plain records carry whole tags, so they round trip without a registry
+    records = [project.notes[i].to_dict() for i in (7, 10, 11)]
+    restored = {}
+    Note.from_dicts(records, restored)
+    assert [tag.name for tag in restored[7].tags] == ["new"]
+    assert [note.to_dict() for note in restored.values()] == records
+    tags_of_10 = {tag.id: tag for tag in restored[10].tags}
+    assert all(tags_of_10[tag.id] is tag for tag in restored[11].tags if tag.id in tags_of_10)
+    copy = Project.deserialize(project.serialize())
+    assert copy.notes[7].tags[0] is copy.tags[9]
+    assert [tag.id for tag in copy.notes[10].tags] == [tag.id for tag in project.notes[10].tags]
+    assert Note.deserialize(project.notes[7].serialize()).tags[0].name == "new"
+
+    project.save(str(tmp_path / "tagged.legends"))
+    # Tag edits saved before the next filter still reach the bitmaps
+    project.notes[10].tags = [project.tags[9]]
+    project.mark_dirty(project.notes[10])
+    project.save()
+    assert matching(has(9)) == [7, 10]
+    loaded = load_project(project.path, lazy=True)
+    assert loaded.tags[9].name == "new" and loaded.notes[7].tags[0] is loaded.tags[9]
+    assert sorted(note.id for note in loaded.filter_tags(has(0) & has(1))) == naive(lambda ids: {0, 1} <= ids)
+    loaded.close()
+
+def test_timeline_histogram():
+    project = _sample_project()
+    histogram = project.timeline_histogram()
+    engine = histogram.engine
+    assert [level.name for level in histogram.levels] == ["Day", "Week", "Month", "Year", "Decade", "Century", "Millennium"]
+
+    # A level missing part of the interface fails when built, not partway through a query
+    from application.core.histogram import HistogramLevel
+
+    class Unfinished(HistogramLevel):
+        def start(self, bucket):
+            return bucket
+    with pytest.raises(TypeError):
+        Unfinished("Unfinished", engine, 1.0)
+
+    def naive(first, last):
+        return sum(1 for note in project.notes.values()
+                   if note.timerange.start.to_ticks() <= last and note.timerange.end.to_ticks() >= first)
+
+    for level in ("Week", "Month", "Year", "Decade", "Century"):
+        buckets = histogram.buckets(level, Timestamp(1, 1, 95), Timestamp(1, 1, 260))
+        ends = [first for first, _, _ in buckets[1:]] + [None]
+        for (first, density, top), following in zip(buckets, ends):
+            if following is not None:
+                assert density == naive(first, following - 1)
+            assert len(top) <= histogram.k
+    assert [count for _, count, _ in histogram.buckets("Century", Timestamp(1, 1, 0), Timestamp(1, 1, 299))] == [0, 30, 30]
+
+    # Notes starting in year 120 (only note 20), longest first
+    (year,) = histogram.buckets("Year", Timestamp(1, 1, 120), Timestamp(1, 1, 120))
+    assert year[2] == [20]
+    (decade,) = histogram.buckets("Decade", Timestamp(1, 1, 120), Timestamp(1, 1, 120), k=3)
+    assert decade[2] == [20, 21, 22]
+
+    # Moving and removing notes updates the buckets
+    project.notes[20].timerange = Timerange(Timestamp(1, 1, 500), Timestamp(1, 1, 501))
+    project.mark_dirty(project.notes[20])
+    project.remove_note(21)
+    histogram = project.timeline_histogram()
+    (year,) = histogram.buckets("Year", Timestamp(1, 1, 120), Timestamp(1, 1, 120))
+    assert year[2] == [] and year[1] == naive(year[0], year[0] + engine.days_in_year(120) - 1)
+    (year,) = histogram.buckets("Year", Timestamp(1, 1, 500), Timestamp(1, 1, 500))
+    assert year[1:] == (1, [20])
+    assert histogram.level_for(Timestamp(1, 1, 0), Timestamp(1, 1, 2000), 100).name == "Century"
+
+def test_timeline_histogram_across_saves(tmp_path):
+    project = _sample_project(str(tmp_path / "roshar.legends"))
+    histogram = project.timeline_histogram()
+    project.save()
+    project.notes[20].timerange = Timerange(Timestamp(1, 1, 500), Timestamp(1, 1, 501))
+    project.mark_dirty(project.notes[20])
+    project.remove_note(22)
+    # An autosave between the edit and the next look at the histogram
+    project.save()
+    assert project.timeline_histogram() is histogram
+    (year,) = histogram.buckets("Year", Timestamp(1, 1, 500), Timestamp(1, 1, 500))
+    assert year[1:] == (1, [20])
+    (decade,) = histogram.buckets("Decade", Timestamp(1, 1, 120), Timestamp(1, 1, 120), k=3)
+    assert 20 not in decade[2] and 22 not in decade[2]
+
+def test_bulk_import(tmp_path):
+    from PIL import Image
+    from application.core import bulk_import
+
+    project = _sample_project()
+    project.spatial_index()
+    project.search_index()
+    for i in range(3):
+        Image.new("RGB", (20 + i, 10), (0, 0, 0)).save(tmp_path / f"scan{i}.png")
+
+    def record(id, **fields):
+        return dict({"id": id, "location": {"x": id, "y": 0, "z": 0}, "description": {"text": f"Imported {id}"}}, **fields)
+
+    records = [record(100 + i, thumbnail={"image_path": str(tmp_path / f"scan{i % 3}.png")}, children=[200 + i])
+               for i in range(6)]
+    records += [record(200 + i, parent_id=100 + i) for i in range(6)]
+    records += [
+        record(300, parent_id=4, tags=[{"id": 9, "name": "ruin", "color": 0}]),
+        record(301, attached_images=[{"image_path": str(tmp_path / "missing.png")}]),
+        record(5),
+        {"location": None},
+        # Malformed image records are reported like any other bad record
+        record(302, thumbnail={"width": 4}),
+        record(303, attached_images=["scan0.png"]),
+        record(304, thumbnail={"image_path": 7}),
+        "not a record",
+        # Fields are type checked, dates against the project calendar; children of a skipped
+        # record are skipped with it instead of moving up the hierarchy
+        record(305, location={"x": "far", "y": 0, "z": 0}, children=[306]),
+        record(306, parent_id=305),
+        record(307, parent_id=306),
+        record(308, timerange={"start": {"day": 60, "month": 1, "year": 0}, "end": {"day": 1, "month": 2, "year": 0}}),
+        record(309, description={"text": 5}, thumbnail={"image_path": str(tmp_path / "scan0.png")}),
+        record(310, parent_id=309, thumbnail={"image_path": str(tmp_path / "scan1.png")}),
+    ]
+    reports = []
+    report = bulk_import(project, records, batch_size=4, workers=2, progress=lambda progress: reports.append(progress.done))
+
+    assert reports == [5, 9, 13, 17, 21, 25, 26]
+    assert report.notes == 13 and report.images == 6
+    assert sorted(str(id) for id, _ in report.errors) == [
+        "301", "302", "303", "304", "305", "306", "307", "308", "309", "310", "5", "None", "None"]
+    errors = dict(report.errors)
+    assert errors[307] == "Parent note 305 was not imported." and errors[310] == "Parent note 309 was not imported."
+    assert not any(note_id in project.notes for note_id in range(305, 311))
+    assert project.notes[101].thumbnail.width == 21 and project.notes[201].parent is project.notes[101]
+    assert project.notes[300] in project.notes[4].children and project.notes[100].parent is None
+    assert 4 in project._dirty_notes
+    assert sorted(project.spatial_index().in_box(99.5, -1, 105.5, 1)) == list(range(100, 106))
+    assert [note.id for note in project.search("ruin")] == [300]
+
+def test_instrumentation(tmp_path):
+    import json
+    import pstats
+    from application.core.settings import Settings, default_calendar
+    from application.utils.instrumentation import instrumentation
+
+    project = _sample_project()
+    instrumentation.reset()
+    Settings.deserialize(project.settings.serialize())
+    assert instrumentation.operations == {}
+
+    instrumentation.enable(allocations=True)
+    try:
+        Settings.deserialize(project.settings.serialize())
+        Note.deserialize(project.notes[0].serialize())
+        with instrumentation.measure("walk"), instrumentation.measure("walk"):
+            pass
+    finally:
+        instrumentation.disable()
+    stats = instrumentation.stats()
+    assert stats["Note.from_dicts"]["count"] == 1 and stats["Note.from_dicts"]["callers"] == {"Note.deserialize": 1}
+    assert stats["Calendar.from_dict"]["callers"] == {"Settings.from_dict": 1}
+    # Only the outer of nested calls of one operation counts towards its total
+    walk = instrumentation.operations["walk"]
+    assert walk.count == 2 and walk.primitive == 1 and walk.callers["walk"][:2] == [1, 0]
+    assert stats["Note.deserialize"]["allocated"] > 0
+    assert stats["Note.deserialize"]["total"] >= stats["Note.from_dicts"]["total"]
+
+    instrumentation.export_json(tmp_path / "stats.json")
+    assert json.loads((tmp_path / "stats.json").read_text())["Note.subtree_to_dicts"]["callers"] == {"Note.serialize": 1}
+    instrumentation.export_pstats(tmp_path / "stats.prof")
+    profile = pstats.Stats(str(tmp_path / "stats.prof"))
+    assert profile.total_calls == sum(entry["count"] for entry in stats.values())
+    instrumentation.reset()
+
+def test_async_loader_priority_and_cancellation(tmp_path):
+    import asyncio
+    import threading
+    from PIL import Image
+    from application.utils.async_loader import AsyncLoader, PREFETCH, VISIBLE
+
+    Image.new("RGB", (8, 4)).save(tmp_path / "visible.png")
+
+    async def scenario():
+        loader = AsyncLoader(workers=1)
+        gate, order = threading.Event(), []
+        busy = loader.submit(gate.wait)
+        prefetch = [loader.submit(order.append, f"prefetch {i}", priority=PREFETCH, key=i) for i in range(3)]
+        visible = loader.submit(order.append, "visible", priority=VISIBLE)
+        # Asking again for a queued request moves it up and shares its future
+        assert loader.submit(order.append, "prefetch 2", priority=VISIBLE, key=2) is prefetch[2]
+        prefetch[1].cancel()
+        image = loader.fetch_image(str(tmp_path / "visible.png"), priority=VISIBLE)
+        assert len(loader) == 4
+        gate.set()
+        await asyncio.gather(busy, visible, prefetch[0], prefetch[2])
+        assert prefetch[1].cancelled() and order == ["visible", "prefetch 2", "prefetch 0"]
+        assert (await image).size == (8, 4)
+
+        gate.clear()
+        busy = loader.submit(gate.wait)
+        stale = [loader.submit(order.append, "stale", priority=PREFETCH) for _ in range(2)]
+        assert loader.cancel_pending(PREFETCH) == 2
+        gate.set()
+        await busy
+        assert all(future.cancelled() for future in stale) and "stale" not in order
+        loader.close()
+
+    asyncio.run(scenario())
+
+def test_async_loader_builds_pyramid_once(tmp_path):
+    import asyncio
+    from PIL import Image
+    from application.utils.async_loader import AsyncLoader
+    from application.utils.tiles import TilePyramid
+
+    Image.new("RGB", (600, 300), (1, 2, 3)).save(tmp_path / "map.png")
+    pyramid = TilePyramid(str(tmp_path / "map.png"), str(tmp_path / "tiles"))
+    builds = []
+    build = pyramid.build
+    pyramid.build = lambda: builds.append(build(workers=0))
+
+    async def scenario():
+        loader = AsyncLoader(workers=4)
+        fetches = [loader.fetch_tile(pyramid, 0, column, 0) for column in range(3)]
+        fetches.append(loader.fetch_tile(pyramid, 1, 0, 0))
+        # Dropping one tile leaves the shared build running for the rest
+        fetches[1].cancel()
+        tiles = await asyncio.gather(*fetches[:1], *fetches[2:])
+        assert [tile.size for tile in tiles] == [(256, 256), (88, 256), (256, 150)]
+        assert fetches[1].cancelled() and builds == [6 + 2 + 1]
+        loader.close()
+
+    asyncio.run(scenario())
+
+def test_progressive_project_load(tmp_path):
+    import asyncio
+    from application.core import Project, iter_project_load, load_project_async, save_project_async
+    from application.core.settings import Settings, default_calendar
+    from application.utils.async_loader import AsyncLoader
+
+    path = str(tmp_path / "big.legends")
+    notes = {}
+    for i in range(1500):
+        # Parents on later pages than some of their children
+        note_id = 1499 - i
+        timerange = Timerange(Timestamp(1, 1, i), Timestamp(1, 1, i + 1))
+        notes[note_id] = Note(note_id, Location(i, i, 0), timerange, Description(f"Note {note_id}"), None)
+        if i:
+            parent = notes[1499 - (i - 1) // 3]
+            notes[note_id].parent = parent
+            parent.children.append(notes[note_id])
+    project = Project(3, "Progressive", Settings(default_calendar()), {}, notes)
+
+    async def scenario():
+        loader = AsyncLoader(workers=2)
+        await save_project_async(project, path, loader=loader)
+        seen = []
+        async for partial, progress in iter_project_load(path, pages_per_batch=1, loader=loader):
+            seen.append((progress.pages_loaded, len(partial.notes), partial.path))
+            partial.spatial_index()
+        assert seen == [(0, 0, None), (1, 512, None), (2, 1024, None), (3, 1500, path)]
+        assert not partial.has_unsaved_changes()
+        assert len(partial.spatial_index().in_box(-1, -1, 2000, 2000)) == 1500
+        _assert_same_project(partial, project)
+        _assert_same_project(await load_project_async(path, loader=loader), project)
+
+        # Leaving early stops reading and leaves a project that cannot be saved over the file
+        async for partial, progress in iter_project_load(path, pages_per_batch=1):
+            if progress.pages_loaded == 1:
+                break
+        assert partial.path is None and len(partial.notes) == 512
+        loader.close()
+
+    asyncio.run(scenario())
+
+def test_model_imports_stay_light():
+    from benchmarks.bench_startup import STATEMENTS, measure
+
+    # Pillow, rich and numpy load on first use, not with the model types
+    assert measure(STATEMENTS["core model types"])["heavy"] == []
+    assert "numpy" in measure(STATEMENTS["project"])["heavy"]
+    # The async loader only needs Pillow once an image is actually decoded
+    assert "PIL" not in measure("from application.utils.async_loader import AsyncLoader")["heavy"]
+